@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+from django_q.signals import pre_execute
+
+log = logging.getLogger(__name__)
+
+REPLICA_DB_ALIAS = "replica"
+
+# Replay lag of a streaming replica, zero when it has replayed everything
+# it has received and NULL when the database is not a replica at all
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+_state = threading.local()
+
+_lag = {"checked_at": None, "lag": None}
+_lag_lock = threading.Lock()
+
+
+def _get_replica_lag():
+    try:
+        with connections[REPLICA_DB_ALIAS].cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError as exc:
+        log.warning(f"Replica lag check failed, reading from the primary: {exc}")
+        return float("inf")
+    return float(lag or 0)
+
+
+def is_replica_available():
+    """Whether the replica is configured and lags less than the allowed maximum
+
+    The lag is checked at most once per DATABASE_REPLICA_LAG_CHECK_INTERVAL
+    seconds per process.
+    """
+    if REPLICA_DB_ALIAS not in settings.DATABASES:
+        return False
+
+    now = time.monotonic()
+    with _lag_lock:
+        if _lag["checked_at"] is None or \
+                now - _lag["checked_at"] > settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            _lag["lag"] = _get_replica_lag()
+            _lag["checked_at"] = now
+            if _lag["lag"] > settings.DATABASE_REPLICA_MAX_LAG:
+                log.warning(f"Replica lags {_lag['lag']:.1f}s, reading from the primary")
+        lag = _lag["lag"]
+
+    return lag <= settings.DATABASE_REPLICA_MAX_LAG
+
+
+def reset_pinning():
+    _state.pinned = False
+
+
+class use_replica(ContextDecorator):
+    """Send the reads of the block or the decorated function to the replica
+
+    Reads stay on the primary if no replica is configured, if it lags too
+    much, inside transactions and after anything has been written during
+    the current request or task.
+    """
+
+    def __enter__(self):
+        _state.depth = getattr(_state, "depth", 0) + 1
+        return self
+
+    def __exit__(self, *exc):
+        _state.depth -= 1
+        return False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # An explicit alias keeps instances loaded from the replica from
+        # dragging related lookups there outside use_replica blocks
+        if not getattr(_state, "depth", 0) or getattr(_state, "pinned", False):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if not is_replica_available():
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Read your own writes for the rest of the request or task
+        _state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Start every request unpinned from the primary"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_pinning()
+        try:
+            return self.get_response(request)
+        finally:
+            reset_pinning()
+
+
+def _reset_pinning_for_task(sender, **kwargs):
+    reset_pinning()
+
+
+pre_execute.connect(_reset_pinning_for_task, dispatch_uid="kaavapino.db_router")
@@ -0,0 +1,275 @@
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import ContextDecorator, ExitStack
+
+import requests
+from django.conf import settings
+from django.db import connections
+from django_redis.client import DefaultClient, SentinelClient
+
+log = logging.getLogger(__name__)
+
+_state = threading.local()
+
+_MISSING = object()
+
+# Cache keys are grouped by their leading non-numeric part, e.g.
+# "attribute_data_filtered_12" and "projects.preview_cache:12:..."
+CACHE_NAMESPACE_RE = re.compile(r"[^:0-9]+")
+
+
+def get_profile():
+    """Profile of the request being handled by this thread, None outside requests"""
+    return getattr(_state, "profile", None)
+
+
+class Span:
+    """Timed block of a request, repeated child spans are aggregated by name"""
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        self.children = {}
+        self.started_at = None
+
+    def child(self, name):
+        if name not in self.children:
+            self.children[name] = Span(name, parent=self)
+        return self.children[name]
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "count": self.count,
+            "duration_ms": round(self.duration * 1000, 1),
+            "children": [child.as_dict() for child in self.children.values()],
+        }
+
+    def format_tree(self, depth=0):
+        lines = [
+            f"{'  ' * depth}{self.name}: {self.duration * 1000:.1f} ms"
+            + (f" ({self.count} calls)" if self.count > 1 else "")
+        ]
+        for child in sorted(self.children.values(), key=lambda span: -span.duration):
+            lines += child.format_tree(depth + 1)
+        return lines
+
+
+class RequestProfile:
+    def __init__(self):
+        self.root = Span("request")
+        self.root.count = 1
+        self.root.started_at = time.perf_counter()
+        self.current = self.root
+        self.query_count = 0
+        self.query_time = 0.0
+        self.cache = {}
+        self.http = {}
+
+    def finish(self):
+        self.root.duration = time.perf_counter() - self.root.started_at
+
+    def record_query(self, duration):
+        self.query_count += 1
+        self.query_time += duration
+
+    def record_cache(self, key, hit):
+        match = CACHE_NAMESPACE_RE.match(str(key))
+        namespace = match.group().rstrip("_.") if match else "other"
+        stats = self.cache.setdefault(namespace, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+
+    def record_http(self, service, duration):
+        stats = self.http.setdefault(service, {"count": 0, "duration": 0.0})
+        stats["count"] += 1
+        stats["duration"] += duration
+
+    def as_dict(self):
+        return {
+            "duration_ms": round(self.root.duration * 1000, 1),
+            "db": {
+                "queries": self.query_count,
+                "duration_ms": round(self.query_time * 1000, 1),
+            },
+            "cache": self.cache,
+            "http": {
+                service: {
+                    "count": stats["count"],
+                    "duration_ms": round(stats["duration"] * 1000, 1),
+                }
+                for service, stats in self.http.items()
+            },
+            "spans": self.root.as_dict()["children"],
+        }
+
+    def get_server_timing(self):
+        metrics = [
+            f"total;dur={self.root.duration * 1000:.1f}",
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.query_count} queries"',
+        ]
+        if self.cache:
+            hits = sum(stats["hits"] for stats in self.cache.values())
+            misses = sum(stats["misses"] for stats in self.cache.values())
+            metrics.append(f'cache;desc="{hits} hits, {misses} misses"')
+        for service, stats in self.http.items():
+            metrics.append(
+                f'http-{service};dur={stats["duration"] * 1000:.1f};desc="{stats["count"]} calls"'
+            )
+        for name, child in self.root.children.items():
+            metrics.append(f"{name};dur={child.duration * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+class span(ContextDecorator):
+    """Time the block or the decorated function as a named span of the request
+
+    Does nothing outside instrumented requests.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        profile = get_profile()
+        if profile is not None:
+            current = profile.current.child(self.name)
+            current.started_at = time.perf_counter()
+            profile.current = current
+        return self
+
+    def __exit__(self, *exc):
+        profile = get_profile()
+        if profile is not None and profile.current.name == self.name \
+                and profile.current.parent is not None:
+            current = profile.current
+            current.count += 1
+            current.duration += time.perf_counter() - current.started_at
+            profile.current = current.parent
+        return False
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile = get_profile()
+        if profile is not None:
+            profile.record_query(time.perf_counter() - start)
+
+
+class InstrumentedClientMixin:
+    """Counts django-redis cache hits and misses in the request profile"""
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, default=_MISSING, version=version, client=client)
+        profile = get_profile()
+        if profile is not None:
+            profile.record_cache(key, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version, client=client)
+        profile = get_profile()
+        if profile is not None:
+            for key in keys:
+                profile.record_cache(key, key in values)
+        return values
+
+
+class InstrumentedDefaultClient(InstrumentedClientMixin, DefaultClient):
+    pass
+
+
+class InstrumentedSentinelClient(InstrumentedClientMixin, SentinelClient):
+    pass
+
+
+def _get_http_service(url):
+    for service, base_url in (
+        ("kaavoitus_api", settings.KAAVOITUS_API_BASE_URL),
+        ("graph", settings.GRAPH_API_BASE_URL),
+        ("graph", settings.GRAPH_API_LOGIN_BASE_URL),
+        ("clamav", settings.CLAMAV_URL),
+    ):
+        if base_url and url.startswith(base_url):
+            return service
+    return "other"
+
+
+_original_send = requests.Session.send
+
+
+def _instrumented_send(session, request, **kwargs):
+    start = time.perf_counter()
+    try:
+        return _original_send(session, request, **kwargs)
+    finally:
+        profile = get_profile()
+        if profile is not None:
+            profile.record_http(_get_http_service(request.url), time.perf_counter() - start)
+
+
+def install_http_instrumentation():
+    """Record outbound requests library calls in the request profile"""
+    requests.Session.send = _instrumented_send
+
+
+class RequestInstrumentationMiddleware:
+    """Profile queries, cache use, outbound HTTP calls and spans of each request
+
+    The summary is sent as a Server-Timing header and logged as JSON.
+    Requests slower than REQUEST_SLOW_THRESHOLD seconds also log the span tree.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_http_instrumentation()
+
+    def __call__(self, request):
+        if not settings.REQUEST_INSTRUMENTATION:
+            return self.get_response(request)
+
+        profile = _state.profile = RequestProfile()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_query_wrapper))
+                response = self.get_response(request)
+        finally:
+            _state.profile = None
+            profile.finish()
+
+        response["Server-Timing"] = profile.get_server_timing()
+        self._log(request, response, profile)
+        return response
+
+    def process_template_response(self, request, response):
+        # Rendering happens after the view returns, time it as its own span
+        render_span = span("render")
+        render_span.__enter__()
+        response.add_post_render_callback(lambda response: render_span.__exit__())
+        return response
+
+    @staticmethod
+    def _log(request, response, profile):
+        summary = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            **profile.as_dict(),
+        }
+        log.info(f"Request profile {json.dumps(summary)}")
+
+        if profile.root.duration > settings.REQUEST_SLOW_THRESHOLD:
+            log.warning(
+                f"Slow request {request.method} {request.path} "
+                f"({profile.root.duration:.2f}s, {profile.query_count} queries):\n"
+                + "\n".join(profile.root.format_tree())
+            )
@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from kaavapino.task_queues import get_queue_metrics
+
+
+class Command(BaseCommand):
+    help = "Print queued task counts and recent wait times of the task queues"
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(get_queue_metrics(), indent=2))
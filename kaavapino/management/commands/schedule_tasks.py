@@ -3,6 +3,8 @@ import logging
 from django.core.management.base import BaseCommand
 from django_q.models import Schedule
 
+from kaavapino.task_queues import get_cluster_name, get_queue
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,9 +59,17 @@ class Command(BaseCommand):
                     "schedule_type": Schedule.CRON,
                     "cron": "0 6,12 * * *"
                 }
+            },
+            {
+                "func": "users.tasks.sync_personnel",
+                "defaults": {
+                    "schedule_type": Schedule.MINUTES,
+                    "minutes": 30,
+                }
             }
         ]
         for schedule in schedules:
+            schedule["defaults"]["cluster"] = get_cluster_name(get_queue(schedule["func"]))
             if options.get("overwrite"):
                 _, created = Schedule.objects.update_or_create(
                     func=schedule.get("func"),
@@ -0,0 +1,104 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django_q.models import OrmQ
+from django_q.signals import pre_execute
+from django_q.tasks import async_task
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Queue of each task function, functions missing from here go to the batch queue
+TASK_QUEUES = {
+    "projects.exporting.document.render_template": INTERACTIVE,
+    "projects.exporting.report.render_report_to_response": INTERACTIVE,
+    "projects.profiling.run_profiled": INTERACTIVE,
+    "projects.tasks.refresh_on_map_overview_cache": BATCH,
+    "projects.tasks.refresh_project_schedule_cache": BATCH,
+    "projects.tasks.cache_report_data": BATCH,
+    "projects.tasks.cache_queued_project_report_data": BATCH,
+    "projects.tasks.cache_kaavoitus_api_data": BATCH,
+    "projects.tasks.check_archived_projects": BATCH,
+    "projects.tasks.cache_attribute_data_filtered": BATCH,
+    "projects.tasks.refresh_project_type_schema_blobs": BATCH,
+    "sitecontent.admin.activate_excel": BATCH,
+    "users.tasks.sync_personnel": BATCH,
+}
+
+ENQUEUED_AT_TIMEOUT = 60 * 60 * 24
+# Wait times kept per queue for the metrics
+WAIT_SAMPLES = 100
+
+
+def get_func_path(func):
+    return func if isinstance(func, str) else f"{func.__module__}.{func.__name__}"
+
+
+def get_queue(func):
+    return TASK_QUEUES.get(get_func_path(func), BATCH)
+
+
+def get_cluster_name(queue):
+    """Name of the django-q cluster, and its broker queue, serving the queue"""
+    return settings.Q_QUEUE_CLUSTERS[queue]
+
+
+def _get_enqueued_at_key(task_id):
+    return f"kaavapino.task_queues.enqueued_at:{task_id}"
+
+
+def _get_waits_key(queue):
+    return f"kaavapino.task_queues.waits:{queue}"
+
+
+def enqueue(func, *args, queue=None, **kwargs):
+    """async_task on the queue of func, or the given queue
+
+    Returns the id of the task.
+    """
+    queue = queue or get_queue(func)
+    kwargs.setdefault("task_name", get_func_path(func).rsplit(".", 1)[-1])
+    task_id = async_task(func, *args, cluster=get_cluster_name(queue), **kwargs)
+    cache.set(_get_enqueued_at_key(task_id), (queue, time.time()), ENQUEUED_AT_TIMEOUT)
+    return task_id
+
+
+def _record_wait(sender, task, **kwargs):
+    """Log how long a task enqueued with enqueue() waited for a worker"""
+    key = _get_enqueued_at_key(task.get("id"))
+    enqueued = cache.get(key)
+    if enqueued is None:
+        # Scheduled task or enqueued without enqueue()
+        return
+    cache.delete(key)
+
+    queue, enqueued_at = enqueued
+    wait = time.time() - enqueued_at
+    waits_key = _get_waits_key(queue)
+    waits = cache.get(waits_key, [])
+    cache.set(waits_key, (waits + [wait])[-WAIT_SAMPLES:], None)
+    log.info(f"Task {task.get('name')} waited {wait:.1f}s in the {queue} queue")
+
+
+pre_execute.connect(_record_wait, dispatch_uid="kaavapino.task_queues")
+
+
+def get_queue_metrics():
+    """Queued task count and recent wait times in seconds per queue"""
+    metrics = {}
+    for queue in settings.Q_QUEUE_CLUSTERS:
+        waits = cache.get(_get_waits_key(queue), [])
+        metrics[queue] = {
+            "cluster": get_cluster_name(queue),
+            "depth": OrmQ.objects.filter(key=get_cluster_name(queue)).count(),
+            "wait": {
+                "samples": len(waits),
+                "avg": round(sum(waits) / len(waits), 1) if waits else None,
+                "max": round(max(waits), 1) if waits else None,
+            },
+        }
+    return metrics
@@ -74,6 +74,11 @@ urlpatterns = [
         project_views.DocumentTemplateDownloadView.as_view(),
         name="serve_private_document_template_file",
     ),
+    re_path(
+        r"{}profiles/(?P<path>.*)$".format(MEDIA_URL),
+        project_views.ProfileDownloadView.as_view(),
+        name="serve_private_profile_file",
+    ),
     # OpenAPI 3 documentation with Swagger UI:
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     # Optional UI:
@@ -5,8 +5,8 @@ from django.contrib import admin, messages
 from django.contrib.gis.admin import OSMGeoAdmin
 from django.db import transaction
 from django.utils import timezone
+from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
-from django.core.cache import cache
 
 from projects.models import (
     ProjectComment,
@@ -34,10 +34,12 @@ from projects.models.project import (
     ProjectSubtype,
     ProjectDeadline,
 )
+from .cache_namespaces import DATETYPES, clear_namespace
 from .exporting import get_document_response
 from .models import (
     Attribute,
     AttributeLock,
+    CapturedProfile,
     AttributeValueChoice,
     AttributeAutoValue,
     AttributeAutoValueMapping,
@@ -149,10 +151,7 @@ class DateTypeAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         if 'forced_dates' in form.changed_data:  # Delete cached lautakunnan_kokouspäivät dates
-            cache_keys = cache.keys("*")
-            keys_to_delete = list(filter(lambda k: k.startswith(f"datetype_{obj.identifier}_dates_"), cache_keys))
-            keys_to_delete.append("serialized_date_types")
-            cache.delete_many(keys_to_delete)
+            clear_namespace(DATETYPES)
 
 
 class ProjectPhaseDeadlineSectionAttributeInline(SortableInlineAdminMixin, admin.TabularInline):
@@ -217,6 +216,42 @@ class AttributeLockAdmin(admin.ModelAdmin):
     ]
 
 
+@admin.register(CapturedProfile)
+class CapturedProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        "created_at",
+        "kind",
+        "name",
+        "user",
+        "duration",
+        "query_count",
+        "download",
+    )
+    list_filter = ("kind",)
+    search_fields = ("name",)
+    readonly_fields = list_display
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def download(self, obj):
+        return format_html('<a href="{}">{}</a>', obj.file.url, _("Download"))
+
+    download.short_description = _("profile")
+
+    def delete_model(self, request, obj):
+        obj.file.delete(save=False)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for profile in queryset:
+            profile.file.delete(save=False)
+        super().delete_queryset(request, queryset)
+
+
 def build_create_document_action(template):
     def create_document(modeladmin, request, queryset):
         if queryset.count() > 1:
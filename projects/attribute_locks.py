@@ -0,0 +1,249 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+log = logging.getLogger(__name__)
+
+# Lease keys:
+#   attribute_lock:<project>:<field>       lease value, expires with PX
+#   attribute_lock_user:<project>:<user>   key of the lease currently held by the user
+#   attribute_lock_index:<project>         zset of lease keys scored by expiry (ms)
+
+ACQUIRE_SCRIPT = """
+local acquired = redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2])
+if not acquired then
+    local current = redis.call('GET', KEYS[1])
+    if current and cjson.decode(current)['user_id'] ~= ARGV[3] then
+        return {0, current}
+    end
+    -- Renew the user's own lease
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+end
+
+-- A user holds at most one lease per project
+local previous = redis.call('GET', KEYS[2])
+if previous and previous ~= KEYS[1] then
+    local previous_value = redis.call('GET', previous)
+    if previous_value and cjson.decode(previous_value)['user_id'] == ARGV[3] then
+        redis.call('DEL', previous)
+        redis.call('ZREM', KEYS[3], previous)
+    end
+end
+
+redis.call('SET', KEYS[2], KEYS[1], 'PX', ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[4], KEYS[1])
+redis.call('PEXPIRE', KEYS[3], ARGV[2])
+if acquired then
+    return {1, ARGV[1]}
+end
+return {2, ARGV[1]}
+"""
+
+RELEASE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    redis.call('ZREM', KEYS[3], KEYS[1])
+    return 1
+end
+if ARGV[2] ~= '1' and cjson.decode(current)['user_id'] ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], KEYS[1])
+if redis.call('GET', KEYS[2]) == KEYS[1] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+RELEASE_USER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+if not current then
+    return 0
+end
+local value = redis.call('GET', current)
+if value and cjson.decode(value)['user_id'] == ARGV[1] then
+    redis.call('DEL', current)
+    redis.call('ZREM', KEYS[2], current)
+    return 1
+end
+return 0
+"""
+
+LIST_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local keys = redis.call('ZRANGE', KEYS[1], 0, -1)
+if #keys == 0 then
+    return {}
+end
+return redis.call('MGET', unpack(keys))
+"""
+
+ACQUIRED = 1
+RENEWED = 2
+
+_scripts = {}
+
+
+def _get_script(name, lua):
+    if name not in _scripts:
+        _scripts[name] = get_redis_connection("default").register_script(lua)
+    return _scripts[name]
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _get_timeout_ms():
+    return settings.ATTRIBUTE_LOCK_TIMEOUT * 1000
+
+
+def _get_field_identifier(lock_data):
+    if lock_data.get("fieldset_attribute_identifier"):
+        return f'{lock_data["fieldset_attribute_identifier"]}' \
+               f'[{lock_data["fieldset_attribute_index"]}]'
+    return lock_data.get("attribute_identifier")
+
+
+def _get_keys(project_name, field_identifier, user):
+    return [
+        cache.make_key(f"attribute_lock:{project_name}:{field_identifier}"),
+        cache.make_key(f"attribute_lock_user:{project_name}:{user.uuid}"),
+        cache.make_key(f"attribute_lock_index:{project_name}"),
+    ]
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return json.loads(value)
+
+
+def acquire_lock(project_name, lock_data, user):
+    """Acquire or renew the user's lease on a field
+
+    Returns a (lease, status) tuple where status is ACQUIRED or RENEWED if
+    the user holds the lease, None if it is held by someone else in which
+    case the returned lease is the other user's.
+    """
+    field_identifier = _get_field_identifier(lock_data)
+    timeout = _get_timeout_ms()
+    lease = {
+        "project_name": project_name,
+        "attribute_identifier": lock_data.get("attribute_identifier"),
+        "fieldset_attribute_identifier": lock_data.get("fieldset_attribute_identifier"),
+        "fieldset_attribute_index": int(lock_data["fieldset_attribute_index"])
+            if lock_data.get("fieldset_attribute_index") is not None else None,
+        "field_identifier": field_identifier,
+        "user_id": str(user.uuid),
+        "user_name": f"{user.first_name} {user.last_name}",
+        "user_email": user.email,
+        "timestamp": timezone.now().isoformat(),
+    }
+    result, value = _get_script("acquire", ACQUIRE_SCRIPT)(
+        keys=_get_keys(project_name, field_identifier, user),
+        args=[
+            json.dumps(lease),
+            timeout,
+            str(user.uuid),
+            _now_ms() + timeout,
+        ],
+    )
+    lease = _decode(value)
+
+    if result == ACQUIRED and settings.ATTRIBUTE_LOCK_AUDIT:
+        _audit_acquire(lease, user)
+
+    return lease, result if result in (ACQUIRED, RENEWED) else None
+
+
+def get_lock(project_name, lock_data):
+    value = get_redis_connection("default").get(
+        cache.make_key(f"attribute_lock:{project_name}:{_get_field_identifier(lock_data)}")
+    )
+    return _decode(value) if value else None
+
+
+def release_lock(project_name, lock_data, user, force=False):
+    """Release the user's lease, force releases leases of other users too"""
+    field_identifier = _get_field_identifier(lock_data)
+    released = _get_script("release", RELEASE_SCRIPT)(
+        keys=_get_keys(project_name, field_identifier, user),
+        args=[str(user.uuid), "1" if force else "0"],
+    )
+
+    if released and settings.ATTRIBUTE_LOCK_AUDIT:
+        _audit_release(project_name, lock_data)
+
+    return bool(released)
+
+
+def release_user_locks(project_name, user):
+    __, user_key, index_key = _get_keys(project_name, "", user)
+    released = _get_script("release_user", RELEASE_USER_SCRIPT)(
+        keys=[user_key, index_key],
+        args=[str(user.uuid)],
+    )
+
+    if settings.ATTRIBUTE_LOCK_AUDIT:
+        from projects.models import AttributeLock
+        AttributeLock.objects.filter(project__name=project_name, user=user).delete()
+
+    return bool(released)
+
+
+def get_project_locks(project_name):
+    """All active leases of a project"""
+    values = _get_script("list", LIST_SCRIPT)(
+        keys=[cache.make_key(f"attribute_lock_index:{project_name}")],
+        args=[_now_ms()],
+    )
+    return [_decode(value) for value in values if value]
+
+
+def _audit_acquire(lease, user):
+    from projects.models import Attribute, AttributeLock, Project
+
+    try:
+        project = Project.objects.get(name=lease["project_name"])
+        attribute = Attribute.objects.filter(
+            identifier=lease["attribute_identifier"]
+        ).first() if lease["attribute_identifier"] else None
+        fieldset_attribute = Attribute.objects.filter(
+            identifier=lease["fieldset_attribute_identifier"]
+        ).first() if lease["fieldset_attribute_identifier"] else None
+        AttributeLock.objects.update_or_create(
+            project=project,
+            attribute=attribute,
+            fieldset_attribute=fieldset_attribute,
+            fieldset_attribute_index=lease["fieldset_attribute_index"],
+            defaults={"user": user},
+        )
+    except Exception as exc:
+        log.error(f"Failed to write attribute lock audit entry: {exc}")
+
+
+def _audit_release(project_name, lock_data):
+    from projects.models import AttributeLock
+
+    try:
+        if lock_data.get("attribute_identifier"):
+            AttributeLock.objects.filter(
+                project__name=project_name,
+                attribute__identifier=lock_data.get("attribute_identifier"),
+            ).delete()
+        else:
+            AttributeLock.objects.filter(
+                project__name=project_name,
+                fieldset_attribute__identifier=lock_data.get("fieldset_attribute_identifier"),
+                fieldset_attribute_index=lock_data.get("fieldset_attribute_index"),
+            ).delete()
+    except Exception as exc:
+        log.error(f"Failed to remove attribute lock audit entry: {exc}")
@@ -0,0 +1,289 @@
+import datetime
+import logging
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from projects.exporting.document import render_template
+from projects.exporting.report import render_report_to_response
+from projects.models import (
+    Attribute,
+    DocumentTemplate,
+    FieldSetAttribute,
+    Project,
+    ProjectSubtype,
+    Report,
+)
+from users.models import GroupPrivilege
+
+log = logging.getLogger(__name__)
+
+BENCHMARK_PROJECT_PREFIX = "Benchmark"
+
+# Maximum queries of a single call per hot path, exceeding one fails the run
+DEFAULT_QUERY_BUDGETS = {
+    "get_preview_deadlines": 150,
+    "update_deadlines": 600,
+    "project_list": 60,
+    "project_detail": 150,
+    "render_report_to_response": 400,
+    "render_template": 300,
+    "project_save": 60,
+}
+
+# Generated values skip attributes filled in by the backend
+SKIPPED_VALUE_TYPES = (
+    Attribute.TYPE_GEOMETRY,
+    Attribute.TYPE_IMAGE,
+    Attribute.TYPE_FILE,
+    Attribute.TYPE_INFO_FIELDSET,
+)
+
+
+class SyntheticAttributeData:
+    """Generates attribute data for the attributes of a subtype's phase sections"""
+
+    FIELDSET_ENTRIES = 2
+
+    def __init__(self, subtype, user, rng):
+        self.user = user
+        self.rng = rng
+        self.attributes = list(
+            Attribute.objects.filter(
+                projectphasesectionattribute__section__phase__project_subtype=subtype,
+                generated=False,
+                static_property__isnull=True,
+                data_source__isnull=True,
+                ad_data_key__isnull=True,
+            ).exclude(
+                value_type__in=SKIPPED_VALUE_TYPES,
+            ).prefetch_related("value_choices").distinct()
+        )
+        self.children = {}
+        for link in FieldSetAttribute.objects.filter(
+            attribute_source__in=[
+                attr for attr in self.attributes
+                if attr.value_type == Attribute.TYPE_FIELDSET
+            ],
+        ).select_related("attribute_target").prefetch_related(
+            "attribute_target__value_choices",
+        ):
+            self.children.setdefault(link.attribute_source_id, []).append(
+                link.attribute_target
+            )
+
+    def _value(self, attribute, index):
+        value_type = attribute.value_type
+        if value_type == Attribute.TYPE_FIELDSET:
+            return [
+                {
+                    child.identifier: self._value(child, index)
+                    for child in self.children.get(attribute.id, [])
+                    if child.value_type not in SKIPPED_VALUE_TYPES
+                    and child.value_type != Attribute.TYPE_FIELDSET
+                }
+                for __ in range(self.FIELDSET_ENTRIES)
+            ]
+        if value_type == Attribute.TYPE_CHOICE:
+            choices = [choice.identifier for choice in attribute.value_choices.all()]
+            if not choices:
+                return None
+            if attribute.multiple_choice:
+                return self.rng.sample(choices, min(2, len(choices)))
+            return self.rng.choice(choices)
+        if value_type == Attribute.TYPE_INTEGER:
+            return self.rng.randint(0, 100000)
+        if value_type == Attribute.TYPE_DECIMAL:
+            return str(round(self.rng.uniform(0, 100000), 2))
+        if value_type == Attribute.TYPE_BOOLEAN:
+            return self.rng.random() < 0.5
+        if value_type == Attribute.TYPE_DATE:
+            return (
+                datetime.date.today() + datetime.timedelta(days=self.rng.randint(-365, 365 * 3))
+            ).isoformat()
+        if value_type in (Attribute.TYPE_RICH_TEXT, Attribute.TYPE_RICH_TEXT_SHORT):
+            return {"ops": [{"insert": f"{attribute.name} {index}\n"}]}
+        if value_type == Attribute.TYPE_USER:
+            return str(self.user.uuid)
+        if value_type == Attribute.TYPE_LINK:
+            return f"https://example.com/{attribute.identifier}/{index}"
+        if value_type == Attribute.TYPE_PERSONNEL:
+            return None
+        return f"{attribute.name} {index}"
+
+    def generate(self, index):
+        data = {}
+        for attribute in self.attributes:
+            # Leave some fields empty like in real projects
+            if self.rng.random() < 0.2:
+                continue
+            value = self._value(attribute, index)
+            if value is not None:
+                data[attribute.identifier] = value
+        return data
+
+
+def get_benchmark_user():
+    """Admin user the benchmark runs as"""
+    user, created = get_user_model().objects.get_or_create(
+        username="benchmark",
+        defaults={
+            "first_name": "Benchmark",
+            "last_name": "User",
+            "email": "benchmark@example.com",
+        },
+    )
+    if created:
+        group, __ = Group.objects.get_or_create(name="Benchmark admins")
+        GroupPrivilege.objects.get_or_create(
+            group=group, defaults={"privilege_level": "admin"},
+        )
+        user.additional_groups.add(group)
+    return user
+
+
+def generate_projects(count, user, seed=0, stdout=None):
+    """Create count projects spread evenly over subtypes, with full schedules"""
+    rng = random.Random(seed)
+    subtypes = list(ProjectSubtype.objects.prefetch_related("phases"))
+    if not subtypes:
+        raise ValueError("No project subtypes, import the schema first")
+
+    generators = {
+        subtype.pk: SyntheticAttributeData(subtype, user, rng) for subtype in subtypes
+    }
+    projects = []
+    try:
+        for index in range(count):
+            subtype = subtypes[index % len(subtypes)]
+            phase = min(subtype.phases.all(), key=lambda phase: phase.index)
+            project = Project(
+                user=user,
+                name=f"{BENCHMARK_PROJECT_PREFIX} {index}",
+                identifier=f"benchmark_{index}",
+                subtype=subtype,
+                phase=phase,
+                public=rng.random() < 0.9,
+                attribute_data=generators[subtype.pk].generate(index),
+            )
+            with transaction.atomic():
+                project.save()
+                project.update_deadlines(user=user, initial=True)
+                project.save()
+            projects.append(project)
+
+            if stdout and (index + 1) % 100 == 0:
+                stdout.write(f"Generated {index + 1}/{count} projects")
+    except BaseException:
+        delete_projects(projects)
+        raise
+
+    return projects
+
+
+def delete_projects(projects):
+    """Delete generated projects with their schedules and other related rows"""
+    Project.objects.filter(pk__in=[project.pk for project in projects]).delete()
+
+
+def measure(func, iterations):
+    """Run func iterations times, recording its wall time and query count"""
+    timings = []
+    query_counts = []
+    for __ in range(iterations):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        query_counts.append(len(queries))
+
+    return {
+        "iterations": iterations,
+        "time": {
+            "median": statistics.median(timings),
+            "max": max(timings),
+            "total": sum(timings),
+        },
+        "queries": {
+            "min": min(query_counts),
+            "max": max(query_counts),
+        },
+    }
+
+
+def get_hot_paths(projects, user):
+    """Callables of the measured hot paths keyed by name
+
+    Each callable takes the iteration number, paths without the data they
+    need (reports, document templates) are left out.
+    """
+    from projects.views import ProjectViewSet
+
+    factory = APIRequestFactory()
+    list_view = ProjectViewSet.as_view({"get": "list"})
+    detail_view = ProjectViewSet.as_view({"get": "retrieve"})
+    project_ids = [project.pk for project in projects]
+
+    def project(iteration):
+        return projects[iteration % len(projects)]
+
+    def get(view, path, **kwargs):
+        request = factory.get(path)
+        force_authenticate(request, user=user)
+        response = view(request, **kwargs)
+        response.render()
+        return response
+
+    paths = {
+        "get_preview_deadlines": lambda i: project(i).get_preview_deadlines(
+            project(i).attribute_data, project(i).subtype, [],
+        ),
+        "update_deadlines": lambda i: project(i).update_deadlines(user=user),
+        "project_list": lambda i: get(list_view, "/v1/projects/"),
+        "project_detail": lambda i: get(
+            detail_view, f"/v1/projects/{project(i).pk}/", pk=project(i).pk,
+        ),
+        "project_save": lambda i: project(i).save(),
+    }
+
+    report = Report.objects.filter(hidden=False).first()
+    if report:
+        paths["render_report_to_response"] = lambda i: render_report_to_response(
+            report, project_ids, HttpResponse(), report.previewable,
+        )
+
+    document_template = DocumentTemplate.objects.first()
+    if document_template:
+        paths["render_template"] = lambda i: render_template(
+            project(i), document_template, True,
+        )
+
+    return paths
+
+
+def run_benchmarks(projects, user, iterations, budgets=None, stdout=None):
+    """Measure the hot paths and check them against the query budgets"""
+    budgets = {**DEFAULT_QUERY_BUDGETS, **(budgets or {})}
+    results = {}
+    for name, path in get_hot_paths(projects, user).items():
+        counter = iter(range(iterations))
+        result = measure(lambda: path(next(counter)), iterations)
+        result["budget"] = budgets.get(name)
+        result["passed"] = result["budget"] is None \
+            or result["queries"]["max"] <= result["budget"]
+        results[name] = result
+
+        if stdout:
+            stdout.write(
+                f"{name}: {result['time']['median'] * 1000:.1f} ms median, "
+                f"{result['queries']['max']} queries (budget {result['budget']})"
+            )
+
+    return results
@@ -0,0 +1,154 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django_q.signals import pre_execute
+
+CACHE_NAMESPACE_PREFIX = "projects.cache_namespaces"
+
+PHASE_SCHEMA = "phase_schema"
+DEADLINE_SECTIONS = "deadline_sections"
+SECTION_FILTERS = "section_filters"
+SCHEDULES = "schedules"
+FLAT_DATA = "flat_data"
+FIELDSET_PATHS = "fieldset_paths"
+DEPENDENCIES = "dependencies"
+DATETYPES = "datetypes"
+# Document templates and automatic values shown in the project detail
+PROJECT_DETAIL = "project_detail"
+
+# Namespaces whose version is used as such, e.g. in ETags and tile keys
+# Schema data (attributes, sections, deadlines etc.)
+SCHEMA = "schema"
+# Project geometries and the project fields carried in the map tiles
+MAP_TILES = "map_tiles"
+# Deadline and project writes, scoped by project
+DEADLINE_STATE = "deadline_state"
+
+# Namespaces depending on schema data, cleared after an Excel import
+SCHEMA_NAMESPACES = (
+    PHASE_SCHEMA,
+    DEADLINE_SECTIONS,
+    SECTION_FILTERS,
+    SCHEDULES,
+    FLAT_DATA,
+    FIELDSET_PATHS,
+    DEPENDENCIES,
+)
+
+# Entries of cleared versions are never read again, this makes sure they
+# are evicted eventually when no shorter timeout is given
+NAMESPACE_TIMEOUT = 60 * 60 * 24 * 7  # 7 days
+
+
+def _get_version_key(namespace, scope=None):
+    if scope is None:
+        return f"{CACHE_NAMESPACE_PREFIX}.version:{namespace}"
+    return f"{CACHE_NAMESPACE_PREFIX}.version:{namespace}:{scope}"
+
+
+# Versions read during the current request or task, None outside them.
+# Clears made elsewhere meanwhile are seen by the next request or task.
+_state = threading.local()
+
+
+def _get_memo():
+    return getattr(_state, "versions", None)
+
+
+def start_version_memo():
+    _state.versions = {}
+
+
+def stop_version_memo():
+    _state.versions = None
+
+
+def get_namespace_version(namespace, scope=None):
+    """Version counter of the namespace, or of a scope such as a project within it"""
+    key = _get_version_key(namespace, scope)
+    memo = _get_memo()
+    if memo is not None and key in memo:
+        return memo[key]
+
+    version = cache.get(key)
+    if version is None:
+        # Start from a timestamp so that a flushed cache never reuses a version
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    if memo is not None:
+        memo[key] = version
+    return version
+
+
+def _get_namespace_versions(keys):
+    """Versions of the version keys, read with one get_many"""
+    memo = _get_memo()
+    versions = {key: memo[key] for key in keys if memo is not None and key in memo}
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        found = cache.get_many(missing)
+        if memo is not None:
+            memo.update(found)
+        versions.update(found)
+    return versions
+
+
+def clear_namespace(namespace, scope=None):
+    """Clear every key of the namespace, or of a scope within it, with one INCR
+
+    The old entries are left to expire by their timeout.
+    """
+    key = _get_version_key(namespace, scope)
+    memo = _get_memo()
+    if memo is not None:
+        memo.pop(key, None)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        get_namespace_version(namespace, scope)
+    else:
+        if memo is not None:
+            memo[key] = version
+
+
+def clear_namespaces(namespaces):
+    for namespace in namespaces:
+        clear_namespace(namespace)
+
+
+def get_cache_key(namespace, *parts, scope=None):
+    """Cache key of parts in the current version of the namespace and scope"""
+    keys = [(namespace, None)]
+    if scope is not None:
+        keys.append((namespace, scope))
+    found = _get_namespace_versions([_get_version_key(*key) for key in keys])
+
+    versions = []
+    for key_namespace, key_scope in keys:
+        version = found.get(_get_version_key(key_namespace, key_scope))
+        if version is None:
+            version = get_namespace_version(key_namespace, key_scope)
+        versions.append(str(version) if key_scope is None else f"{key_scope}.{version}")
+    return ":".join([namespace, "v" + ".".join(versions), *(str(part) for part in parts)])
+
+
+class NamespaceVersionMiddleware:
+    """Read each namespace version once per request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_version_memo()
+        try:
+            return self.get_response(request)
+        finally:
+            stop_version_memo()
+
+
+def _start_version_memo_for_task(sender, **kwargs):
+    start_version_memo()
+
+
+pre_execute.connect(_start_version_memo_for_task, dispatch_uid="projects.cache_namespaces")
@@ -0,0 +1,140 @@
+import logging
+from datetime import timedelta
+
+from actstream.models import Action as ActStreamAction
+from django.contrib.admin.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.utils import timezone
+
+from projects.models import Attribute, DataRetentionPlan, Project
+
+log = logging.getLogger(__name__)
+
+AUDIT_LOG_RETENTION_DAYS = 5 * 365
+AUDIT_LOG_DELETE_BATCH_SIZE = 5000
+
+UNIT_DAYS = {
+    DataRetentionPlan.UNIT_DAYS: 1,
+    DataRetentionPlan.UNIT_MONTHS: 30,
+    DataRetentionPlan.UNIT_YEARS: 365,
+}
+
+CLEAR_ATTRIBUTE_DATA_SQL = """
+UPDATE projects_project
+SET attribute_data = attribute_data || (
+    SELECT jsonb_object_agg(item.key, 'null'::jsonb)
+    FROM jsonb_each(attribute_data) AS item
+    WHERE item.key = ANY(%(identifiers)s)
+)
+WHERE archived AND archived_at <= %(cutoff)s
+AND EXISTS (
+    SELECT 1 FROM jsonb_each(attribute_data) AS item
+    WHERE item.key = ANY(%(identifiers)s) AND item.value <> 'null'::jsonb
+)
+RETURNING id
+"""
+
+BATCH_DELETE_SQL = """
+DELETE FROM {table} WHERE id IN (
+    SELECT id FROM {table}
+    WHERE {content_type_column} = %(content_type_id)s AND {object_id_column} = ANY(%(object_ids)s)
+    LIMIT %(batch_size)s
+)
+"""
+
+
+def get_retention_cutoff(data_retention_plan, now=None):
+    """Projects archived at or before the cutoff have outlived the plan"""
+    unit_days = UNIT_DAYS.get(data_retention_plan.custom_time_unit)
+    if unit_days is None or data_retention_plan.custom_time is None:
+        return None
+
+    # Matches the whole elapsed days of the plan being strictly exceeded
+    return (now or timezone.now()) - timedelta(
+        days=data_retention_plan.custom_time * unit_days + 1
+    )
+
+
+def clear_attribute_data_by_retention_plans(now=None):
+    """Null the attribute data of custom retention plans in archived projects
+
+    Runs one UPDATE per plan over every qualifying project and returns the ids
+    of the projects that had data cleared.
+    """
+    identifiers_by_plan = {}
+    for plan_id, identifier in Attribute.objects.filter(
+        data_retention_plan__plan_type=DataRetentionPlan.TYPE_CUSTOM,
+    ).values_list("data_retention_plan_id", "identifier"):
+        identifiers_by_plan.setdefault(plan_id, []).append(identifier)
+
+    updated_project_ids = set()
+    for data_retention_plan in DataRetentionPlan.objects.filter(
+        pk__in=identifiers_by_plan.keys(),
+    ):
+        cutoff = get_retention_cutoff(data_retention_plan, now)
+        if cutoff is None:
+            log.warning(
+                f"Data retention plan '{data_retention_plan}' has an invalid custom time "
+                f"'{data_retention_plan.custom_time} {data_retention_plan.custom_time_unit}'"
+            )
+            continue
+
+        with connection.cursor() as cursor:
+            cursor.execute(CLEAR_ATTRIBUTE_DATA_SQL, {
+                "identifiers": identifiers_by_plan[data_retention_plan.pk],
+                "cutoff": cutoff,
+            })
+            project_ids = [row[0] for row in cursor.fetchall()]
+
+        log.info(
+            f"Data retention plan '{data_retention_plan}' cleared data "
+            f"from {len(project_ids)} projects"
+        )
+        updated_project_ids.update(project_ids)
+
+    return updated_project_ids
+
+
+def _batch_delete(model, content_type_column, object_id_column, content_type_id, object_ids):
+    sql = BATCH_DELETE_SQL.format(
+        table=model._meta.db_table,
+        content_type_column=content_type_column,
+        object_id_column=object_id_column,
+    )
+    deleted = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(sql, {
+                "content_type_id": content_type_id,
+                "object_ids": object_ids,
+                "batch_size": AUDIT_LOG_DELETE_BATCH_SIZE,
+            })
+            deleted += cursor.rowcount
+            if cursor.rowcount < AUDIT_LOG_DELETE_BATCH_SIZE:
+                return deleted
+
+
+def clear_audit_log_data(now=None):
+    """Delete admin and activity stream log rows of long since archived projects
+
+    Rows are deleted in batches to keep the locks and WAL bursts short.
+    Returns a (admin log rows, activity stream rows) tuple.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=AUDIT_LOG_RETENTION_DAYS + 1)
+    object_ids = [
+        str(pk) for pk in Project.objects.filter(
+            archived=True, archived_at__lte=cutoff,
+        ).values_list("pk", flat=True)
+    ]
+    if not object_ids:
+        return 0, 0
+
+    content_type_id = ContentType.objects.get_for_model(Project).pk
+    return (
+        _batch_delete(LogEntry, "content_type_id", "object_id", content_type_id, object_ids),
+        _batch_delete(
+            ActStreamAction, "target_content_type_id", "target_object_id",
+            content_type_id, object_ids,
+        ),
+    )
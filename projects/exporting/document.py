@@ -447,14 +447,11 @@ def render_template(project, document_template, preview):
                 attribute_data_display[identifier + "__map"] = raw_to_display_mapped
 
     attribute_files = ProjectAttributeFile.objects \
-        .filter(project=project, archived_at=None, attribute__identifier__in=relevant_attributes.keys()) \
-        .order_by(
-            "fieldset_path_str",
-            "attribute__pk",
-            "project__pk",
-            "-created_at",
-        ) \
-        .distinct("fieldset_path_str", "attribute__pk", "project__pk")
+        .filter(project=project, attribute__identifier__in=relevant_attributes.keys()) \
+        .active() \
+        .select_related("attribute") \
+        .prefetch_related("fieldset_path_locations__parent_fieldset") \
+        .latest_per_attribute()
 
     for attribute_file in attribute_files:
         # only image formats supported by docx/pptx can be used
@@ -7,6 +7,7 @@ from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from openpyxl import Workbook
 
+from kaavapino.db_router import use_replica
 from projects.models import Attribute, Report, Project, Deadline
 from projects.helpers import (
     get_fieldset_path,
@@ -124,6 +125,7 @@ def _get_fieldset_children_display(items, attribute, column, offset=1):
 SPECIAL_COLUMN_NAME = "Selite"
 
 
+@use_replica()
 def render_report_to_response(
     report: Report, project_ids, response, preview=False, limit=None,
 ):
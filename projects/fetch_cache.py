@@ -0,0 +1,330 @@
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from django.core.cache import cache
+from django.db import connections
+
+from projects.cache_namespaces import clear_namespace, get_namespace_version
+
+log = logging.getLogger(__name__)
+
+FETCH_CACHE_PREFIX = "projects.fetch_cache"
+
+# Values are served stale for this long past their TTL while one worker refreshes them
+DEFAULT_STALE_TTL = 3600
+DEFAULT_ERROR_TTL = 900
+# TTLs are spread by this fraction so that entries cached together do not expire together
+TTL_JITTER = 0.1
+
+# Time a loader may take when neither fetch() nor the loader tells it
+DEFAULT_LOADER_TIMEOUT = 60
+# The lock outlives the loader timeout by this much, a loader holding it
+# longer is assumed dead. Requests missing a value wait as long for the
+# worker loading it.
+LOCK_MARGIN = 10
+LOCK_POLL_INTERVAL = 0.1
+
+REFRESH_WORKERS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+_refreshes = set()
+
+# Per process counts and load times by namespace
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+class FetchError(Exception):
+    """Raised by loaders when upstream has no usable value
+
+    The failure is cached for ttl seconds, or the error_ttl given to fetch().
+    """
+
+    def __init__(self, message, ttl=None):
+        super().__init__(message)
+        self.ttl = ttl
+
+
+def _get_key(namespace, key):
+    return f"{FETCH_CACHE_PREFIX}:{namespace}:{key}"
+
+
+def _get_lock_key(namespace, key):
+    return f"{FETCH_CACHE_PREFIX}.lock:{namespace}:{key}"
+
+
+def _jitter(ttl):
+    if ttl is None:
+        return None
+    return max(1, round(ttl * random.uniform(1 - TTL_JITTER, 1 + TTL_JITTER)))
+
+
+def _get_stats(namespace):
+    return _metrics.setdefault(namespace, {
+        "hits": 0,
+        "stale_hits": 0,
+        "misses": 0,
+        "errors": 0,
+        "loads": 0,
+        "load_time": 0.0,
+    })
+
+
+def _count(namespace, metric):
+    with _metrics_lock:
+        _get_stats(namespace)[metric] += 1
+
+
+def _count_load(namespace, duration, failed):
+    with _metrics_lock:
+        stats = _get_stats(namespace)
+        stats["loads"] += 1
+        stats["load_time"] += duration
+        if failed:
+            stats["errors"] += 1
+
+
+def get_fetch_cache_metrics():
+    """Hits, misses, upstream errors and load latency per namespace of this process"""
+    with _metrics_lock:
+        return {
+            namespace: {
+                "hits": stats["hits"],
+                "stale_hits": stats["stale_hits"],
+                "misses": stats["misses"],
+                "errors": stats["errors"],
+                "loads": stats["loads"],
+                "load_time_avg_ms": round(
+                    stats["load_time"] / stats["loads"] * 1000, 1
+                ) if stats["loads"] else None,
+            }
+            for namespace, stats in _metrics.items()
+        }
+
+
+def _get_lock_timeout(loader, timeout):
+    if timeout is None:
+        timeout = getattr(loader, "timeout", None) or DEFAULT_LOADER_TIMEOUT
+    return timeout + LOCK_MARGIN
+
+
+def _acquire(lock_key, lock_timeout):
+    token = uuid.uuid4().hex
+    return token if cache.add(lock_key, token, lock_timeout) else None
+
+
+def _release(lock_key, token):
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _get_data_namespace(namespace):
+    return f"fetch_cache.{namespace}"
+
+
+def get_data_versions(*namespaces):
+    """Versions changing whenever a loaded value of the namespaces changes"""
+    return [get_namespace_version(_get_data_namespace(namespace)) for namespace in namespaces]
+
+
+def _set_entry(namespace, cache_key, entry, previous, timeout):
+    cache.set(cache_key, entry, timeout)
+    if previous is None or (previous["error"], previous["value"]) != (entry["error"], entry["value"]):
+        clear_namespace(_get_data_namespace(namespace))
+
+
+def _is_stale(entry):
+    return entry["expires_at"] is not None and entry["expires_at"] <= time.time()
+
+
+def _get_value(entry, default):
+    return default if entry["error"] else entry["value"]
+
+
+def _load(namespace, key, loader, ttl, stale_ttl, error_ttl, default):
+    """Call loader and cache its value, or the failure if there is no value to keep
+
+    Returns the loaded value and whether loading succeeded.
+    """
+    cache_key = _get_key(namespace, key)
+    start = time.perf_counter()
+    try:
+        value = loader()
+    except FetchError as exc:
+        _count_load(namespace, time.perf_counter() - start, failed=True)
+        log.info(f"Fetching {namespace} {key} failed: {exc}")
+
+        # A failed refresh keeps serving the previous value
+        previous = cache.get(cache_key)
+        if previous is not None and not previous["error"]:
+            return previous["value"], False
+
+        _set_entry(
+            namespace,
+            cache_key,
+            {"value": None, "error": True, "expires_at": None},
+            previous,
+            _jitter(exc.ttl or error_ttl),
+        )
+        return default, False
+
+    _count_load(namespace, time.perf_counter() - start, failed=False)
+    timeout = _jitter(ttl)
+    _set_entry(
+        namespace,
+        cache_key,
+        {
+            "value": value,
+            "error": False,
+            "expires_at": time.time() + timeout if timeout is not None else None,
+        },
+        cache.get(cache_key),
+        timeout + stale_ttl if timeout is not None else None,
+    )
+    return value, True
+
+
+def _refresh(namespace, key, loader, ttl, stale_ttl, error_ttl, token):
+    try:
+        __, loaded = _load(namespace, key, loader, ttl, stale_ttl, error_ttl, None)
+        # After a failure the lock is left to expire, so that the next
+        # refresh waits for it instead of hammering a broken upstream
+        if loaded:
+            _release(_get_lock_key(namespace, key), token)
+    except Exception:
+        log.exception(f"Refreshing {namespace} {key} failed")
+    finally:
+        connections.close_all()
+
+
+def _refresh_in_background(*args):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=REFRESH_WORKERS, thread_name_prefix="fetch-cache",
+            )
+        future = _executor.submit(_refresh, *args)
+        _refreshes.add(future)
+    future.add_done_callback(_refreshes.discard)
+
+
+def wait_for_refreshes(timeout=None):
+    """Block until the background refreshes started so far have finished"""
+    with _executor_lock:
+        pending = list(_refreshes)
+    wait(pending, timeout=timeout)
+
+
+def fetch(
+    namespace,
+    key,
+    loader,
+    ttl,
+    stale_ttl=DEFAULT_STALE_TTL,
+    error_ttl=DEFAULT_ERROR_TTL,
+    use_cached=True,
+    default=None,
+    timeout=None,
+):
+    """Cached value of loader() for key in namespace
+
+    Only one worker at a time calls loader for a key, others wait for its
+    result and return default if it does not arrive in time. Values older
+    than ttl seconds (None to never expire) are served for stale_ttl more
+    seconds while one worker refreshes them in the background. Loaders
+    raise FetchError when upstream has no value, which is cached too and
+    returns default. With use_cached=False the value is always reloaded, a
+    failed reload keeps the cached value.
+
+    timeout is the longest time loader takes, by default its timeout
+    attribute as set by json_loader. The lock and the wait for it last
+    that long.
+    """
+    cache_key = _get_key(namespace, key)
+    lock_key = _get_lock_key(namespace, key)
+    lock_timeout = _get_lock_timeout(loader, timeout)
+    args = (namespace, key, loader, ttl, stale_ttl, error_ttl)
+
+    if not use_cached:
+        return _load(*args, default)[0]
+
+    entry = cache.get(cache_key)
+    if entry is not None:
+        if not _is_stale(entry):
+            _count(namespace, "hits")
+            return _get_value(entry, default)
+
+        _count(namespace, "stale_hits")
+        token = _acquire(lock_key, lock_timeout)
+        if token:
+            _refresh_in_background(*args, token)
+        return _get_value(entry, default)
+
+    _count(namespace, "misses")
+    token = _acquire(lock_key, lock_timeout)
+    if token is None:
+        # Another worker is loading the same key, wait for its result
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = cache.get(cache_key)
+            if entry is None and cache.get(lock_key) is None:
+                # The worker released the lock, with a result or after crashing
+                entry = cache.get(cache_key)
+                if entry is None:
+                    log.warning(f"Loading {namespace} {key} failed in another worker")
+                    return default
+            if entry is not None:
+                return _get_value(entry, default)
+        # Calling upstream here would pile more load on it while it is slow
+        log.warning(f"Timed out waiting for {namespace} {key}")
+        return default
+
+    try:
+        return _load(*args, default)[0]
+    finally:
+        _release(lock_key, token)
+
+
+def peek(namespace, key, default=None):
+    """Cached value for key in namespace without loading it, stale or not"""
+    entry = cache.get(_get_key(namespace, key))
+    return default if entry is None else _get_value(entry, default)
+
+
+def json_loader(url, headers=None, timeout=None, error_ttls=None, timeout_ttl=None):
+    """Loader of the JSON response of a GET request
+
+    Responses other than 200 raise FetchError with the TTL of their status
+    code in error_ttls, timeouts with timeout_ttl. Connection errors and
+    invalid JSON raise FetchError with the default error TTL.
+    """
+    def load():
+        try:
+            response = requests.get(url, headers=headers, timeout=timeout)
+        except requests.Timeout:
+            log.error("Request timed out for url: {}".format(url))
+            raise FetchError("Request timed out", ttl=timeout_ttl)
+        except requests.RequestException as exc:
+            log.error(f"Request failed for url: {url}: {exc}")
+            raise FetchError(f"Request failed: {exc}")
+
+        if response.status_code != 200:
+            raise FetchError(
+                f"Response status {response.status_code}",
+                ttl=(error_ttls or {}).get(response.status_code),
+            )
+        try:
+            return response.json()
+        except ValueError as exc:
+            raise FetchError(f"Invalid JSON response: {exc}")
+
+    load.timeout = timeout
+    return load
@@ -1,6 +1,7 @@
 from collections import OrderedDict
+import hashlib
+import itertools
 import re
-import requests
 import json
 import logging
 import copy
@@ -9,27 +10,39 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from requests import Timeout
-from rest_framework import status
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from rest_framework.renderers import JSONRenderer
-from rest_framework.response import Response
 from datetime import datetime
 
+from projects.cache_namespaces import (
+    FIELDSET_PATHS,
+    FLAT_DATA,
+    NAMESPACE_TIMEOUT,
+    SCHEMA,
+    clear_namespace,
+    get_cache_key,
+    get_namespace_version,
+)
+from projects.fetch_cache import FetchError, fetch, json_loader
 from users.helpers import get_graph_api_access_token
 from users.serializers import PersonnelSerializer
 
 log = logging.getLogger(__name__)
 
+# Geoserver data of active projects is also refreshed periodically with a task
+GEOSERVER_DATA_TTL = 86400  # 1 day
+
 def get_fieldset_path(attr, attribute_path=[], cached=True, orig_attr=None):
     orig_attr = orig_attr or attr
-    cache_key = f'projects.helpers.get_fieldset_path.{orig_attr.identifier}'
+    cache_key = get_cache_key(FIELDSET_PATHS, orig_attr.identifier)
     if cached:
         cache_value = cache.get(cache_key)
         if cache_value:
             return cache_value
 
     if not attr.fieldsets.count():
-        cache.set(cache_key, attribute_path, None)
+        cache.set(cache_key, attribute_path, NAMESPACE_TIMEOUT)
         return attribute_path
     else:
         parent_fieldset = attr.fieldsets.first()
@@ -76,14 +89,14 @@ def get_flat_attribute_data(data, flat, first_run=True, flat_key=None, value_typ
     from projects.models import Attribute
     if first_run:
         id = data.get("pinonumero")
-        cache_key = 'projects.helpers.get_flat_attribute_data'
+        cache_key = get_cache_key(FLAT_DATA, "get_flat_attribute_data")
         flats = cache.get_or_set(cache_key, OrderedDict())
         flat_key = str(data)
         cached_flat = flats.get((id, flat_key))
 
         if cached_flat:
             flats.move_to_end((id, flat_key), last=True)
-            cache.set(cache_key, flats, None)
+            cache.set(cache_key, flats, NAMESPACE_TIMEOUT)
             return cached_flat
 
         value_types = {a.identifier: a.value_type for a in Attribute.objects.all()}
@@ -115,11 +128,30 @@ def get_flat_attribute_data(data, flat, first_run=True, flat_key=None, value_typ
 
         flats[(id, flat_key)] = flat
         flats.move_to_end((id, flat_key), last=False)
-        cache.set(cache_key, flats, None)
+        cache.set(cache_key, flats, NAMESPACE_TIMEOUT)
 
     return flat
 
 
+def _get_kaavoitus_api_headers():
+    return {"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"}
+
+
+def graph_api_loader(url):
+    """fetch_cache loader of a Graph API GET request"""
+    def load():
+        token = get_graph_api_access_token()
+        if not token:
+            raise FetchError("Cannot get access token", ttl=60)
+        return json_loader(
+            url, headers={"Authorization": f"Bearer {token}"}, timeout=30,
+        )()
+
+    # The access token request comes on top of the 30 seconds
+    load.timeout = 60
+    return load
+
+
 def update_paikkatieto(attribute_data, use_cached=True):
     identifier = attribute_data.get("hankenumero", None)
     if not identifier:
@@ -127,24 +159,16 @@ def update_paikkatieto(attribute_data, use_cached=True):
 
     url = f"{settings.KAAVOITUS_API_BASE_URL}/hel/v1/paikkatieto/{identifier}"
 
-    paikkatieto_data = cache.get(url) if use_cached else None
-    if not paikkatieto_data:
-        try:
-            response = requests.get(
-                url,
-                headers={"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"},
-                timeout=30
-            )
-            if response.status_code == 200:
-                paikkatieto_data = response.json()
-                cache.set(url, paikkatieto_data, None)  # Refreshed automatically with task
-            else:
-                cache.set(url, "error", 900)  # 15 minutes
-        except Timeout:
-            log.error("Request timed out for url: {}".format(url))
-            cache.set(url, "error", 3600)  # 1 hour
+    paikkatieto_data = fetch(
+        "paikkatieto",
+        url,
+        json_loader(url, headers=_get_kaavoitus_api_headers(), timeout=30, timeout_ttl=3600),
+        ttl=None,  # Refreshed automatically with task
+        error_ttl=900,  # 15 minutes
+        use_cached=use_cached,
+    )
 
-    if paikkatieto_data and paikkatieto_data != "error":
+    if paikkatieto_data:
         attribute_data.update(paikkatieto_data)
 
 
@@ -202,33 +226,20 @@ def set_kaavoitus_api_data_in_attribute_data(attribute_data, use_cached=True):
 
     for attr, urls in fetched_data.items():
         for key, url in urls.items():
-            data = cache.get(url) if use_cached else None
-            if not data:
-                try:
-                    response = requests.get(
-                        url,
-                        headers={"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"},
-                        timeout=180
-                    )
-                except Timeout:
-                    log.error("Request timed out for url: {}".format(url))
-                    response = Response(
-                        data="Kaavoitus-api did not return a response in time.",
-                        status=status.HTTP_408_REQUEST_TIMEOUT
-                    )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    cache.set(url, data, None)  # Refreshed periodically with automated task
-                elif response.status_code in [400, 404, 408]:
-                    cache.set(url, "error", 86400)  # 24 hours
-                else:
-                    cache.set(url, "error", 900)  # 15 minutes
-
-            if data and data != "error":
-                fetched_data[attr][key] = data
-            else:
-                fetched_data[attr][key] = None
+            fetched_data[attr][key] = fetch(
+                "kaavoitus_api",
+                url,
+                json_loader(
+                    url,
+                    headers=_get_kaavoitus_api_headers(),
+                    timeout=180,
+                    error_ttls={400: 86400, 404: 86400},  # 24 hours
+                    timeout_ttl=86400,
+                ),
+                ttl=None,  # Refreshed periodically with automated task
+                error_ttl=900,  # 15 minutes
+                use_cached=use_cached,
+            )
 
     def get_deep(source, keys, default=None):
         if not keys:
@@ -565,26 +576,7 @@ def set_kaavoitus_api_data_in_attribute_data(attribute_data, use_cached=True):
 def get_ad_user(id):
     url = f"{settings.GRAPH_API_BASE_URL}/v1.0/users/{id}" \
           "?$select=companyName,givenName,id,jobTitle,mail,mobilePhone,businessPhones,officeLocation,surname"
-    try:
-        ad_user_data = cache.get(url)
-    except TypeError:
-        return None
-
-    if not ad_user_data:
-        token = get_graph_api_access_token()
-        if not token:
-            return Response(
-                "Cannot get access token",
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-        response = requests.get(
-            url, headers={"Authorization": f"Bearer {token}"}
-        )
-        if response:
-            ad_user_data = response.json()
-            cache.set(url, ad_user_data, 3600)
-
-    return ad_user_data
+    return fetch("graph_users", url, graph_api_loader(url), ttl=3600, error_ttl=300)
 
 def _add_paths(paths, solved_path, remaining_path, parent_data):
     from projects.models import Attribute
@@ -627,24 +619,15 @@ def set_geoserver_data_in_attribute_data(attribute_data):
 
     url = f"{settings.KAAVOITUS_API_BASE_URL}/geoserver/v1/suunnittelualue/{identifier}"
 
-    geoserver_data = cache.get(url)
-    if not geoserver_data:
-        try:
-            response = requests.get(
-                url,
-                headers={"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"},
-                timeout=15
-            )
-            if response.status_code == 200:
-                geoserver_data = response.json()
-                cache.set(url, geoserver_data, 86400)  # 1 day
-            else:
-                cache.set(url, "error", 3600)  # 1 hour
-        except Timeout:
-            log.error("Request timed out for url: {}".format(url))
-            cache.set(url, "error", 3600)  # 1 hour
+    geoserver_data = fetch(
+        "geoserver",
+        url,
+        json_loader(url, headers=_get_kaavoitus_api_headers(), timeout=15, timeout_ttl=3600),
+        ttl=GEOSERVER_DATA_TTL,
+        error_ttl=3600,  # 1 hour
+    )
 
-    if geoserver_data and geoserver_data != "error":
+    if geoserver_data:
         for geo_attr in list(geoserver_data.keys()):
             # Prioritize manually set values
             if attribute_data.get(geo_attr, False):
@@ -799,82 +782,136 @@ def check_visibility(project, attribute):
     return False
 
 
-def get_attribute_data_filtered_response(attributes, generated_attributes, ignored, project, use_cached=True):
-    cache_key = f'attribute_data_filtered_{project.pk}'
-    response = cache.get(cache_key) if use_cached else None
+ATTRIBUTE_DATA_FILTERED_TIMEOUT = 60 * 60 * 6
 
-    if not response:
-        response = {}
-        attribute_data = project.attribute_data
-        set_ad_data_in_attribute_data(attribute_data)
-        set_geoserver_data_in_attribute_data(attribute_data)
-        project.update_generated_values(generated_attributes, attribute_data)
 
-        for attribute in attributes.values():
-            if not attribute.api_visibility or attribute.id in ignored:
-                continue
+def _get_attribute_data_filtered_cache_key(project_id):
+    return f'attribute_data_filtered_{project_id}'
 
-            value = attribute_data.get(attribute.identifier, None)
-            identifier = attribute.identifier
 
-            if not value:
-                response[identifier] = ""
-                continue
+def _is_fresh_attribute_data_filtered(cached, project, schema_version):
+    # Entries are stamped with the modified_at of the project and the schema
+    # version they were built from, schema changes such as attribute renames
+    # don't touch modified_at
+    return isinstance(cached, dict) \
+        and cached.get("modified_at") == project.modified_at \
+        and cached.get("schema_version") == schema_version
 
-            # Temporarily disabled 04.03.2026 due to not all necessary fields showing
-            #if not check_visibility(project, attribute):
-            #    continue
 
-            if attribute.value_type == "fieldset":
-                fieldset = []
-                for entry in value:  # fieldset
-                    fieldset_obj = {}
-                    deleted = entry.get('_deleted', False)
-                    if deleted:
-                        continue
-                    for k, v in entry.items():
-                        fieldset_attr = attributes.get(k, None)
-                        if not fieldset_attr or not fieldset_attr.api_visibility:
-                            continue
-                        if fieldset_attr.value_type == "personnel":
-                            _v = get_in_personnel_data(v, "name", False)
-                        elif fieldset_attr.value_type in ["rich_text", "rich_text_short"]:
-                            _v = "".join([item["insert"] for item in v["ops"]]).strip() if v else None
-                        elif fieldset_attr.value_type == "date":
-                            _v = check_format_date(v)
-                        else:
-                            _v = v
-                        fieldset_obj[k] = _v
-                    if fieldset_obj:
-                        fieldset.append(fieldset_obj)
-                if fieldset:
-                    response[identifier] = fieldset
-            elif attribute.value_type == "user":
-                response[identifier] = get_in_personnel_data(value, "name", True)
-            elif attribute.value_type in ["rich_text", "rich_text_short"]:
-                try:
-                    response[identifier] = "".join([item["insert"] for item in value["ops"]]).strip()
-                except TypeError:
-                    response[identifier] = value
+def get_attribute_data_filtered_response(
+    attributes, generated_attributes, ignored, project, use_cached=True, schema_version=None,
+):
+    if schema_version is None:
+        schema_version = get_schema_version()
+    cached = cache.get(_get_attribute_data_filtered_cache_key(project.pk)) if use_cached else None
+    if _is_fresh_attribute_data_filtered(cached, project, schema_version):
+        return cached["data"]
+
+    response = _render_attribute_data_filtered(attributes, generated_attributes, ignored, project)
+    cache.set(
+        _get_attribute_data_filtered_cache_key(project.pk),
+        {"modified_at": project.modified_at, "schema_version": schema_version, "data": response},
+        ATTRIBUTE_DATA_FILTERED_TIMEOUT,
+    )
+    return response
+
+
+def iter_attribute_data_filtered_responses(attributes, generated_attributes, ignored, projects, batch_size=100):
+    """Yield (project, response) for the projects, only regenerating stale cache entries
+
+    Cached entries are fetched with one cache query per batch of projects.
+    """
+    schema_version = get_schema_version()
+    projects = iter(projects)
+    while True:
+        batch = list(itertools.islice(projects, batch_size))
+        if not batch:
+            return
+
+        cached = cache.get_many([
+            _get_attribute_data_filtered_cache_key(project.pk) for project in batch
+        ])
+        for project in batch:
+            entry = cached.get(_get_attribute_data_filtered_cache_key(project.pk))
+            if _is_fresh_attribute_data_filtered(entry, project, schema_version):
+                yield project, entry["data"]
             else:
-                response[identifier] = value
+                yield project, get_attribute_data_filtered_response(
+                    attributes, generated_attributes, ignored, project,
+                    use_cached=False, schema_version=schema_version,
+                )
+
 
-        response = sanitize_attribute_data_filter_result(attributes, response)
+def _render_attribute_data_filtered(attributes, generated_attributes, ignored, project):
+    response = {}
+    attribute_data = project.attribute_data
+    set_ad_data_in_attribute_data(attribute_data)
+    set_geoserver_data_in_attribute_data(attribute_data)
+    project.update_generated_values(generated_attributes, attribute_data)
 
+    for attribute in attributes.values():
+        if not attribute.api_visibility or attribute.id in ignored:
+            continue
+
+        value = attribute_data.get(attribute.identifier, None)
+        identifier = attribute.identifier
 
-        # TODO: Rename DOCUMENT_EDIT_URL_FORMAT to be generic url base
-        url = settings.DOCUMENT_EDIT_URL_FORMAT.replace("<pk>", str(project.pk)).removesuffix("/edit")
-        #response["projektin_nimi"] = project.name
-        #response["pinonumero"] = project.pino_number
-        response["projektin_osoite"] = url
-        response["onhold"] = project.onhold
-        response["onhold_at"] = project.onhold_at.strftime("%d.%m.%Y %H:%M:%S") if project.onhold_at else ""
-        response["archived"] = project.archived
-        response["archived_at"] = project.archived_at.strftime("%d.%m.%Y %H:%M:%S") if project.archived_at else ""
-        response["created_at"] = project.created_at.strftime("%d.%m.%Y %H:%M:%S") if project.created_at else ""
-        response["modified_at"] = project.modified_at.strftime("%d.%m.%Y %H:%M:%S") if project.modified_at else ""
+        if not value:
+            response[identifier] = ""
+            continue
 
-        cache.set(cache_key, response, 60 * 60 * 6)
+        # Temporarily disabled 04.03.2026 due to not all necessary fields showing
+        #if not check_visibility(project, attribute):
+        #    continue
+
+        if attribute.value_type == "fieldset":
+            fieldset = []
+            for entry in value:  # fieldset
+                fieldset_obj = {}
+                deleted = entry.get('_deleted', False)
+                if deleted:
+                    continue
+                for k, v in entry.items():
+                    fieldset_attr = attributes.get(k, None)
+                    if not fieldset_attr or not fieldset_attr.api_visibility:
+                        continue
+                    if fieldset_attr.value_type == "personnel":
+                        _v = get_in_personnel_data(v, "name", False)
+                    elif fieldset_attr.value_type in ["rich_text", "rich_text_short"]:
+                        _v = "".join([item["insert"] for item in v["ops"]]).strip() if v else None
+                    elif fieldset_attr.value_type == "date":
+                        _v = check_format_date(v)
+                    else:
+                        _v = v
+                    fieldset_obj[k] = _v
+                if fieldset_obj:
+                    fieldset.append(fieldset_obj)
+            if fieldset:
+                response[identifier] = fieldset
+        elif attribute.value_type == "user":
+            response[identifier] = get_in_personnel_data(value, "name", True)
+        elif attribute.value_type in ["rich_text", "rich_text_short"]:
+            try:
+                response[identifier] = "".join([item["insert"] for item in value["ops"]]).strip()
+            except TypeError:
+                response[identifier] = value
+        else:
+            response[identifier] = value
+
+    response = sanitize_attribute_data_filter_result(attributes, response)
+
+
+    # TODO: Rename DOCUMENT_EDIT_URL_FORMAT to be generic url base
+    url = settings.DOCUMENT_EDIT_URL_FORMAT.replace("<pk>", str(project.pk)).removesuffix("/edit")
+    #response["projektin_nimi"] = project.name
+    #response["pinonumero"] = project.pino_number
+    response["projektin_osoite"] = url
+    response["onhold"] = project.onhold
+    response["onhold_at"] = project.onhold_at.strftime("%d.%m.%Y %H:%M:%S") if project.onhold_at else ""
+    response["archived"] = project.archived
+    response["archived_at"] = project.archived_at.strftime("%d.%m.%Y %H:%M:%S") if project.archived_at else ""
+    response["created_at"] = project.created_at.strftime("%d.%m.%Y %H:%M:%S") if project.created_at else ""
+    response["modified_at"] = project.modified_at.strftime("%d.%m.%Y %H:%M:%S") if project.modified_at else ""
 
     return response
 
@@ -979,6 +1016,44 @@ def sanitize_attribute_data_filter_result(attributes, attribute_data):
     return attribute_data
 
 
+def get_schema_version():
+    """Version counter of schema data (attributes, sections, deadlines etc.)"""
+    return get_namespace_version(SCHEMA)
+
+
+def bump_schema_version():
+    clear_namespace(SCHEMA)
+
+
+def get_etag(*parts):
+    return hashlib.sha1(
+        ":".join(str(part) for part in parts).encode("utf-8")
+    ).hexdigest()
+
+
+def _format_etag(etag, weak=False):
+    return f"W/{quote_etag(etag)}" if weak else quote_etag(etag)
+
+
+def get_not_modified_response(request, etag, last_modified=None, weak=False):
+    """Returns a 304 response if the client already has the current representation"""
+    return get_conditional_response(
+        request,
+        etag=_format_etag(etag, weak),
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_conditional_headers(response, etag, last_modified=None, weak=False):
+    """Set validators, weak ones for bodies served in several Content-Encodings"""
+    response["ETag"] = _format_etag(etag, weak)
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # Clients must always revalidate as the payload depends on the user
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 DOCUMENT_CONTENT_TYPES = {
     'docx': "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
     'pptx': "application/vnd.openxmlformats-officedocument.presentationml.presentation.main+xml"
@@ -1,6 +1,5 @@
 import itertools
 import csv
-import json
 import logging
 import re
 from collections import Counter, defaultdict
@@ -10,10 +9,9 @@ from itertools import filterfalse
 from collections.abc import Sequence
 from typing import Iterable, List, Optional
 
-from django.core.cache import cache
 from django.db.utils import IntegrityError
 from django.contrib.auth.models import Group
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import ProtectedError, Q
 from openpyxl import load_workbook
 
@@ -48,6 +46,12 @@ from ..models import (
 )
 from ..models.attribute import AttributeCategorization
 from ..models.utils import create_identifier, truncate_identifier, check_identifier
+from ..signals.batching import SchemaChangeReport, schema_change_batch
+from ..signals.handlers import (
+    invalidate_cached_sections,
+    invalidate_fieldset_paths,
+    invalidate_schema_version,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -491,6 +495,7 @@ class AttributeUpdater:
         logger.info(f"Admin: Starting to update attribute identifiers")
         file = self.options['filename'].read().decode('utf-8')
         reader = csv.reader(StringIO(file))
+        updated_project_ids = set()
 
         for i, row in enumerate(reader):
             if i == 0:
@@ -540,13 +545,89 @@ class AttributeUpdater:
 
 
             logger.info(f"Updating project attribute_data: {old_identifier}->{new_identifier}")
-            for proj in Project.objects.all():
-                attr_data = json.dumps(proj.attribute_data)
-                if old_identifier in attr_data:
-                    logger.info(f"    Updating project {proj.id}: {old_identifier}->{new_identifier}")
-                    attr_data = attr_data.replace(old_identifier, new_identifier)
-                    proj.attribute_data = json.loads(attr_data)
-                    proj.save()
+            project_ids = self._rename_attribute_data_key(old_identifier, new_identifier)
+            if project_ids:
+                # The UPDATE leaves modified_at as is, payloads cached per
+                # project are keyed by the schema version instead
+                invalidate_schema_version()
+            if self._is_in_search_vector(new_identifier):
+                updated_project_ids |= project_ids
+
+        # Rebuild search vectors once for every touched project instead of after each rename,
+        # only values of searchable and personnel attributes are in them
+        logger.info(f"Reindexing {len(updated_project_ids)} projects")
+        for proj in Project.objects.filter(id__in=updated_project_ids):
+            proj.save()
+
+    @staticmethod
+    def _get_fieldset_root_identifiers(identifier):
+        """Top-level fieldset identifiers under which the given attribute can be stored"""
+        roots = set()
+        targets = {identifier}
+        seen = set()
+        while targets:
+            sources = set(
+                FieldSetAttribute.objects.filter(
+                    attribute_target__identifier__in=targets,
+                ).values_list("attribute_source__identifier", flat=True)
+            )
+            sources -= seen
+            seen |= sources
+            nested = set(
+                FieldSetAttribute.objects.filter(
+                    attribute_target__identifier__in=sources,
+                ).values_list("attribute_target__identifier", flat=True)
+            )
+            roots |= sources - nested
+            targets = nested
+        return roots
+
+    @staticmethod
+    def _is_in_search_vector(identifier):
+        """Whether Project.save() indexes the attribute itself or a fieldset containing it"""
+        identifiers = {identifier}
+        targets = {identifier}
+        while targets:
+            targets = set(
+                FieldSetAttribute.objects.filter(
+                    attribute_target__identifier__in=targets,
+                ).values_list("attribute_source__identifier", flat=True)
+            ) - identifiers
+            identifiers |= targets
+        return Attribute.objects.filter(identifier__in=identifiers).filter(
+            Q(searchable=True) | Q(value_type=Attribute.TYPE_PERSONNEL)
+        ).exists()
+
+    def _rename_attribute_data_key(self, old_identifier, new_identifier):
+        """Rename the key in attribute_data of all projects with a single UPDATE
+
+        Only rows having the key at top level or having one of the containing
+        fieldsets are considered, both of which can be served by the GIN index,
+        and of those only rows the rename actually changes are written.
+        Keys are renamed recursively so fieldset rows are updated as well, values
+        are left as is.
+        """
+        fieldset_identifiers = list(
+            self._get_fieldset_root_identifiers(new_identifier)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Project._meta.db_table}
+                SET attribute_data = kaavapino_jsonb_rename_key(attribute_data, %s, %s)
+                WHERE (attribute_data ? %s OR attribute_data ?| %s::text[])
+                AND kaavapino_jsonb_rename_key(attribute_data, %s, %s) IS DISTINCT FROM attribute_data
+                RETURNING id
+                """,
+                [
+                    old_identifier, new_identifier,
+                    old_identifier, fieldset_identifiers,
+                    old_identifier, new_identifier,
+                ],
+            )
+            project_ids = {row[0] for row in cursor.fetchall()}
+        logger.info(f"    Updated {len(project_ids)} projects: {old_identifier}->{new_identifier}")
+        return project_ids
 
 
 
@@ -734,15 +815,19 @@ class AttributeImporter:
 
             return False
 
-        logger.info("\nCreating attributes...")
+        logger.info("\nSyncing attributes...")
 
-        existing_attribute_ids = set(
-            Attribute.objects.all().values_list("identifier", flat=True)
-        )
+        attributes = {
+            attribute.identifier: attribute
+            for attribute in Attribute.objects.select_related("data_retention_plan")
+        }
+        existing_attribute_ids = set(attributes)
 
         imported_attribute_ids = set()
-        created_attribute_count = 0
-        updated_attribute_count = 0
+        created_attributes = {}
+        updated_attributes = {}
+        updated_fields = set()
+        choice_rows = {}
         created_choices_count = 0
         for row in rows:
             identifier = self._get_attribute_row_identifier(row)
@@ -930,72 +1015,99 @@ class AttributeImporter:
             attributesubgroup = row[self.column_index[ATTRIBUTE_SUBGROUP]]
             api_visibility = True if row[self.column_index[ATTRIBUTE_API_VISIBILITY]] == "kyllä" else False
 
-            attribute, created = Attribute.objects.update_or_create(
-                identifier=identifier,
-                defaults={
-                    "name": name,
-                    "value_type": value_type,
-                    "display": display,
-                    "visibility_conditions": visibility_conditions,
-                    "hide_conditions": hide_conditions,
-                    "help_text": help_text,
-                    "help_link": help_link,
-                    "help_img_link": help_img_link,
-                    "public": is_public,
-                    "required": is_required,
-                    "searchable": is_searchable,
-                    "multiple_choice": multiple_choice,
-                    "data_retention_plan": data_retention_plan,
-                    "character_limit": character_limit,
-                    "validation_regex": validation_regex,
-                    "placeholder_text": placeholder_text,
-                    "assistive_text": assistive_text,
-                    "error_text": error_text,
-                    "unique": is_unique,
-                    "error_message": error_message,
-                    "generated": generated,
-                    "calculations": calculations,
-                    "related_fields": related_fields,
-                    "linked_fields": linked_fields,
-                    "unit": unit,
-                    "broadcast_changes": broadcast_changes,
-                    "autofill_rule": autofill_rule,
-                    "autofill_readonly": autofill_readonly,
-                    "updates_autofill": updates_autofill,
-                    "highlight_group": highlight_group,
-                    "static_property": static_property,
-                    "owner_editable": owner_editable,
-                    "edit_privilege": edit_privilege,
-                    "viewing_privilege": viewing_privilege,
-                    "owner_viewable": True,
-                    "view_privilege": "browse",
-                    "data_source": data_source,
-                    "data_source_key": data_source_key,
-                    "key_attribute_path": key_attribute_path,
-                    "ad_data_key": ad_data_key,
-                    "field_roles": field_roles,
-                    "field_subroles": field_subroles,
-                    "fieldset_total": fieldset_total,
-                    "attributegroup": attributegroup,
-                    "attributesubgroup": attributesubgroup,
-                    "api_visibility": api_visibility,
-                },
-            )
-            if created:
-                created_attribute_count += 1
+            defaults = {
+                "name": name,
+                "value_type": value_type,
+                "display": display,
+                "visibility_conditions": visibility_conditions,
+                "hide_conditions": hide_conditions,
+                "help_text": help_text,
+                "help_link": help_link,
+                "help_img_link": help_img_link,
+                "public": is_public,
+                "required": is_required,
+                "searchable": is_searchable,
+                "multiple_choice": multiple_choice,
+                "data_retention_plan": data_retention_plan,
+                "character_limit": character_limit,
+                "validation_regex": validation_regex,
+                "placeholder_text": placeholder_text,
+                "assistive_text": assistive_text,
+                "error_text": error_text,
+                "unique": is_unique,
+                "error_message": error_message,
+                "generated": generated,
+                "calculations": calculations,
+                "related_fields": related_fields,
+                "linked_fields": linked_fields,
+                "unit": unit,
+                "broadcast_changes": broadcast_changes,
+                "autofill_rule": autofill_rule,
+                "autofill_readonly": autofill_readonly,
+                "updates_autofill": updates_autofill,
+                "highlight_group": highlight_group,
+                "static_property": static_property,
+                "owner_editable": owner_editable,
+                "edit_privilege": edit_privilege,
+                "viewing_privilege": viewing_privilege,
+                "owner_viewable": True,
+                "view_privilege": "browse",
+                "data_source": data_source,
+                "data_source_key": data_source_key,
+                "key_attribute_path": key_attribute_path,
+                "ad_data_key": ad_data_key,
+                "field_roles": field_roles,
+                "field_subroles": field_subroles,
+                "fieldset_total": fieldset_total,
+                "attributegroup": attributegroup,
+                "attributesubgroup": attributesubgroup,
+                "api_visibility": api_visibility,
+            }
+
+            # Rows are diffed against the loaded attributes and written in bulk
+            attribute = attributes.get(identifier)
+            if attribute is None:
+                attribute = Attribute(identifier=identifier, **defaults)
+                attributes[identifier] = created_attributes[identifier] = attribute
             else:
-                updated_attribute_count += 1
+                changed = [
+                    field for field, value in defaults.items()
+                    if getattr(attribute, field) != value
+                ]
+                for field in changed:
+                    setattr(attribute, field, defaults[field])
+                if changed and identifier not in created_attributes:
+                    updated_attributes[identifier] = attribute
+                    updated_fields.update(changed)
             imported_attribute_ids.add(identifier)
 
             choices_ref = row[self.column_index[ATTRIBUTE_CHOICES_REF]]
-            if choices_ref:
-                created_choices_count += self._create_attribute_choices(attribute, row)
-            else:
-                AttributeValueChoice.objects.filter(attribute=attribute).delete()
-
+            choice_rows[identifier] = (attribute, row if choices_ref else None)
+
+        Attribute.objects.bulk_create(created_attributes.values())
+        if updated_attributes:
+            Attribute.objects.bulk_update(updated_attributes.values(), sorted(updated_fields))
+        if Attribute.objects.filter(value_type=Attribute.TYPE_GEOMETRY).count() > 1:
+            raise NotImplementedError(
+                "Currently only one geometry type attribute at a time is supported."
+            )
 
-            if created:
-                logger.info(f"Created {attribute}")
+        # bulk_create and bulk_update do not send the signals the receivers invalidate on
+        self.report.record(Attribute, SchemaChangeReport.CREATED, len(created_attributes))
+        self.report.record(Attribute, SchemaChangeReport.UPDATED, len(updated_attributes))
+        if created_attributes or updated_attributes:
+            invalidate_cached_sections()
+            invalidate_schema_version()
+        invalidate_fieldset_paths({*created_attributes, *updated_attributes})
+        for identifier in created_attributes:
+            logger.info(f"Created {attributes[identifier]}")
+
+        AttributeValueChoice.objects.filter(
+            attribute__in=[attribute for attribute, row in choice_rows.values() if row is None],
+        ).delete()
+        for attribute, row in choice_rows.values():
+            if row is not None:
+                created_choices_count += self._create_attribute_choices(attribute, row)
 
         # Remove any attributes that was not imported
         old_attribute_ids = existing_attribute_ids - imported_attribute_ids
@@ -1021,9 +1133,14 @@ class AttributeImporter:
                 logger.warning(f"Failed to delete Attribute {attr.identifier}", exc)
                 raise exc
 
+        logger.info(
+            f"Attributes: {len(created_attributes)} created, {len(updated_attributes)} updated, "
+            f"{len(old_attribute_ids)} deleted"
+        )
+
         return {
-            "created": created_attribute_count,
-            "updated": updated_attribute_count,
+            "created": len(created_attributes),
+            "updated": len(updated_attributes),
             "deleted": len(old_attribute_ids),
             "choices": created_choices_count,
         }
@@ -1165,23 +1282,27 @@ class AttributeImporter:
 
         return created_choices_count
 
-    def _create_fieldset_links(self, subtype, rows: Iterable[Sequence[str]]):
-        logger.info("\nCreating fieldsets...")
+    def _create_fieldset_links(self, subtype, rows: Iterable[Sequence[str]], fieldset_links):
+        """Map out the fieldset links of the subtype
+
+        Links are collected into fieldset_links, a dict of (source, target)
+        identifier pairs to sets of (phase id, index) tuples, and written by
+        _sync_fieldset_links once all subtypes are mapped.
+        """
+        logger.info("\nMapping fieldsets...")
 
         if ATTRIBUTE_FIELDSET not in self.column_index:
             logger.warning(f'Fieldset column "{ATTRIBUTE_FIELDSET}" missing: Skipping')
             return
 
-        fieldset_map = defaultdict(list)
         phases = ProjectPhase.objects.filter(project_subtype=subtype)
 
-        # Map out the link that need to be created
         for row in rows:
             fieldset_attr = row[self.column_index[ATTRIBUTE_FIELDSET]]
             if not fieldset_attr:
                 continue
 
-            phase_indices = []
+            phase_indices = set()
             for phase in phases:
                 location = self._get_attribute_locations(row, phase.name)
                 if location is None:
@@ -1193,27 +1314,92 @@ class AttributeImporter:
                     index = None
 
                 if index is not None:
-                    phase_indices.append((phase, index))
+                    phase_indices.add((phase.pk, index))
 
             attr_id = self._get_attribute_row_identifier(row)
-            fieldset_map[fieldset_attr].append((attr_id, phase_indices))
+            fieldset_links.setdefault((fieldset_attr, attr_id), set()).update(phase_indices)
 
-        # Create the links
-        for source_id in fieldset_map:
-            source = Attribute.objects.get(identifier=source_id)
+    def _sync_fieldset_links(self, fieldset_links):
+        """Diff the mapped fieldset links against the database and apply the changes in bulk"""
+        logger.info("\nSyncing fieldsets...")
 
-            for target_id, phase_indices in fieldset_map[source_id]:
-                target = Attribute.objects.get(identifier=target_id)
-                fsa, _ = FieldSetAttribute.objects.get_or_create(
-                    attribute_source=source, attribute_target=target
-                )
-                for phase, index in phase_indices:
-                    ProjectPhaseFieldSetAttributeIndex.objects.create(
-                        index=index,
-                        phase=phase,
-                        attribute=fsa,
-                    )
-                logger.info(f"Created {fsa}")
+        identifiers = {identifier for link in fieldset_links for identifier in link}
+        attribute_ids = dict(
+            Attribute.objects.filter(identifier__in=identifiers).values_list("identifier", "pk")
+        )
+        missing = identifiers - attribute_ids.keys()
+        if missing:
+            raise AttributeImporterException(
+                f"Unknown fieldset attributes: {', '.join(sorted(missing))}"
+            )
+
+        desired = defaultdict(set)
+        for (source_id, target_id), phase_indices in fieldset_links.items():
+            desired[(attribute_ids[source_id], attribute_ids[target_id])].update(phase_indices)
+
+        fieldset_attribute_ids = {}
+        stale_ids = []
+        changed_identifiers = set()
+        for pk, source, target, target_identifier in FieldSetAttribute.objects.values_list(
+            "pk", "attribute_source_id", "attribute_target_id", "attribute_target__identifier"
+        ):
+            if (source, target) in desired and (source, target) not in fieldset_attribute_ids:
+                fieldset_attribute_ids[(source, target)] = pk
+            else:
+                stale_ids.append(pk)
+                changed_identifiers.add(target_identifier)
+
+        created = FieldSetAttribute.objects.bulk_create([
+            FieldSetAttribute(attribute_source_id=source, attribute_target_id=target)
+            for (source, target) in desired
+            if (source, target) not in fieldset_attribute_ids
+        ])
+        self.report.record(FieldSetAttribute, SchemaChangeReport.CREATED, len(created))
+        identifiers_by_id = {pk: identifier for identifier, pk in attribute_ids.items()}
+        for fsa in created:
+            fieldset_attribute_ids[(fsa.attribute_source_id, fsa.attribute_target_id)] = fsa.pk
+            changed_identifiers.add(identifiers_by_id[fsa.attribute_target_id])
+
+        if stale_ids:
+            FieldSetAttribute.objects.filter(pk__in=stale_ids).delete()
+
+        desired_indices = {
+            (fieldset_attribute_ids[link], phase_id, index)
+            for link, phase_indices in desired.items()
+            for phase_id, index in phase_indices
+        }
+        existing_indices = set()
+        stale_index_ids = []
+        for pk, *index in ProjectPhaseFieldSetAttributeIndex.objects.values_list(
+            "pk", "attribute_id", "phase_id", "index"
+        ):
+            index = tuple(index)
+            if index in desired_indices and index not in existing_indices:
+                existing_indices.add(index)
+            else:
+                stale_index_ids.append(pk)
+
+        if stale_index_ids:
+            ProjectPhaseFieldSetAttributeIndex.objects.filter(pk__in=stale_index_ids).delete()
+
+        created_indices = ProjectPhaseFieldSetAttributeIndex.objects.bulk_create([
+            ProjectPhaseFieldSetAttributeIndex(attribute_id=fsa_id, phase_id=phase_id, index=index)
+            for fsa_id, phase_id, index in desired_indices - existing_indices
+        ])
+        self.report.record(
+            ProjectPhaseFieldSetAttributeIndex, SchemaChangeReport.CREATED, len(created_indices)
+        )
+
+        # bulk_create does not send the signals the receivers invalidate on
+        if created or created_indices:
+            invalidate_cached_sections()
+            invalidate_schema_version()
+        invalidate_fieldset_paths(changed_identifiers)
+
+        logger.info(
+            f"Fieldsets: {len(created)} created, {len(stale_ids)} deleted, "
+            f"{len(fieldset_attribute_ids) - len(created)} unchanged"
+        )
 
     def _validate_generated_attributes(self):
         """
@@ -1413,30 +1599,55 @@ class AttributeImporter:
             )
 
     def _create_sections(self, rows, subtype: ProjectSubtype):
-        logger.info("\nReplacing sections...")
+        """Diff the phase sections of the subtype against the database and apply the changes in bulk
 
-        ProjectPhaseSection.objects.filter(phase__project_subtype=subtype).delete()
+        Unchanged sections keep their ids and attribute links.
+        """
+        logger.info("\nSyncing sections...")
 
+        desired = set()
         for phase in ProjectPhase.objects.filter(project_subtype=subtype):
-
-            phase_sections = set()
-
             for row in rows:
                 try:
                     location = self._get_attribute_locations(row, phase.name)
-                    section_phase_name = location["label"]
-                    section_phase_ingress = location["ingress"]
-                    index = location["section_location"]
+                    desired.add((
+                        phase.pk,
+                        location["label"],
+                        location["ingress"],
+                        location["section_location"],
+                    ))
                 except TypeError:
                     continue
 
-                phase_sections.add((section_phase_name, section_phase_ingress, index))
+        existing = set()
+        stale_ids = []
+        for pk, *section in ProjectPhaseSection.objects.filter(
+            phase__project_subtype=subtype,
+        ).values_list("pk", "phase_id", "name", "ingress", "index"):
+            section = tuple(section)
+            if section in desired and section not in existing:
+                existing.add(section)
+            else:
+                stale_ids.append(pk)
 
-            for phase_section_name, section_phase_ingress, index in phase_sections:
-                section = ProjectPhaseSection.objects.create(
-                    phase=phase, index=index, name=phase_section_name, ingress=section_phase_ingress
-                )
-                logger.info(f"Created {section}")
+        if stale_ids:
+            ProjectPhaseSection.objects.filter(pk__in=stale_ids).delete()
+
+        created = ProjectPhaseSection.objects.bulk_create([
+            ProjectPhaseSection(phase_id=phase_id, name=name, ingress=ingress, index=index)
+            for phase_id, name, ingress, index in desired - existing
+        ])
+        self.report.record(ProjectPhaseSection, SchemaChangeReport.CREATED, len(created))
+
+        # bulk_create does not send the signals the receivers invalidate on
+        if created:
+            invalidate_cached_sections()
+            invalidate_schema_version()
+
+        logger.info(
+            f"Sections: {len(created)} created, {len(stale_ids)} deleted, "
+            f"{len(existing)} unchanged"
+        )
 
     def _create_floor_area_sections(self, rows, subtype: ProjectSubtype):
         logger.info("\nReplacing floor area sections...")
@@ -1485,17 +1696,19 @@ class AttributeImporter:
         return field_location
 
     def _create_attribute_section_links(self, rows, subtype: ProjectSubtype):
-        logger.info("\nReplacing attribute section links...")
-
-        ProjectPhaseSectionAttribute.objects.filter(
-            section__phase__project_subtype=subtype
-        ).delete()
+        """Diff the attribute section links of the subtype against the database and apply the changes in bulk"""
+        logger.info("\nSyncing attribute section links...")
+
+        attribute_ids = dict(Attribute.objects.values_list("identifier", "pk"))
+        section_ids = {
+            (phase_id, name, ingress, index): pk
+            for pk, phase_id, name, ingress, index in ProjectPhaseSection.objects.filter(
+                phase__project_subtype=subtype,
+            ).values_list("pk", "phase_id", "name", "ingress", "index")
+        }
 
+        desired = set()
         for phase in ProjectPhase.objects.filter(project_subtype=subtype):
-
-            # Index for attribute within a phase section
-            counter = Counter()
-
             for row in rows:
                 project_size = row[self.column_index[PROJECT_SIZE]]
                 row_subtypes = self.get_subtypes_from_cell(project_size)
@@ -1507,41 +1720,53 @@ class AttributeImporter:
                 ):
                     continue
 
-                identifier = self._get_attribute_row_identifier(row)
-                attribute = Attribute.objects.get(identifier=identifier)
                 locations = self._get_attribute_locations(row, phase.name)
 
                 if locations is None:
                     # Attribute doesn't appear in this phase
                     continue
 
-                section_phase_name = locations["label"]
-                section_phase_ingress = locations["ingress"]
-
-                section = ProjectPhaseSection.objects.get(
-                    phase=phase,
-                    name=section_phase_name,
-                    ingress=section_phase_ingress,
-                    index=locations["section_location"],
-                )
+                section_id = section_ids[(
+                    phase.pk,
+                    locations["label"],
+                    locations["ingress"],
+                    locations["section_location"],
+                )]
+                desired.add((
+                    attribute_ids[self._get_attribute_row_identifier(row)],
+                    section_id,
+                    self.calculate_index(locations),
+                ))
+
+        existing = set()
+        stale_ids = []
+        for pk, *link in ProjectPhaseSectionAttribute.objects.filter(
+            section__phase__project_subtype=subtype,
+        ).values_list("pk", "attribute_id", "section_id", "index"):
+            link = tuple(link)
+            if link in desired and link not in existing:
+                existing.add(link)
+            else:
+                stale_ids.append(pk)
 
-                attribute_index = self.calculate_index(locations)
+        if stale_ids:
+            ProjectPhaseSectionAttribute.objects.filter(pk__in=stale_ids).delete()
 
-                section_attribute = ProjectPhaseSectionAttribute.objects.create(
-                    attribute=attribute,
-                    section=section,
-                    index=attribute_index,
-                )
+        created = ProjectPhaseSectionAttribute.objects.bulk_create([
+            ProjectPhaseSectionAttribute(attribute_id=attribute_id, section_id=section_id, index=index)
+            for attribute_id, section_id, index in desired - existing
+        ])
+        self.report.record(ProjectPhaseSectionAttribute, SchemaChangeReport.CREATED, len(created))
 
-                counter[section] += 1
+        # bulk_create does not send the signals the receivers invalidate on
+        if created:
+            invalidate_cached_sections()
+            invalidate_schema_version()
 
-                logger.info(
-                    f"Created "
-                    f"{section_attribute.section.phase} / "
-                    f"{section_attribute.section} / "
-                    f"{section_attribute.index} / "
-                    f"{section_attribute.attribute}"
-                )
+        logger.info(
+            f"Attribute section links: {len(created)} created, {len(stale_ids)} deleted, "
+            f"{len(existing)} unchanged"
+        )
 
     def _create_floor_area_attribute_section_links(
         self, rows, subtype: ProjectSubtype
@@ -1864,6 +2089,20 @@ class AttributeImporter:
 
     @transaction.atomic
     def run(self):
+        """Import the workbook, returns a SchemaChangeReport of the changes
+
+        With the dry_run option the changes are rolled back and only reported.
+        """
+        with schema_change_batch() as self.report:
+            self._run()
+
+        if self.options.get("dry_run"):
+            transaction.set_rollback(True)
+            logger.info(f"Dry run, rolled back changes:\n{self.report}")
+
+        return self.report
+
+    def _run(self):
         self.project_type, _ = ProjectType.objects.get_or_create(name="asemakaava")
 
         filename = self.options.get("filename")
@@ -1883,14 +2122,14 @@ class AttributeImporter:
         attribute_info = self._create_attributes(data_rows)
         self._create_attribute_key_relations(data_rows)
         phase_info = {"created": 0, "updated": 0, "deleted": 0}
-        # Reset Fieldset relations
-        FieldSetAttribute.objects.all().delete()
+        fieldset_links = {}
         for subtype in subtypes:
             _phase_info = self.create_phases(subtype)
             phase_info["created"] += _phase_info["created"]
             phase_info["updated"] += _phase_info["updated"]
             phase_info["deleted"] += _phase_info["deleted"]
-            self._create_fieldset_links(subtype, data_rows)
+            self._create_fieldset_links(subtype, data_rows, fieldset_links)
+        self._sync_fieldset_links(fieldset_links)
 
         self._validate_generated_attributes()
 
@@ -1911,10 +2150,6 @@ class AttributeImporter:
         self._create_overview_filters(all_data_rows)
         self._create_attribute_categorizations(all_data_rows)
 
-        # Clear cached sections
-        cache.delete("serialized_phase_sections")
-        cache.delete("serialized_deadline_sections")
-
         logger.info("Project subtypes {}".format(ProjectSubtype.objects.count()))
         logger.info("Phases {}".format(ProjectPhase.objects.count()))
         logger.info(f"  Created: {phase_info['created']}")
@@ -19,6 +19,7 @@ from projects.models import (
     ProjectSubtype,
     ProjectPhase,
 )
+from projects.signals.batching import schema_change_batch
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +78,15 @@ class DeadlineImporter:
     def __init__(self, options=None):
         self.options = options
         self.workbook = None
+        self.attributes = {}
+        self.date_types = {}
+
+    def get_attribute(self, identifier):
+        """Attribute lookup from the preloaded attributes, raises Attribute.DoesNotExist like a query"""
+        try:
+            return self.attributes[identifier]
+        except KeyError:
+            raise Attribute.DoesNotExist(f"Attribute {identifier} does not exist")
 
     def _open_workbook(self, filename):
         try:
@@ -353,10 +363,8 @@ class DeadlineImporter:
         if row:
             try:
                 identifier = row.lower().replace(" ", "_")
-                return DateType.objects.get(
-                    identifier=identifier
-                )
-            except DateType.DoesNotExist:
+                return self.date_types[identifier]
+            except KeyError:
                 logger.warning(
                     f"Ignoring invalid date type {row} for {target}."
                 )
@@ -377,9 +385,7 @@ class DeadlineImporter:
                 default_to_created_at = False
 
             try:
-                attribute = Attribute.objects.get(
-                    identifier=attribute
-                )
+                attribute = self.get_attribute(attribute)
             except Attribute.DoesNotExist:
                 logger.warning(
                     f"Ignored invalid attribute identifier {attribute} for deadline {abbreviation}."
@@ -387,9 +393,7 @@ class DeadlineImporter:
                 attribute = None
 
             try:
-                confirmation_attribute = Attribute.objects.get(
-                    identifier=confirmation_attribute
-                )
+                confirmation_attribute = self.get_attribute(confirmation_attribute)
             except Attribute.DoesNotExist:
                 if confirmation_attribute:
                     logger.warning(
@@ -436,7 +440,7 @@ class DeadlineImporter:
             for identifier in cond_attr_identifiers:
                 try:
                     condition_attributes.append(
-                        Attribute.objects.get(identifier=identifier)
+                        self.get_attribute(identifier)
                     )
                 except Attribute.DoesNotExist:
                     logger.warning(
@@ -506,7 +510,7 @@ class DeadlineImporter:
                     cond = cond[1:]
 
                 try:
-                    attribute = Attribute.objects.get(identifier=cond)
+                    attribute = self.get_attribute(cond)
 
                     if negate:
                         not_condition_attributes.append(attribute)
@@ -588,8 +592,8 @@ class DeadlineImporter:
                     base_deadline = None
 
                 try:
-                    base_attribute = Attribute.objects.get(
-                        identifier=re.findall(identifier_regex, calc)[0],
+                    base_attribute = self.get_attribute(
+                        re.findall(identifier_regex, calc)[0],
                     )
                 except Attribute.DoesNotExist:
                     logger.warning(
@@ -672,7 +676,7 @@ class DeadlineImporter:
                     identifier = attr if not negate else attr[1:]
                     try:
                         condition_attribute, created = DeadlineDistanceConditionAttribute.objects.get_or_create(
-                            attribute=Attribute.objects.get(identifier=identifier),
+                            attribute=self.get_attribute(identifier),
                             negate=negate
                         )
                         condition_attributes.append(condition_attribute)
@@ -788,11 +792,27 @@ class DeadlineImporter:
 
     @transaction.atomic
     def run(self):
-        if not Attribute.objects.count():
+        """Import the workbook, returns a SchemaChangeReport of the changes
+
+        With the dry_run option the changes are rolled back and only reported.
+        """
+        with schema_change_batch() as self.report:
+            self._run()
+
+        if self.options.get("dry_run"):
+            transaction.set_rollback(True)
+            logger.info(f"Dry run, rolled back changes:\n{self.report}")
+
+        return self.report
+
+    def _run(self):
+        self.attributes = {
+            attribute.identifier: attribute for attribute in Attribute.objects.all()
+        }
+        if not self.attributes:
             raise DeadlineImporterException(
                 "No Attributes found, run Attribute importer first"
             )
-            return
 
         filename = self.options.get("filename")
         logger.info(f"Importing deadlines and datetypes from {filename}")
@@ -809,6 +829,9 @@ class DeadlineImporter:
         ]
         self._create_business_days_datetype()
         self._create_datetypes(datetype_data_rows)
+        self.date_types = {
+            date_type.identifier: date_type for date_type in DateType.objects.all()
+        }
 
         # Delete existing calculations and distances
         DeadlineDistance.objects.all().delete()
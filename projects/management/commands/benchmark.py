@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from projects.benchmarks import (
+    delete_projects,
+    generate_projects,
+    get_benchmark_user,
+    run_benchmarks,
+)
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic projects and measure the time and queries of hot paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--projects", type=int, default=2000, help="Number of projects to generate")
+        parser.add_argument("--iterations", type=int, default=10, help="Calls per hot path")
+        parser.add_argument("--output", default="benchmark.json", help="Path of the JSON results")
+        parser.add_argument("--budgets", help="JSON file of query budgets overriding the defaults")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the generated projects instead of deleting them",
+        )
+
+    def handle(self, *args, **options):
+        budgets = None
+        if options["budgets"]:
+            with open(options["budgets"]) as f:
+                budgets = json.load(f)
+
+        # Generated projects are committed so that the measured paths run
+        # their on_commit handlers and real commits like in production
+        user = get_benchmark_user()
+        try:
+            projects = generate_projects(
+                options["projects"], user, seed=options["seed"], stdout=self.stdout,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        try:
+            results = run_benchmarks(
+                projects, user, options["iterations"], budgets=budgets, stdout=self.stdout,
+            )
+        finally:
+            if not options["keep"]:
+                delete_projects(projects)
+
+        with open(options["output"], "w") as f:
+            json.dump({
+                "created_at": timezone.now().isoformat(),
+                "projects": options["projects"],
+                "results": results,
+            }, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        over_budget = [name for name, result in results.items() if not result["passed"]]
+        if over_budget:
+            raise CommandError(f"Query budget exceeded: {', '.join(over_budget)}")
@@ -14,11 +14,18 @@ class Command(BaseCommand):
         parser.add_argument("filename", type=str)
         parser.add_argument("--sheet", nargs="?", type=str)
         parser.add_argument("--kv", nargs="?", default="1.1", type=str)
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Report the changes the import would make without saving them",
+        )
 
     def handle(self, *args, **options):
         attribute_importer = AttributeImporter(options)
         try:
             with disable_auditlog():
-                attribute_importer.run()
+                report = attribute_importer.run()
         except AttributeImporterException as e:
             raise CommandError(e)
+
+        if options.get("dry_run"):
+            self.stdout.write(str(report))
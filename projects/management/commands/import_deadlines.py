@@ -12,11 +12,18 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("filename", type=str)
         parser.add_argument("--kv", nargs="?", default="1.1", type=str)
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Report the changes the import would make without saving them",
+        )
 
     def handle(self, *args, **options):
         deadline_importer = DeadlineImporter(options)
         try:
             with disable_auditlog():
-                deadline_importer.run()
+                report = deadline_importer.run()
         except DeadlineImporterException as e:
             raise CommandError(e)
+
+        if options.get("dry_run"):
+            self.stdout.write(str(report))
@@ -74,7 +74,6 @@ class Command(BaseCommand):
                             if verbose: logging.info(f'Set vis_bool {vis_bool}={project.attribute_data[vis_bool]}')
                     generated_deadlines.append(new_project_deadline)
                     project_deadlines.append(new_project_deadline)
-                project.deadlines.set(project_deadlines)
 
                 # Delete deadlines that are no longer needed
                 for deadline in to_be_removed:
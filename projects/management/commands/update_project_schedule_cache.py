@@ -3,6 +3,7 @@ import logging
 from django.core.management.base import BaseCommand, CommandError
 from django.core.cache import cache
 
+from projects.cache_namespaces import NAMESPACE_TIMEOUT, SCHEDULES, get_cache_key
 from projects.models import Project
 from projects.serializers.project import ProjectDeadlineSerializer
 
@@ -13,7 +14,7 @@ class Command(BaseCommand):
     help = "Update caches for project schedules"
 
     def handle(self, *args, **options):
-        project_schedule_cache = cache.get("serialized_project_schedules", {})
+        project_schedule_cache = cache.get(get_cache_key(SCHEDULES, "serialized_project_schedules"), {})
 
         for project in Project.objects.all():
             deadlines = project.deadlines.filter(deadline__subtype=project.subtype)
@@ -27,4 +28,4 @@ class Command(BaseCommand):
             logger.info(f"{project} schedule cached")
 
         logger.info("Saving cache")
-        cache.set("serialized_project_schedules", project_schedule_cache, None)
+        cache.set(get_cache_key(SCHEDULES, "serialized_project_schedules"), project_schedule_cache, NAMESPACE_TIMEOUT)
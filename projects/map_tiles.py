@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, router
+
+from projects.cache_namespaces import MAP_TILES, clear_namespace, get_namespace_version
+from projects.helpers import get_schema_version
+from projects.models.attribute import Attribute
+from projects.models.project import Project, ProjectAttributeMultipolygonGeometry
+
+log = logging.getLogger(__name__)
+
+MAX_ZOOM = 22
+
+# Tile geometry resolution and the clipping margin around it, in tile units
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Geometries are simplified to about one screen pixel of a 512 px tile
+WEB_MERCATOR_WORLD_SIZE = 40075016.68557849
+TILE_SIZE_PX = 512
+
+TILE_SQL = """
+WITH features AS (
+    SELECT
+        ST_AsMVTGeom(
+            ST_SimplifyPreserveTopology(ST_Transform(geometry.geometry, 3857), %s),
+            ST_TileEnvelope(%s, %s, %s), %s, %s, true
+        ) AS geom,
+        project.id,
+        project.name,
+        common_phase.name AS phase,
+        common_phase.color_code AS phase_color,
+        subtype.name AS subtype
+    FROM projects_projectattributemultipolygongeometry AS geometry
+    JOIN projects_project AS project ON project.id = geometry.project_id
+    JOIN projects_projectphase AS phase ON phase.id = project.phase_id
+    JOIN projects_commonprojectphase AS common_phase
+        ON common_phase.id = phase.common_project_phase_id
+    JOIN projects_projectsubtype AS subtype ON subtype.id = project.subtype_id
+    WHERE geometry.geometry && ST_Transform(ST_TileEnvelope(%s, %s, %s), 4326)
+    AND geometry.project_id IN ({project_ids})
+)
+SELECT ST_AsMVT(features.*, 'projects', %s, 'geom', 'id')
+FROM features WHERE geom IS NOT NULL
+"""
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def get_simplify_tolerance(z):
+    """Simplification tolerance in web mercator meters at zoom level z"""
+    return WEB_MERCATOR_WORLD_SIZE / (TILE_SIZE_PX * 2 ** z)
+
+
+def get_tile_generation():
+    """Counter of geometry writes, tiles of older generations are stale"""
+    return get_namespace_version(MAP_TILES)
+
+
+def bump_tile_generation():
+    clear_namespace(MAP_TILES)
+
+
+# Schema version, Project fields and attribute_data keys of the on-map filters
+_map_filter_fields = (None, (), ())
+
+
+def get_map_filter_fields():
+    """Project fields and top level attribute_data keys the on-map filters read
+
+    Loaded once per schema version and process.
+    """
+    global _map_filter_fields
+    version = get_schema_version()
+    if _map_filter_fields[0] == version:
+        return _map_filter_fields[1:]
+
+    fields, keys = set(), set()
+    for attribute in Attribute.objects.filter(
+        overviewfilterattribute__filters_on_map=True,
+    ).prefetch_related("fieldsets").distinct():
+        fieldset = attribute.fieldsets.first()
+        if fieldset:
+            keys.add(fieldset.identifier)
+        elif attribute.static_property:
+            try:
+                fields.add(Project._meta.get_field(attribute.static_property).attname)
+            except FieldDoesNotExist:
+                pass
+        else:
+            keys.add(attribute.identifier)
+
+    _map_filter_fields = (version, tuple(sorted(fields)), tuple(sorted(keys)))
+    return _map_filter_fields[1:]
+
+
+def render_project_tile(z, x, y, projects):
+    """Render the geometries of the projects queryset as a vector tile
+
+    Returns the Mapbox Vector Tile bytes, empty if no geometry hits the tile.
+    """
+    project_sql, project_params = projects.order_by().values("pk").query.sql_with_params()
+    alias = router.db_for_read(ProjectAttributeMultipolygonGeometry)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(TILE_SQL.format(project_ids=project_sql), [
+            get_simplify_tolerance(z),
+            z, x, y, TILE_EXTENT, TILE_BUFFER,
+            z, x, y,
+            *project_params,
+            TILE_EXTENT,
+        ])
+        tile = cursor.fetchone()[0]
+
+    return bytes(tile) if tile else b""
+
+
+def _get_filter_key(filter_params):
+    return hashlib.sha1(
+        json.dumps(filter_params, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _parse_generation(name):
+    try:
+        tile_generation, schema_version = name.split("-")
+        return int(tile_generation), int(schema_version)
+    except ValueError:
+        return None
+
+
+def _purge_stale_generations(root, current):
+    """Remove generations older than current
+
+    Newer generations written by other processes meanwhile are kept.
+    """
+    current = _parse_generation(current)
+    for name in os.listdir(root):
+        generation = _parse_generation(name)
+        if generation is None or generation == current:
+            continue
+        if all(version <= current_version for version, current_version in zip(generation, current)):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _write_tile(path, tile):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Readers only ever see complete tiles
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(tile)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+
+def get_project_tile(z, x, y, projects, filter_params):
+    """Vector tile of the projects, served from the disk cache when possible
+
+    Cached tiles are keyed by the tile generation, the schema version and
+    the filter parameters the projects queryset was built from.
+    """
+    root = settings.MAP_TILE_CACHE_ROOT
+    generation = f"{get_tile_generation()}-{get_schema_version()}"
+    generation_dir = os.path.join(root, generation)
+    path = os.path.join(
+        generation_dir, _get_filter_key(filter_params), str(z), str(x), f"{y}.mvt"
+    )
+
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    tile = render_project_tile(z, x, y, projects)
+
+    try:
+        if not os.path.isdir(generation_dir):
+            os.makedirs(generation_dir, exist_ok=True)
+            _purge_stale_generations(root, generation)
+        _write_tile(path, tile)
+    except OSError as exc:
+        # The generation was purged by a newer one while rendering
+        log.warning(f"Failed to cache map tile {z}/{x}/{y}: {exc}")
+
+    return tile
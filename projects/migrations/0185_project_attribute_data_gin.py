@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-18 00:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+RENAME_KEY_FUNCTION = """
+CREATE OR REPLACE FUNCTION kaavapino_jsonb_rename_key(data jsonb, old_key text, new_key text)
+RETURNS jsonb
+LANGUAGE plpgsql IMMUTABLE
+AS $$
+BEGIN
+    IF jsonb_typeof(data) = 'object' THEN
+        RETURN (
+            SELECT coalesce(
+                jsonb_object_agg(
+                    CASE WHEN key = old_key THEN new_key ELSE key END,
+                    kaavapino_jsonb_rename_key(value, old_key, new_key)
+                ),
+                '{}'::jsonb
+            )
+            FROM jsonb_each(data)
+        );
+    ELSIF jsonb_typeof(data) = 'array' THEN
+        RETURN (
+            SELECT coalesce(
+                jsonb_agg(kaavapino_jsonb_rename_key(elem, old_key, new_key) ORDER BY idx),
+                '[]'::jsonb
+            )
+            FROM jsonb_array_elements(data) WITH ORDINALITY AS t(elem, idx)
+        );
+    END IF;
+    RETURN data;
+END;
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0184_project_onhold_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="project",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["attribute_data"], name="projects_pr_attribu_data_gin"
+            ),
+        ),
+        migrations.RunSQL(
+            RENAME_KEY_FUNCTION,
+            reverse_sql="DROP FUNCTION IF EXISTS kaavapino_jsonb_rename_key(jsonb, text, text);",
+        ),
+    ]
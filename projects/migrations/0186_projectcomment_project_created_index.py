@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0185_project_attribute_data_gin"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="projectcomment",
+            index=models.Index(
+                fields=["project", "created_at"],
+                name="projects_pc_project_created",
+            ),
+        ),
+    ]
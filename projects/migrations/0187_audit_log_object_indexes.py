@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 00:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("projects", "0186_projectcomment_project_created_index"),
+        ("actstream", "0001_initial"),
+        ("admin", "0001_initial"),
+    ]
+
+    operations = [
+        # Supports the batched audit log deletes of the data retention purge
+        migrations.RunSQL(
+            sql="CREATE INDEX CONCURRENTLY IF NOT EXISTS actstream_action_target_ct_oid "
+                "ON actstream_action (target_content_type_id, target_object_id)",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS actstream_action_target_ct_oid",
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX CONCURRENTLY IF NOT EXISTS django_admin_log_ct_oid "
+                "ON django_admin_log (content_type_id, object_id)",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS django_admin_log_ct_oid",
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 00:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import private_storage.fields
+import projects.models.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("projects", "0187_audit_log_object_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CapturedProfile",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(choices=[("request", "request"), ("task", "task")], max_length=16, verbose_name="kind")),
+                ("name", models.CharField(max_length=255, verbose_name="name")),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="created at")),
+                ("duration", models.FloatField(verbose_name="duration (s)")),
+                ("query_count", models.PositiveIntegerField(verbose_name="query count")),
+                ("file", private_storage.fields.PrivateFileField(max_length=255, storage=projects.models.utils.KaavapinoPrivateStorage(base_url="/media/profiles/", url_postfix="profiles"), upload_to="profiles", verbose_name="File")),
+                ("user", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name="user")),
+            ],
+            options={
+                "verbose_name": "captured profile",
+                "verbose_name_plural": "captured profiles",
+                "ordering": ("-created_at",),
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.25 on 2026-10-18 00:00
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+import django.db.models.deletion
+
+
+def copy_dates_of_unlinked_deadlines(apps, schema_editor):
+    """Fill dates of deadlines missing from Project.deadlines from attribute_data
+
+    Same as the sync_pdls_with_dls command did, these deadlines become
+    visible when Project.deadlines is replaced with the foreign key.
+    """
+    Project = apps.get_model("projects", "Project")
+    ProjectDeadline = apps.get_model("projects", "ProjectDeadline")
+    through = Project.deadlines.through
+
+    unlinked = ProjectDeadline.objects \
+        .filter(deadline__attribute__isnull=False) \
+        .filter(~Exists(through.objects.filter(
+            project_id=OuterRef("project_id"), projectdeadline_id=OuterRef("pk"),
+        ))) \
+        .select_related("project", "deadline__attribute")
+    for project_deadline in unlinked.iterator():
+        value = (project_deadline.project.attribute_data or {}).get(
+            project_deadline.deadline.attribute.identifier
+        )
+        if value:
+            project_deadline.date = value
+            project_deadline.save(update_fields=["date"])
+
+
+def link_deadlines(apps, schema_editor):
+    Project = apps.get_model("projects", "Project")
+    ProjectDeadline = apps.get_model("projects", "ProjectDeadline")
+    through = Project.deadlines.through
+
+    through.objects.bulk_create(
+        [
+            through(project_id=project_id, projectdeadline_id=pk)
+            for pk, project_id in ProjectDeadline.objects.values_list("pk", "project_id").iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0188_capturedprofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_dates_of_unlinked_deadlines, link_deadlines),
+        migrations.RemoveField(
+            model_name='project',
+            name='deadlines',
+        ),
+        migrations.AlterField(
+            model_name='projectdeadline',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deadlines', to='projects.project', verbose_name='project'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='projectdeadline',
+            unique_together={('project', 'deadline')},
+        ),
+    ]
@@ -26,6 +26,7 @@ from .document import (  #noqa
     ProjectDocumentDownloadLog,
 )
 from .project import (  # noqa
+    AttributeDataConflictException,
     Project,
     ProjectPriority,
     ProjectAttributeFile,
@@ -63,3 +64,4 @@ from .report import (  # noqa
     ReportFilter,
     ReportFilterAttributeChoice,
 )
+from .profiling import CapturedProfile  # noqa
@@ -1,12 +1,9 @@
 import datetime
 import logging
 import re
-from collections.abc import Sequence
-from collections import OrderedDict
 from html import escape
 from decimal import Decimal, ROUND_HALF_UP
 
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.postgres.fields import ArrayField
 from django.core.serializers.json import DjangoJSONEncoder
@@ -15,7 +12,7 @@ from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 
 from users.models import User, PRIVILEGE_LEVELS
-from .helpers import DATE_SERIALIZATION_FORMAT, validate_identifier
+from .helpers import validate_identifier
 from projects.helpers import get_ad_user
 from users.serializers import PersonnelSerializer
 
@@ -491,180 +488,15 @@ class Attribute(models.Model):
                 f"Error in {self.identifier} with calculation {self.calculations}."
             )
 
-    def serialize_value(self, value):
-        if self.value_type != Attribute.TYPE_FIELDSET \
-            and (self.data_source or self.ad_data_key):
-            return None
-
-        if self.value_type == Attribute.TYPE_CHOICE:
-            value_choices = self.value_choices.all()
-        else:
-            value_choices = None
+    def get_codec(self):
+        from .codec import AttributeCodecSet
+        return AttributeCodecSet.compile([self])[self.identifier]
 
-        if value_choices and value_choices.exists():
-            if self.multiple_choice and value is not None:
-                return [v.identifier for v in value]
-            else:
-                return value.identifier if value else None
-        elif self.value_type == Attribute.TYPE_INTEGER:
-            if self.multiple_choice and value is not None:
-                return [
-                    int(v) if v is not None else None
-                    for v in value
-                ]
-            else:
-                return int(value) if value is not None else None
-        elif self.value_type == Attribute.TYPE_DECIMAL:
-            return str(value) if value is not None else None
-        elif self.value_type in (
-            Attribute.TYPE_SHORT_STRING,
-            Attribute.TYPE_LONG_STRING,
-            Attribute.TYPE_LINK,
-            Attribute.TYPE_CHOICE,
-            Attribute.TYPE_PERSONNEL,
-        ):
-            if self.multiple_choice and value is not None:
-                return [
-                    str(v) if v else None
-                    for v in value
-                ]
-            else:
-                return str(value) if value else None
-        elif self.value_type in (
-            Attribute.TYPE_RICH_TEXT,
-            Attribute.TYPE_RICH_TEXT_SHORT,
-        ):
-            if self.multiple_choice and value is not None:
-                return [v for v in value]
-            else:
-                return value
-        elif self.value_type == Attribute.TYPE_BOOLEAN:
-            if self.multiple_choice and value is not None:
-                return [
-                    bool(v) if v is not None else None
-                    for v in value
-                ]
-            else:
-                return bool(value) if value is not None else None
-        elif self.value_type == Attribute.TYPE_DATE:
-            if isinstance(value, str):
-                return value
-            return (
-                datetime.datetime.strftime(
-                    value, DATE_SERIALIZATION_FORMAT
-                ) if value else None
-            )
-        elif self.value_type == Attribute.TYPE_USER:
-            # allow saving non-existing users using their names (str) at least for now.
-            # actual users are saved using their ids (int).
-            if isinstance(value, get_user_model()):
-                if self.multiple_choice and value is not None:
-                    return [v.uuid for v in value]
-                else:
-                    return value.uuid
-            else:
-                if self.multiple_choice and value is not None:
-                    return [v or None for v in value]
-                else:
-                    return value or None
-        elif self.value_type == Attribute.TYPE_FIELDSET:
-            return self._get_fieldset_serialization(value)
-        elif self.value_type in (Attribute.TYPE_FILE, Attribute.TYPE_IMAGE):
-            if value is None:
-                return None
-            else:
-                return ""
-        else:
-            raise Exception('Cannot serialize attribute type "%s".' % self.value_type)
+    def serialize_value(self, value):
+        return self.get_codec().encode(value)
 
     def deserialize_value(self, value):
-        if self.value_type == Attribute.TYPE_CHOICE:
-            value_choices = self.value_choices.all()
-        else:
-            value_choices = None
-
-        if value_choices and value_choices.exists():
-            if self.multiple_choice and value is not None:
-                return [v for v in value_choices.filter(identifier__in=value)]
-            else:
-                try:
-                    return value_choices.get(identifier=value)
-                except AttributeValueChoice.DoesNotExist:
-                    return None
-        elif self.value_type in (
-            Attribute.TYPE_INTEGER,
-            Attribute.TYPE_DECIMAL,
-            Attribute.TYPE_SHORT_STRING,
-            Attribute.TYPE_LONG_STRING,
-            Attribute.TYPE_BOOLEAN,
-            Attribute.TYPE_LINK,
-            Attribute.TYPE_CHOICE,
-            Attribute.TYPE_PERSONNEL,
-        ):
-            return value
-        elif self.value_type in (
-            Attribute.TYPE_RICH_TEXT,
-            Attribute.TYPE_RICH_TEXT_SHORT,
-        ):
-            return value
-        elif self.value_type == Attribute.TYPE_DATE:
-            return (
-                datetime.datetime.strptime(
-                    value, DATE_SERIALIZATION_FORMAT
-                ).date() if value else None
-            )
-        elif self.value_type == Attribute.TYPE_USER:
-            try:
-                return get_user_model().objects.get(uuid=value)
-            except get_user_model().DoesNotExist:
-                return None
-        elif self.value_type in [Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET]:
-            return self._get_fieldset_serialization(value, deserialize=True)
-        else:
-            raise Exception('Cannot deserialize attribute type "%s".' % self.value_type)
-
-    def _get_fieldset_serialization(self, value: Sequence, deserialize: bool = False):
-        """Recursively go through the fields in the fieldset and (de)serialize them."""
-
-        if isinstance(value, OrderedDict):
-            value = [value]
-        elif not isinstance(value, Sequence):
-            return None
-
-        entities = []
-        fieldset_attributes = self.fieldset_attributes.all()
-
-        for i, listitem in enumerate(value):
-            processed_entity = {}
-            processed_entity_has_files = False
-            for key, val in listitem.items():
-                if key == "_deleted":
-                    processed_entity[key] = val
-                    continue
-
-                for attr in fieldset_attributes:
-                    if attr.value_type in (
-                        Attribute.TYPE_FILE, Attribute.TYPE_IMAGE
-                    ):
-                        # TODO If alternate file deletion method is needed,
-                        # add if val is None check
-                        processed_entity_has_files = True
-
-                    elif attr.identifier == key:
-                        if deserialize:
-                            processed_value = attr.deserialize_value(
-                                val
-                            )
-                        else:
-                            processed_value = attr.serialize_value(val)
-                        processed_entity[attr.identifier] = processed_value
-                    else:
-                        continue
-
-            if processed_entity or processed_entity_has_files:
-                entities.append(processed_entity)
-
-        return entities
+        return self.get_codec().decode(value)
 
     def _get_single_display_value(self, value):
         if value is None or self.value_type == Attribute.TYPE_GEOMETRY:
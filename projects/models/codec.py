@@ -0,0 +1,326 @@
+import datetime
+import logging
+import uuid
+from collections import OrderedDict
+from collections.abc import Sequence
+
+from django.contrib.auth import get_user_model
+
+from .attribute import Attribute, AttributeValueChoice, FieldSetAttribute
+from .helpers import DATE_SERIALIZATION_FORMAT
+
+log = logging.getLogger(__name__)
+
+
+class AttributeCodec:
+    """Serializes and deserializes the values of a single attribute.
+
+    Codecs are compiled by AttributeCodecSet which preloads value choices and
+    fieldset children, so (de)serializing a value never queries the database
+    apart from fetching the users referenced by the data.
+    """
+
+    def __init__(self, attribute, choices=None):
+        self.attribute = attribute
+        self.value_type = attribute.value_type
+        self.multiple_choice = attribute.multiple_choice
+        self.choices = choices or {}
+        self.children = {}
+        self.has_file_children = False
+
+    def _add_child(self, codec):
+        if codec.value_type in (Attribute.TYPE_FILE, Attribute.TYPE_IMAGE):
+            # File fields are stored separately, their keys only mark the
+            # row as having content
+            self.has_file_children = True
+        else:
+            self.children[codec.attribute.identifier] = codec
+
+    def encode(self, value):
+        attribute = self.attribute
+        if self.value_type != Attribute.TYPE_FIELDSET \
+            and (attribute.data_source or attribute.ad_data_key):
+            return None
+
+        if self.choices:
+            if self.multiple_choice and value is not None:
+                return [v.identifier for v in value]
+            else:
+                return value.identifier if value else None
+        elif self.value_type == Attribute.TYPE_INTEGER:
+            if self.multiple_choice and value is not None:
+                return [
+                    int(v) if v is not None else None
+                    for v in value
+                ]
+            else:
+                return int(value) if value is not None else None
+        elif self.value_type == Attribute.TYPE_DECIMAL:
+            return str(value) if value is not None else None
+        elif self.value_type in (
+            Attribute.TYPE_SHORT_STRING,
+            Attribute.TYPE_LONG_STRING,
+            Attribute.TYPE_LINK,
+            Attribute.TYPE_CHOICE,
+            Attribute.TYPE_PERSONNEL,
+        ):
+            if self.multiple_choice and value is not None:
+                return [
+                    str(v) if v else None
+                    for v in value
+                ]
+            else:
+                return str(value) if value else None
+        elif self.value_type in (
+            Attribute.TYPE_RICH_TEXT,
+            Attribute.TYPE_RICH_TEXT_SHORT,
+        ):
+            if self.multiple_choice and value is not None:
+                return [v for v in value]
+            else:
+                return value
+        elif self.value_type == Attribute.TYPE_BOOLEAN:
+            if self.multiple_choice and value is not None:
+                return [
+                    bool(v) if v is not None else None
+                    for v in value
+                ]
+            else:
+                return bool(value) if value is not None else None
+        elif self.value_type == Attribute.TYPE_DATE:
+            if isinstance(value, str):
+                return value
+            return (
+                datetime.datetime.strftime(
+                    value, DATE_SERIALIZATION_FORMAT
+                ) if value else None
+            )
+        elif self.value_type == Attribute.TYPE_USER:
+            # allow saving non-existing users using their names (str) at least for now.
+            # actual users are saved using their ids (int).
+            if isinstance(value, get_user_model()):
+                return value.uuid
+            else:
+                if self.multiple_choice and value is not None:
+                    return [v or None for v in value]
+                else:
+                    return value or None
+        elif self.value_type == Attribute.TYPE_FIELDSET:
+            return self._process_fieldset(value, lambda codec, val: codec.encode(val))
+        elif self.value_type in (Attribute.TYPE_FILE, Attribute.TYPE_IMAGE):
+            if value is None:
+                return None
+            else:
+                return ""
+        else:
+            raise Exception('Cannot serialize attribute type "%s".' % self.value_type)
+
+    def decode(self, value, users=None):
+        """Deserialize value, users maps uuid strings to already fetched users"""
+        if users is None:
+            uuids = set()
+            self.collect_user_ids(value, uuids)
+            users = fetch_users(uuids)
+
+        if self.choices:
+            if self.multiple_choice and value is not None:
+                return [
+                    choice for identifier, choice in self.choices.items()
+                    if identifier in value
+                ]
+            else:
+                return self.choices.get(value) if isinstance(value, str) else None
+        elif self.value_type in (
+            Attribute.TYPE_INTEGER,
+            Attribute.TYPE_DECIMAL,
+            Attribute.TYPE_SHORT_STRING,
+            Attribute.TYPE_LONG_STRING,
+            Attribute.TYPE_BOOLEAN,
+            Attribute.TYPE_LINK,
+            Attribute.TYPE_CHOICE,
+            Attribute.TYPE_PERSONNEL,
+            Attribute.TYPE_RICH_TEXT,
+            Attribute.TYPE_RICH_TEXT_SHORT,
+        ):
+            return value
+        elif self.value_type == Attribute.TYPE_DATE:
+            return (
+                datetime.datetime.strptime(
+                    value, DATE_SERIALIZATION_FORMAT
+                ).date() if value else None
+            )
+        elif self.value_type == Attribute.TYPE_USER:
+            return users.get(_normalize_uuid(value)) if value else None
+        elif self.value_type in (Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET):
+            return self._process_fieldset(
+                value, lambda codec, val: codec.decode(val, users=users)
+            )
+        else:
+            raise Exception('Cannot deserialize attribute type "%s".' % self.value_type)
+
+    def collect_user_ids(self, value, uuids):
+        """Add the user uuids referenced by the serialized value to uuids"""
+        if not value:
+            return
+
+        if self.value_type == Attribute.TYPE_USER:
+            normalized = _normalize_uuid(value)
+            if normalized:
+                uuids.add(normalized)
+        elif self.value_type in (Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET):
+            if isinstance(value, OrderedDict):
+                value = [value]
+            elif not isinstance(value, Sequence) or isinstance(value, str):
+                return
+
+            for listitem in value:
+                if not isinstance(listitem, dict):
+                    continue
+                for key, val in listitem.items():
+                    child = self.children.get(key)
+                    if child:
+                        child.collect_user_ids(val, uuids)
+
+    def _process_fieldset(self, value, process):
+        """Go through the fields in the fieldset and (de)serialize them with the child codecs."""
+
+        if isinstance(value, OrderedDict):
+            value = [value]
+        elif not isinstance(value, Sequence):
+            return None
+
+        entities = []
+        for listitem in value:
+            processed_entity = {}
+            processed_entity_has_files = False
+            for key, val in listitem.items():
+                if key == "_deleted":
+                    processed_entity[key] = val
+                    continue
+
+                # TODO If alternate file deletion method is needed,
+                # add if val is None check
+                if self.has_file_children:
+                    processed_entity_has_files = True
+
+                child = self.children.get(key)
+                if child:
+                    processed_entity[key] = process(child, val)
+
+            if processed_entity or processed_entity_has_files:
+                entities.append(processed_entity)
+
+        return entities
+
+
+class AttributeCodecSet:
+    """Compiled codecs for a group of attributes keyed by identifier.
+
+    Compiling costs a fixed number of queries: one per fieldset nesting level
+    and one for all value choices. encode_many and decode_many then
+    (de)serialize whole attribute data dicts with at most one user query.
+    """
+
+    def __init__(self, codecs):
+        self.codecs = codecs
+
+    @classmethod
+    def compile(cls, attributes):
+        attributes = {attr.id: attr for attr in attributes}
+        fieldset_links = []
+
+        source_ids = {
+            attr.id for attr in attributes.values()
+            if attr.value_type in (Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET)
+        }
+        seen_source_ids = set()
+        while source_ids:
+            seen_source_ids |= source_ids
+            links = list(
+                FieldSetAttribute.objects.filter(attribute_source_id__in=source_ids)
+                .select_related("attribute_target")
+            )
+            fieldset_links += links
+            source_ids = set()
+            for link in links:
+                target = link.attribute_target
+                attributes.setdefault(target.id, target)
+                if target.value_type in (
+                    Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET
+                ) and target.id not in seen_source_ids:
+                    source_ids.add(target.id)
+
+        choices = {}
+        choice_attribute_ids = [
+            attr.id for attr in attributes.values()
+            if attr.value_type == Attribute.TYPE_CHOICE
+        ]
+        if choice_attribute_ids:
+            for choice in AttributeValueChoice.objects.filter(
+                attribute_id__in=choice_attribute_ids
+            ).order_by("attribute_id", "index"):
+                choices.setdefault(choice.attribute_id, {})[choice.identifier] = choice
+
+        codecs_by_id = {
+            attr_id: AttributeCodec(attr, choices=choices.get(attr_id))
+            for attr_id, attr in attributes.items()
+        }
+        for link in fieldset_links:
+            codecs_by_id[link.attribute_source_id]._add_child(
+                codecs_by_id[link.attribute_target_id]
+            )
+
+        return cls({
+            codec.attribute.identifier: codec
+            for codec in codecs_by_id.values()
+        })
+
+    def __contains__(self, identifier):
+        return identifier in self.codecs
+
+    def __getitem__(self, identifier):
+        return self.codecs[identifier]
+
+    def get(self, identifier, default=None):
+        return self.codecs.get(identifier, default)
+
+    def encode_many(self, data):
+        """Serialize values of data, identifiers without a codec are skipped"""
+        return {
+            identifier: self.codecs[identifier].encode(value)
+            for identifier, value in data.items()
+            if identifier in self.codecs
+        }
+
+    def decode_many(self, data):
+        """Deserialize values of data, identifiers without a codec are skipped"""
+        uuids = set()
+        for identifier, value in data.items():
+            codec = self.codecs.get(identifier)
+            if codec:
+                codec.collect_user_ids(value, uuids)
+        users = fetch_users(uuids)
+
+        return {
+            identifier: self.codecs[identifier].decode(value, users=users)
+            for identifier, value in data.items()
+            if identifier in self.codecs
+        }
+
+
+def _normalize_uuid(value):
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def fetch_users(uuids):
+    """Fetch users by normalized uuid strings with a single query"""
+    if not uuids:
+        return {}
+
+    return {
+        str(user.uuid): user
+        for user in get_user_model().objects.filter(uuid__in=list(uuids))
+    }
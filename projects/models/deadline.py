@@ -11,6 +11,7 @@ from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.utils.translation import gettext_lazy as _
 from django.core.cache import cache
 
+from projects.cache_namespaces import DATETYPES, DEPENDENCIES, get_cache_key
 from users.models import PRIVILEGE_LEVELS
 from . import Attribute
 from .helpers import DATE_SERIALIZATION_FORMAT, validate_identifier
@@ -145,7 +146,7 @@ class Deadline(models.Model):
 
     @property
     def initial_depends_on(self):
-        cache_key = f"deadline_initial_dependencies_{self.pk}"
+        cache_key = get_cache_key(DEPENDENCIES, "initial", self.pk)
         cached_value = cache.get(cache_key)
         if cached_value is None:
             cached_value = list(set([
@@ -167,7 +168,7 @@ class Deadline(models.Model):
 
     @property
     def update_depends_on(self):
-        cache_key = f"deadline_update_dependencies_{self.pk}"
+        cache_key = get_cache_key(DEPENDENCIES, "update", self.pk)
         cached_value = cache.get(cache_key)
         if cached_value is None:
             cached_value = list(set([
@@ -484,7 +485,7 @@ class DateType(models.Model):
         return dates
 
     def get_dates(self, year):
-        cache_key = f"datetype_{self.identifier}_dates_{year}"
+        cache_key = get_cache_key(DATETYPES, self.identifier, year)
 
         cached_result = cache.get(cache_key)
         if cached_result is not None:
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db import models
+from django.urls import reverse_lazy
+from django.utils.translation import gettext_lazy as _
+from private_storage.fields import PrivateFileField
+
+from projects.models.utils import KaavapinoPrivateStorage
+
+
+class CapturedProfile(models.Model):
+    """Profile and SQL log of a single request or task captured on an admin's demand"""
+
+    KIND_REQUEST = "request"
+    KIND_TASK = "task"
+    KIND_CHOICES = (
+        (KIND_REQUEST, _("request")),
+        (KIND_TASK, _("task")),
+    )
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, verbose_name=_("kind"))
+    name = models.CharField(max_length=255, verbose_name=_("name"))
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_("user"),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("created at"), auto_now_add=True, db_index=True,
+    )
+    duration = models.FloatField(verbose_name=_("duration (s)"))
+    query_count = models.PositiveIntegerField(verbose_name=_("query count"))
+    file = PrivateFileField(
+        "File",
+        storage=KaavapinoPrivateStorage(
+            base_url=reverse_lazy(
+                "serve_private_profile_file", kwargs={"path": ""}
+            ),
+            url_postfix="profiles",
+        ),
+        upload_to="profiles",
+        max_length=255,
+    )
+
+    class Meta:
+        verbose_name = _("captured profile")
+        verbose_name_plural = _("captured profiles")
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.kind} {self.name} ({self.created_at})"
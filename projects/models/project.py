@@ -1,19 +1,22 @@
 import datetime
+import functools
 import itertools
 import logging
 import time
 
 from actstream import action
-from actstream.models import Action as ActStreamAction
 from django.conf import settings
-from django.contrib.admin.models import LogEntry
 from django.contrib.gis.db import models
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.serializers.json import DjangoJSONEncoder, json
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import F, Func, JSONField, Q
 from django.db.models.expressions import Value
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Cast
+from django.db.models.lookups import Exact
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 from django.utils.functional import cached_property
@@ -21,10 +24,12 @@ from private_storage.fields import PrivateFileField
 from PIL import Image, ImageOps
 
 from projects.actions import verbs
+from kaavapino.instrumentation import span
 from projects.helpers import get_in_personnel_data
 from projects.models.utils import KaavapinoPrivateStorage, arithmetic_eval
 from projects.serializers.utils import get_dl_vis_bool_name
 from .attribute import Attribute, FieldSetAttribute
+from .codec import AttributeCodecSet
 from .deadline import Deadline
 from .projectcomment import FieldComment
 
@@ -137,6 +142,43 @@ class ProjectPriority(models.Model):
         return self.name
 
 
+# jsonb_build_object() takes at most 100 arguments
+JSONB_BUILD_OBJECT_MAX_KEYS = 50
+
+
+class AttributeDataConflictException(Exception):
+    pass
+
+
+class ProjectQuerySet(models.QuerySet):
+    def with_attribute_data_keys(self, identifiers, name="attribute_data_keys"):
+        """Annotate name with only the given keys of attribute_data
+
+        The full attribute_data and vector_column are deferred, so only the
+        selected keys are read from the database. Missing keys are None.
+        """
+        identifiers = sorted(set(identifiers))
+        objects = [
+            Func(
+                *itertools.chain.from_iterable(
+                    (Value(identifier), KeyTransform(identifier, "attribute_data"))
+                    for identifier in identifiers[i:i + JSONB_BUILD_OBJECT_MAX_KEYS]
+                ),
+                function="jsonb_build_object",
+                output_field=JSONField(),
+            )
+            for i in range(0, len(identifiers) or 1, JSONB_BUILD_OBJECT_MAX_KEYS)
+        ]
+        subset = functools.reduce(
+            lambda a, b: Func(
+                a, b, template="(%(expressions)s)", arg_joiner=" || ",
+                output_field=JSONField(),
+            ),
+            objects,
+        )
+        return self.defer("attribute_data", "vector_column").annotate(**{name: subset})
+
+
 class Project(models.Model):
     """Represents a single project in the system."""
 
@@ -192,11 +234,6 @@ class Project(models.Model):
         null=True,
         encoder=DjangoJSONEncoder,
     )
-    deadlines = models.ManyToManyField(
-        "ProjectDeadline",
-        verbose_name=_("deadlines"),
-        related_name="projects",
-    )
     phase = models.ForeignKey(
         "ProjectPhase",
         verbose_name=_("phase"),
@@ -230,13 +267,23 @@ class Project(models.Model):
     # For indexing
     vector_column = SearchVectorField(null=True)
 
+    # Incremented on every write of attribute_data
+    version = models.PositiveIntegerField(
+        verbose_name=_("version"), default=0, editable=False,
+    )
+
     admin_description = "Voi muuttaa huoletta."
 
+    objects = ProjectQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("project")
         verbose_name_plural = _("projects")
         ordering = ("name",)
-        indexes = (GinIndex(fields=["vector_column"]),)
+        indexes = (
+            GinIndex(fields=["vector_column"]),
+            GinIndex(fields=["attribute_data"], name="projects_pr_attribu_data_gin"),
+        )
 
     def __str__(self):
         return self.name
@@ -244,28 +291,28 @@ class Project(models.Model):
     def get_attribute_data(self):
         """Returns deserialized attribute data for the project."""
         ret = {}
+        attributes = list(Attribute.objects.all())
+        codecs = AttributeCodecSet.compile(
+            attr for attr in attributes
+            if attr.value_type not in [
+                Attribute.TYPE_GEOMETRY, Attribute.TYPE_IMAGE, Attribute.TYPE_FILE
+            ]
+        )
+        decoded_data = codecs.decode_many(self.attribute_data)
+        geometry_and_file_values = \
+            load_geometry_and_file_values([self])[self.pk]
 
-        for attribute in Attribute.objects.all().prefetch_related("value_choices"):
+        for attribute in attributes:
             deserialized_value = None
 
             if attribute.value_type == Attribute.TYPE_GEOMETRY:
-                geometry = ProjectAttributeMultipolygonGeometry.objects.filter(
-                    attribute=attribute, project=self
-                ).first()
-                if not geometry:
+                if attribute.id not in geometry_and_file_values:
                     continue
-                deserialized_value = geometry.geometry
+                deserialized_value = geometry_and_file_values[attribute.id]
             elif attribute.value_type in [Attribute.TYPE_IMAGE, Attribute.TYPE_FILE]:
-                try:
-                    deserialized_value = ProjectAttributeFile.objects.filter(
-                        attribute=attribute, project=self
-                    ).order_by("-created_at").first().file
-                except AttributeError:
-                    deserialized_value = None
+                deserialized_value = geometry_and_file_values.get(attribute.id)
             elif attribute.identifier in self.attribute_data:
-                deserialized_value = attribute.deserialize_value(
-                    self.attribute_data[attribute.identifier]
-                )
+                deserialized_value = decoded_data.get(attribute.identifier)
 
             ret[attribute.identifier] = deserialized_value
         return ret
@@ -274,6 +321,165 @@ class Project(models.Model):
         self.attribute_data = {}
         self.update_attribute_data(data)
 
+    # Serialized attribute_data values as of track_attribute_data()
+    _attribute_data_snapshot = None
+    # How the ongoing save writes attribute_data, see _do_update()
+    _attribute_data_write = None
+    _attribute_data_written = None
+
+    def _serialize_attribute_data(self):
+        return {
+            key: json.dumps(value, cls=DjangoJSONEncoder, sort_keys=True)
+            for key, value in (self.attribute_data or {}).items()
+        }
+
+    def track_attribute_data(self):
+        """Write only the attribute_data keys changed after this on save()
+
+        Keys changed concurrently by others are kept. Saving a key that
+        someone else changed after this raises AttributeDataConflictException.
+        """
+        if "attribute_data" in self.get_deferred_fields():
+            return
+        self._attribute_data_snapshot = self._serialize_attribute_data()
+        self._attribute_data_version = self.version
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if self._attribute_data_snapshot is not None \
+                and (fields is None or "attribute_data" in fields):
+            self.track_attribute_data()
+        self._map_tile_values = self._get_map_tile_values()
+
+    # Fields carried in or filtering the map tiles, and their values as last
+    # loaded or saved. attribute_data keys of the on-map filters are added.
+    MAP_TILE_FIELDS = ("name", "phase_id", "subtype_id", "public", "archived", "onhold")
+    _map_tile_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._map_tile_values = instance._get_map_tile_values()
+        return instance
+
+    def _get_map_tile_values(self):
+        from projects.map_tiles import get_map_filter_fields
+
+        filter_fields, filter_keys = get_map_filter_fields()
+        deferred = self.get_deferred_fields()
+        values = {
+            field: getattr(self, field)
+            for field in (*self.MAP_TILE_FIELDS, *filter_fields) if field not in deferred
+        }
+        if "attribute_data" not in deferred:
+            # Serialized, fieldset values are often changed in place
+            values.update({
+                f"attribute_data.{key}": json.dumps(
+                    (self.attribute_data or {}).get(key), cls=DjangoJSONEncoder, sort_keys=True,
+                )
+                for key in filter_keys
+            })
+        return values
+
+    def pop_map_tile_changes(self):
+        """Whether fields carried in the map tiles changed since the last call
+
+        Instances not loaded from the database count as changed.
+        """
+        values = self._get_map_tile_values()
+        loaded, self._map_tile_values = self._map_tile_values, values
+        if loaded is None:
+            return True
+        return any(loaded.get(field, value) != value for field, value in values.items())
+
+    def _get_unchanged_condition(self, keys):
+        """Condition of the keys still having their tracked values in the database
+
+        Keys are passed as query parameters, so keys containing "__" or
+        looking like lookups or array indexes are always taken literally.
+        """
+        condition = Q()
+        for key in keys:
+            if key in self._attribute_data_snapshot:
+                condition &= Q(Exact(
+                    Func(
+                        F("attribute_data"), Value(key),
+                        template="(%(expressions)s)", arg_joiner=" -> ", output_field=JSONField(),
+                    ),
+                    Cast(Value(self._attribute_data_snapshot[key]), JSONField()),
+                ))
+            else:
+                condition &= ~Q(attribute_data__has_key=key)
+        return condition
+
+    def _get_attribute_data_changes(self):
+        """Expression applying the attribute_data keys changed since tracking
+
+        Returns None when nothing has changed.
+        """
+        serialized = self._serialize_attribute_data()
+        self._attribute_data_written = serialized
+        changed = {
+            key: self.attribute_data[key]
+            for key, value in serialized.items()
+            if self._attribute_data_snapshot.get(key) != value
+        }
+        removed = [key for key in self._attribute_data_snapshot if key not in serialized]
+        if not changed and not removed:
+            return None, None
+
+        expression = F("attribute_data")
+        if removed:
+            expression = Func(
+                expression, Value(removed, output_field=ArrayField(models.TextField())),
+                template="(%(expressions)s)", arg_joiner=" - ", output_field=JSONField(),
+            )
+        if changed:
+            expression = Func(
+                expression, Value(changed, output_field=JSONField(encoder=DjangoJSONEncoder)),
+                template="(%(expressions)s)", arg_joiner=" || ", output_field=JSONField(),
+            )
+        return expression, [*changed, *removed]
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """UPDATE bumping the version, and applying only the changed keys if tracked
+
+        This runs after the pre_save receivers, so their changes to
+        attribute_data are included. A tracked write goes through if the
+        version is still the tracked one, or if no key being written has
+        changed in the database since then.
+        """
+        if self._attribute_data_write is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        expression = keys = None
+        if self._attribute_data_write == "partial":
+            expression, keys = self._get_attribute_data_changes()
+            if expression is None:
+                values = [
+                    value for value in values
+                    if value[0].name not in ("attribute_data", "version")
+                ]
+            else:
+                base_qs = base_qs.filter(
+                    Q(version=self._attribute_data_version) | self._get_unchanged_condition(keys)
+                )
+
+        values = [
+            (field, model, {
+                "attribute_data": value if expression is None else expression,
+                "version": F("version") + 1,
+            }.get(field.name, value))
+            for field, model, value in values
+        ]
+        if super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update):
+            return True
+        if keys:
+            raise AttributeDataConflictException(
+                f"attribute_data of project {pk_val} was changed concurrently"
+            )
+        return False
+
     def update_attribute_data(self, data, confirmed_fields=None, fake=False, attribute_cache=None):
         confirmed_fields = confirmed_fields or []
         attribute_cache = attribute_cache or {}
@@ -295,6 +501,19 @@ class Project(models.Model):
             ).prefetch_related("value_choices")
             attribute_cache.update({attr.identifier: attr for attr in fetched_attributes})
 
+        serializable_attributes = [
+            attribute_cache[identifier] for identifier in data.keys()
+            if identifier in attribute_cache
+            and attribute_cache[identifier].value_type not in [
+                Attribute.TYPE_GEOMETRY, Attribute.TYPE_IMAGE, Attribute.TYPE_FILE
+            ]
+        ]
+        codecs = AttributeCodecSet.compile(serializable_attributes)
+        serialized_data = codecs.encode_many({
+            attribute.identifier: data[attribute.identifier]
+            for attribute in serializable_attributes
+        })
+
         for identifier, value in data.items():
             attribute = attribute_cache.get(identifier)
             if not attribute:
@@ -318,13 +537,13 @@ class Project(models.Model):
                 if not value:
                     self.attribute_data.pop(identifier, None)
             elif attribute.value_type in [Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET]:
-                serialized_value = attribute.serialize_value(value)
+                serialized_value = serialized_data[identifier]
                 if not serialized_value:
                     self.attribute_data.pop(identifier, None)
                 else:
                     self.attribute_data[identifier] = serialized_value
             else:
-                serialized_value = attribute.serialize_value(value)
+                serialized_value = serialized_data[identifier]
 
                 if serialized_value is not None:
                     self.attribute_data[identifier] = serialized_value
@@ -735,6 +954,7 @@ class Project(models.Model):
         return results
 
     # Generate or update schedule for project
+    @span("deadline_calc")
     def update_deadlines(self, user=None, initial=False, preview_attributes={}, confirmed_fields={}, timing_metrics=None, timeline_save=False):
         # DEBUG LOGGING FOR SAVE
         DEBUG_DATES = ['kaavaluonnos_esillaolo_aineiston_maaraaika', 'ehdotus_nahtaville_aineiston_maaraaika']
@@ -756,7 +976,6 @@ class Project(models.Model):
         to_be_deleted = self.deadlines.exclude(deadline__in=deadlines)
 
         for dl in to_be_deleted:
-            self.deadlines.remove(dl)
             dl.delete()
             # Remove from attribute data if the dl is not applicable to the new subtype
             if dl.deadline.attribute and dl.deadline.attribute.identifier in self.attribute_data:
@@ -781,7 +1000,6 @@ class Project(models.Model):
                         self.attribute_data[vis_bool] = True if deadline.deadlinegroup.endswith('1') else False
                 generated_deadlines.append(new_project_deadline)
                 project_deadlines.append(new_project_deadline)
-        self.deadlines.set(project_deadlines)
 
         # K1 = U1 sync: kaynnistysvaihe_alkaa_pvm always equals projektin_kaynnistys_pvm
         # Per timeline_requirements.md line 899: K1's "Generoitu ehdotus" = U1
@@ -863,6 +1081,7 @@ class Project(models.Model):
         
         return project_dls
 
+    @span("deadline_calc")
     def get_preview_deadlines(self, updated_attributes, subtype, confirmed_fields=None, timing_metrics=None):
         log.warning("[DEBUG PREVIEW] get_preview_deadlines() called")
         log.warning(f"[DEBUG PREVIEW] updated_attributes keys: {list(updated_attributes.keys()) if updated_attributes else 'NONE'}")
@@ -1506,20 +1725,6 @@ class Project(models.Model):
 
         return True
 
-    def clear_data_by_data_retention_plan(self, data_retention_plan):
-        updated = False
-        for attribute in Attribute.objects.filter(data_retention_plan=data_retention_plan):
-            current_value = self.attribute_data.get(attribute.identifier, None)
-            if current_value:
-                self.attribute_data[attribute.identifier] = None
-                updated = True
-        if updated:
-            self.save()
-
-    def clear_audit_log_data(self):
-        LogEntry.objects.filter(object_id=str(self.pk)).delete()  # Clears django-admin logs from django_admin_log table
-        ActStreamAction.objects.filter(target_object_id=str(self.pk)).delete()  # Clear audit logs from actstream_action table
-
     def save(self, *args, **kwargs):
         fieldset_attributes = {f for f in FieldSetAttribute.objects.all().select_related("attribute_source", "attribute_target")}
 
@@ -1598,7 +1803,31 @@ class Project(models.Model):
 
         self.vector_column = SearchVector(*list(search_fields))
 
-        super(Project, self).save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if self._state.adding or args or not (
+            update_fields is None or "attribute_data" in update_fields
+        ):
+            super(Project, self).save(*args, **kwargs)
+        else:
+            # Untracked saves rewrite the whole document, the version is
+            # bumped in both cases so that tracked writers notice the write
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "version"]
+            tracked = self._attribute_data_snapshot is not None
+            self._attribute_data_write = "partial" if tracked else "full"
+            self._attribute_data_written = None
+            try:
+                super(Project, self).save(*args, **kwargs)
+            finally:
+                self._attribute_data_write = None
+
+            written = self._attribute_data_written
+            if not tracked or written not in (None, self._attribute_data_snapshot):
+                self.version = Project.objects.filter(pk=self.pk) \
+                    .values_list("version", flat=True).get()
+            if tracked and written is not None:
+                self._attribute_data_snapshot = written
+                self._attribute_data_version = self.version
         if not self.pino_number:
             self.pino_number = str(self.pk).zfill(7)
             self.save()
@@ -1977,9 +2206,32 @@ class ProjectPhaseFieldSetAttributeIndex(models.Model):
         return f"{self.attribute} {self.phase} {self.index}"
 
 
+class ProjectAttributeFileQuerySet(models.QuerySet):
+    def active(self, snapshot=None):
+        """Files that are not archived, or were valid at the given snapshot time"""
+        if snapshot:
+            return self.filter(created_at__lte=snapshot).exclude(archived_at__lte=snapshot)
+        return self.filter(archived_at=None)
+
+    def latest_per_attribute(self, per_fieldset_path=True):
+        """Latest file of each attribute per project using DISTINCT ON
+
+        With per_fieldset_path each fieldset row keeps its own latest file.
+        """
+        distinct_fields = ["attribute__pk", "project__pk"]
+        if per_fieldset_path:
+            distinct_fields = ["fieldset_path_str"] + distinct_fields
+
+        return self \
+            .order_by(*distinct_fields, "-created_at") \
+            .distinct(*distinct_fields)
+
+
 class ProjectAttributeFile(models.Model):
     """Project attribute value that is an file."""
 
+    objects = ProjectAttributeFileQuerySet.as_manager()
+
     attribute = models.ForeignKey(
         Attribute,
         verbose_name=_("attribute"),
@@ -2097,6 +2349,33 @@ class ProjectAttributeMultipolygonGeometry(models.Model):
     )
 
 
+def load_geometry_and_file_values(projects):
+    """Fetch geometry values and the latest file per attribute for projects
+
+    Uses one query for geometries and one for files regardless of the number
+    of attributes. Returns {project_id: {attribute_id: value}}.
+    """
+    project_ids = [getattr(project, "pk", project) for project in projects]
+    values = {project_id: {} for project_id in project_ids}
+
+    geometries = ProjectAttributeMultipolygonGeometry.objects \
+        .filter(project_id__in=project_ids) \
+        .order_by("pk")
+    for geometry in geometries:
+        values[geometry.project_id].setdefault(
+            geometry.attribute_id, geometry.geometry
+        )
+
+    files = ProjectAttributeFile.objects \
+        .filter(project_id__in=project_ids) \
+        .latest_per_attribute(per_fieldset_path=False)
+    for attribute_file in files:
+        values[attribute_file.project_id][attribute_file.attribute_id] = \
+            attribute_file.file
+
+    return values
+
+
 class ProjectDeadline(models.Model):
     deadline = models.ForeignKey(
         Deadline,
@@ -2107,7 +2386,7 @@ class ProjectDeadline(models.Model):
     project = models.ForeignKey(
         Project,
         verbose_name=_("project"),
-        related_name="project_deadlines",
+        related_name="deadlines",
         on_delete=models.CASCADE,
     )
     date = models.DateField(
@@ -2145,7 +2424,8 @@ class ProjectDeadline(models.Model):
         return None
 
     class Meta:
-        unique_together = ("deadline", "project")
+        # Project first so that the index serves the deadlines of a project too
+        unique_together = ("project", "deadline")
         ordering = ("deadline__index",)
 
     def __str__(self):
@@ -39,6 +39,12 @@ class ProjectComment(models.Model):
         verbose_name = _("project comment")
         verbose_name_plural = _("project comments")
         ordering = ("created_at",)
+        indexes = [
+            models.Index(
+                fields=["project", "created_at"],
+                name="projects_pc_project_created",
+            ),
+        ]
 
     def __str__(self):
         return f"Comment {self.project} {self.created_at}"
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import logging
+import threading
+
+from django.core.cache import cache
+
+from projects.cache_namespaces import DEADLINE_STATE, clear_namespace, get_namespace_version
+from projects.helpers import get_schema_version
+
+log = logging.getLogger(__name__)
+
+# Identical previews are typically resent within seconds by the timeline editor
+PREVIEW_CACHE_TIMEOUT = 60
+
+# Per process hit and miss counts
+_metrics = {"hits": 0, "misses": 0}
+_metrics_lock = threading.Lock()
+
+
+def get_deadline_state_version(project_id):
+    """Counter of deadline and project writes of the project"""
+    return get_namespace_version(DEADLINE_STATE, scope=project_id)
+
+
+def bump_deadline_state_versions(project_ids):
+    for project_id in project_ids:
+        clear_namespace(DEADLINE_STATE, scope=project_id)
+
+
+def get_preview_cache_key(project, subtype, attribute_data, confirmed_fields):
+    payload = json.dumps(
+        [attribute_data, sorted(set(confirmed_fields or []))],
+        sort_keys=True,
+        default=str,
+    )
+    return ":".join([
+        "projects.preview_cache",
+        str(project.pk),
+        str(get_deadline_state_version(project.pk)),
+        project.modified_at.isoformat() if project.modified_at else "",
+        str(getattr(subtype, "pk", subtype)),
+        str(get_schema_version()),
+        hashlib.sha1(payload.encode("utf-8")).hexdigest(),
+    ])
+
+
+def _count(metric, timing_metrics):
+    with _metrics_lock:
+        _metrics[metric] += 1
+    if timing_metrics is not None:
+        timing_metrics[f"preview_cache_{metric}"] = \
+            timing_metrics.get(f"preview_cache_{metric}", 0) + 1
+
+
+def get_or_set_preview(project, subtype, attribute_data, confirmed_fields, compute, timing_metrics=None):
+    """Cached result of compute() for the preview of the given payload
+
+    The result must be picklable. Hits and misses are counted in
+    timing_metrics when given.
+    """
+    key = get_preview_cache_key(project, subtype, attribute_data, confirmed_fields)
+    result = cache.get(key)
+    if result is not None:
+        _count("hits", timing_metrics)
+        return result
+
+    _count("misses", timing_metrics)
+    result = compute()
+    cache.set(key, result, PREVIEW_CACHE_TIMEOUT)
+    return result
+
+
+def get_preview_cache_metrics():
+    """Preview cache hit and miss counts of this process"""
+    with _metrics_lock:
+        return dict(_metrics)
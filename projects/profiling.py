@@ -0,0 +1,197 @@
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import time
+import zipfile
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from kaavapino.task_queues import enqueue, get_func_path, get_queue
+from projects.models import CapturedProfile
+
+log = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_KAAVAPINO_PROFILE"
+PROFILE_QUERY_PARAM = "profile"
+TRUTHY = ("1", "true", "True")
+
+# Functions listed in the text summary of a profile
+PROFILE_SUMMARY_LIMIT = 100
+
+
+class QueryLog:
+    """Execute wrapper recording the SQL, parameters and duration of every query"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "alias": context["connection"].alias,
+                "sql": sql,
+                "params": repr(params),
+                "many": many,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
+
+
+class Capture:
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.query_log = QueryLog()
+        self.duration = None
+
+    def build_archive(self):
+        summary = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_SUMMARY_LIMIT)
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as f:
+            # Same format as pstats.Stats.dump_stats, opens in pstats and snakeviz
+            f.writestr("profile.prof", marshal.dumps(stats.stats))
+            f.writestr("profile.txt", summary.getvalue())
+            f.writestr("queries.json", json.dumps(self.query_log.queries, indent=2))
+        return archive.getvalue()
+
+
+@contextmanager
+def capture():
+    """Profile the block with cProfile and log its queries on every connection"""
+    result = Capture()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(result.query_log))
+        result.profiler.enable()
+        try:
+            yield result
+        finally:
+            result.profiler.disable()
+            result.duration = time.perf_counter() - start
+
+
+def save_profile(result, kind, name, user=None):
+    """Store a captured profile and purge the ones past retention"""
+    profile = CapturedProfile(
+        kind=kind,
+        name=name[:255],
+        user=user,
+        duration=result.duration,
+        query_count=len(result.query_log.queries),
+    )
+    filename = f"{timezone.now():%Y%m%d%H%M%S}-{kind}.zip"
+    profile.file.save(filename, ContentFile(result.build_archive()), save=False)
+    profile.save()
+    log.info(f"Captured {kind} profile of {name}: {result.duration:.2f}s, {profile.query_count} queries")
+
+    purge_profiles()
+    return profile
+
+
+def purge_profiles():
+    """Delete profiles older than PROFILE_RETENTION_DAYS and beyond PROFILE_RETENTION_COUNT"""
+    cutoff = timezone.now() - timedelta(days=settings.PROFILE_RETENTION_DAYS)
+    expired = list(CapturedProfile.objects.filter(created_at__lt=cutoff))
+    expired += list(
+        CapturedProfile.objects.filter(created_at__gte=cutoff)
+        .order_by("-created_at")[settings.PROFILE_RETENTION_COUNT:]
+    )
+    for profile in expired:
+        profile.file.delete(save=False)
+        profile.delete()
+    return len(expired)
+
+
+def is_profiling_requested(request):
+    return request.META.get(PROFILE_HEADER) in TRUTHY \
+        or request.GET.get(PROFILE_QUERY_PARAM) in TRUTHY
+
+
+def _is_admin(user):
+    return bool(user and user.is_authenticated and user.has_privilege("admin"))
+
+
+def _authenticate(request):
+    """User of the request authenticated as the API views do, None if anonymous
+
+    The middleware runs before DRF authenticates token and JWT users in the view.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user
+
+    drf_request = Request(request, authenticators=[
+        authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        user = drf_request.user
+    except APIException:
+        return None
+    return user if user is not None and user.is_authenticated else None
+
+
+class ProfilingMiddleware:
+    """Profile requests of admins that ask for it with a header or query parameter
+
+    The user is authenticated before profiling, so that others asking for
+    it do not pay for the profiler.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_profiling_requested(request):
+            return self.get_response(request)
+
+        user = _authenticate(request)
+        if not _is_admin(user):
+            return self.get_response(request)
+
+        with capture() as result:
+            response = self.get_response(request)
+
+        profile = save_profile(
+            result, CapturedProfile.KIND_REQUEST,
+            f"{request.method} {request.get_full_path()}", user,
+        )
+        response["X-Kaavapino-Profile-Id"] = str(profile.pk)
+        return response
+
+
+def run_profiled(func_path, user_id, *args, **kwargs):
+    """Task wrapper running func_path under the profiler"""
+    func = import_string(func_path)
+    user = get_user_model().objects.filter(pk=user_id).first() if user_id else None
+    with capture() as result:
+        value = func(*args, **kwargs)
+    save_profile(result, CapturedProfile.KIND_TASK, func_path, user)
+    return value
+
+
+def async_task_for_request(request, func, *args, **kwargs):
+    """Enqueue func, profiled if an admin asked for it in the request"""
+    if is_profiling_requested(request) and _is_admin(request.user):
+        return enqueue(
+            run_profiled, get_func_path(func), request.user.pk,
+            *args, queue=get_queue(func), **kwargs,
+        )
+    return enqueue(func, *args, **kwargs)
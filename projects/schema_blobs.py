@@ -0,0 +1,128 @@
+import gzip
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, QueryDict
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from projects.helpers import get_schema_version
+from projects.models import ProjectType
+from projects.serializers.projectschema import PROJECT_TYPE_SCHEMA_SERIALIZERS
+
+log = logging.getLogger(__name__)
+
+# Blobs are keyed by schema version, so old ones only need to expire eventually
+SCHEMA_BLOB_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def _normalize_subtypes(subtypes):
+    return ",".join(sorted({
+        subtype.strip() for subtype in (subtypes or "").split(",")
+        if subtype.strip()
+    }))
+
+
+def _get_cache_key(privilege, owner, subtypes):
+    return f"projects.schema_blobs:{get_schema_version()}:{privilege}:{owner}:{subtypes}"
+
+
+def render_project_type_schema(privilege, owner, subtypes=""):
+    """Render the paginated project type schema list response as JSON bytes
+
+    Returns None if the response would not fit on a single page.
+    """
+    serializer_class = PROJECT_TYPE_SCHEMA_SERIALIZERS[(privilege, owner)]
+    project_types = list(ProjectType.objects.all())
+    page_size = settings.REST_FRAMEWORK.get("PAGE_SIZE")
+    if page_size and len(project_types) > page_size:
+        return None
+
+    request = HttpRequest()
+    request.GET = QueryDict(mutable=True)
+    if subtypes:
+        request.GET["subtypes"] = subtypes
+
+    data = serializer_class(
+        project_types, many=True, context={"request": request}
+    ).data
+    return JSONRenderer().render(OrderedDict([
+        ("count", len(project_types)),
+        ("next", None),
+        ("previous", None),
+        ("results", data),
+    ]))
+
+
+def build_project_type_schema_blob(privilege, owner, subtypes=""):
+    subtypes = _normalize_subtypes(subtypes)
+    # Resolve the key before rendering so that a schema change during
+    # rendering leaves the result under the already outdated version
+    cache_key = _get_cache_key(privilege, owner, subtypes)
+    body = render_project_type_schema(privilege, owner, subtypes)
+    if body is None:
+        return None
+
+    blob = {
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=9),
+    }
+    if brotli:
+        blob["br"] = brotli.compress(body, quality=11)
+
+    cache.set(cache_key, blob, SCHEMA_BLOB_TIMEOUT)
+    return blob
+
+
+def get_project_type_schema_blob(privilege, owner, subtypes=""):
+    """Pre-rendered schema response variants keyed by content encoding"""
+    if (privilege, owner) not in PROJECT_TYPE_SCHEMA_SERIALIZERS:
+        return None
+
+    subtypes = _normalize_subtypes(subtypes)
+    blob = cache.get(_get_cache_key(privilege, owner, subtypes))
+    if blob is None:
+        blob = build_project_type_schema_blob(privilege, owner, subtypes)
+    return blob
+
+
+def _get_accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, __, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if not float(params[2:]):
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def get_schema_blob_response(blob, accept_encoding):
+    accepted = _get_accepted_encodings(accept_encoding)
+    encoding = next((
+        encoding for encoding in ("br", "gzip")
+        if encoding in blob and (encoding in accepted or "*" in accepted)
+    ), "identity")
+
+    response = HttpResponse(blob[encoding], content_type="application/json")
+    if encoding != "identity":
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def rebuild_project_type_schema_blobs():
+    for privilege, owner in PROJECT_TYPE_SCHEMA_SERIALIZERS.keys():
+        log.info(f"Rendering project type schema for {privilege} (owner: {owner})")
+        build_project_type_schema_blob(privilege, owner)
@@ -110,3 +110,8 @@ class LastReadTimestampSerializer(serializers.ModelSerializer):
         validated_data["user"] = self.context["request"].user
         validated_data["project"] = self.context.get("parent_instance")
         return super().create(validated_data)
+
+
+class UnreadCommentCountSerializer(serializers.Serializer):
+    project = serializers.IntegerField()
+    unread_count = serializers.IntegerField()
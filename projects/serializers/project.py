@@ -3,8 +3,6 @@ import re
 import logging
 import time
 import numpy as np
-import requests
-from requests.exceptions import Timeout
 from typing import List, NamedTuple, Type
 
 from actstream import action
@@ -20,18 +18,30 @@ from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import extend_schema_field, inline_serializer
 from drf_spectacular.types import OpenApiTypes
 from rest_framework import serializers, status
-from rest_framework.exceptions import ValidationError, NotFound, ParseError
-from rest_framework.response import Response
+from rest_framework.exceptions import APIException, ValidationError, NotFound, ParseError
 from rest_framework.serializers import Serializer
 
+from kaavapino.instrumentation import span
 from projects.actions import verbs
+from projects.cache_namespaces import (
+    DEADLINE_SECTIONS,
+    NAMESPACE_TIMEOUT,
+    PHASE_SCHEMA,
+    SCHEDULES,
+    clear_namespace,
+    get_cache_key,
+)
+from projects.fetch_cache import fetch, json_loader, peek
 from projects.helpers import (
+    GEOSERVER_DATA_TTL,
     get_flat_attribute_data,
+    graph_api_loader,
     set_kaavoitus_api_data_in_attribute_data,
     set_ad_data_in_attribute_data,
     set_automatic_attributes,
 )
 from projects.models import (
+    AttributeDataConflictException,
     Project,
     ProjectSubtype,
     CommonProjectPhase,
@@ -63,13 +73,18 @@ from projects.serializers.document import DocumentTemplateSerializer
 from projects.serializers.section import create_section_serializer
 from projects.serializers.deadline import DeadlineSerializer
 from sitecontent.models import ListViewAttributeColumn
-from users.models import User, PRIVILEGE_LEVELS
+from users.models import User
 from users.serializers import PersonnelSerializer, UserSerializer
-from users.helpers import get_graph_api_access_token
 
 log = logging.getLogger(__name__)
 
 
+class ProjectVersionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _("The project was modified by another user, reload it and try again.")
+    default_code = "version_conflict"
+
+
 class SectionData(NamedTuple):
     section: ProjectPhaseSection
     serializer_class: Type[Serializer]
@@ -392,11 +407,10 @@ class ProjectOnMapOverviewSerializer(serializers.ModelSerializer):
         if not identifier:
             return None
 
-        geoserver_data  = cache.get(f"{settings.KAAVOITUS_API_BASE_URL}/geoserver/v1/suunnittelualue/{identifier}")
-        if geoserver_data and geoserver_data != "error":
-            return geoserver_data
-
-        return None
+        return peek(
+            "geoserver",
+            f"{settings.KAAVOITUS_API_BASE_URL}/geoserver/v1/suunnittelualue/{identifier}",
+        )
 
     @extend_schema_field(OpenApiTypes.STR)
     def get_user_name(self, project):
@@ -428,6 +442,10 @@ class ProjectOnMapOverviewSerializer(serializers.ModelSerializer):
         ]
 
 
+# Annotation with the attribute_data keys shown in the project list
+LIST_ATTRIBUTE_DATA = "list_attribute_data"
+
+
 class ProjectListSerializer(serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
         read_only=False, slug_field="uuid", queryset=get_user_model().objects.all()
@@ -465,6 +483,10 @@ class ProjectListSerializer(serializers.ModelSerializer):
             "priority",
         ]
 
+    @span("serialization")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
     @extend_schema_field(OpenApiTypes.STR)
     def get_user_email(self, project):
         return project.user.email
@@ -494,7 +516,9 @@ class ProjectListSerializer(serializers.ModelSerializer):
         return_data = {}
         attrs = self.context["listview_attribute_columns"] if self.context.__contains__("listview_attribute_columns")\
             else ListViewAttributeColumn.objects.all().select_related("attribute")
-        attribute_data = getattr(project, "attribute_data", {})
+        attribute_data = getattr(project, LIST_ATTRIBUTE_DATA, None)
+        if attribute_data is None:
+            attribute_data = getattr(project, "attribute_data", {})
         for attr in attrs:
             identifier = attr.attribute.identifier
             value = attribute_data.get(identifier)
@@ -519,9 +543,9 @@ class ProjectListSerializer(serializers.ModelSerializer):
         if project.pk in project_schedule_cache:
             return project_schedule_cache[project.pk]
         schedule_data = ProjectDeadlineSerializer(project.deadlines, many=True, allow_null=True, required=False).data
-        schedule_cache = cache.get("serialized_project_schedules", {})
+        schedule_cache = cache.get(get_cache_key(SCHEDULES, "serialized_project_schedules"), {})
         schedule_cache[project.pk] = schedule_data
-        cache.set("serialized_project_schedules", schedule_cache, None)
+        cache.set(get_cache_key(SCHEDULES, "serialized_project_schedules"), schedule_cache, NAMESPACE_TIMEOUT)
         return schedule_data
 
     @extend_schema_field(ProjectPrioritySerializer(many=False))
@@ -624,6 +648,8 @@ class ProjectSerializer(serializers.ModelSerializer):
     onhold = serializers.BooleanField(
         allow_null=True, required=False, read_only=True,
     )
+    # Version the client edited, saving over a newer version is rejected
+    version = serializers.IntegerField(required=False)
     generated_deadline_attributes = serializers.SerializerMethodField()
     deadline_attributes = serializers.SerializerMethodField()
     geoserver_data = serializers.SerializerMethodField()
@@ -665,37 +691,35 @@ class ProjectSerializer(serializers.ModelSerializer):
             "deadline_attributes",
             "geoserver_data",
             "project_type",
+            "version",
             "_metadata",
         ]
         read_only_fields = ["type", "created_at", "modified_at", "project_card_document"]
 
+    @span("serialization")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
     def get_geoserver_data(self, project):  # Data is cached in projects.tasks.refresh_on_map_overview_cache periodically
         identifier = project.attribute_data.get("hankenumero")
         if not identifier:
             return None
 
         url = f"{settings.KAAVOITUS_API_BASE_URL}/geoserver/v1/suunnittelualue/{identifier}"
-        geoserver_data  = cache.get(url)
-        is_inactive = self.instance.modified_at <= timezone.now()-datetime.timedelta(days=7)
-
-        if not geoserver_data or is_inactive:
-            try:
-                response = requests.get(
-                    url,
-                    headers={"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"},
-                )
-                if response.status_code == 200:
-                    geoserver_data = response.json()
-                    cache.set(url, geoserver_data, None)
-                else:
-                    cache.set(url, "error", 3600)
-            except Timeout:
-                pass
-
-        if geoserver_data and geoserver_data != "error":
-            return geoserver_data
-
-        return None
+        # Inactive projects are not refreshed by the task, their data is
+        # refreshed in the background once it is older than GEOSERVER_DATA_TTL
+        return fetch(
+            "geoserver",
+            url,
+            json_loader(
+                url,
+                headers={"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"},
+                timeout=15,
+                timeout_ttl=3600,
+            ),
+            ttl=GEOSERVER_DATA_TTL,
+            error_ttl=3600,
+        )
 
     def _get_snapshot_date(self, project):
         query_params = getattr(self.context["request"], "GET", {})
@@ -833,7 +857,7 @@ class ProjectSerializer(serializers.ModelSerializer):
 
     @extend_schema_field(ProjectDeadlineSerializer(many=True))
     def get_deadlines(self, project):
-        project_schedule_cache = cache.get("serialized_project_schedules", {})
+        project_schedule_cache = cache.get(get_cache_key(SCHEDULES, "serialized_project_schedules"), {})
         deadlines = ProjectDeadline.objects.filter(project=project, deadline__subtype=project.subtype)\
             .select_related("deadline", "project")\
             .prefetch_related("project__subtype", "project__deadlines", "project__deadlines__deadline",
@@ -855,7 +879,7 @@ class ProjectSerializer(serializers.ModelSerializer):
             ).data
 
         project_schedule_cache[project.pk] = schedule
-        cache.set("serialized_project_schedules", project_schedule_cache, None)
+        cache.set(get_cache_key(SCHEDULES, "serialized_project_schedules"), project_schedule_cache, NAMESPACE_TIMEOUT)
         return schedule
 
     @extend_schema_field(serializers.ListSerializer(child=serializers.CharField()))
@@ -894,28 +918,12 @@ class ProjectSerializer(serializers.ModelSerializer):
 
     def _set_file_attributes(self, attribute_data, project, snapshot):
         request = self.context["request"]
-        if snapshot:
-            attribute_files = ProjectAttributeFile.objects \
-                .filter(project=project, created_at__lte=snapshot) \
-                .exclude(archived_at__lte=snapshot) \
-                .order_by(
-                    "fieldset_path_str",
-                    "attribute__pk",
-                    "project__pk",
-                    "-created_at",
-                ) \
-                .distinct("fieldset_path_str", "attribute__pk", "project__pk")
-        else:
-            attribute_files = ProjectAttributeFile.objects \
-                .filter(project=project, archived_at=None) \
-                .prefetch_related("attribute", "fieldset_path_locations") \
-                .order_by(
-                    "fieldset_path_str",
-                    "attribute__pk",
-                    "project__pk",
-                    "-created_at",
-                ) \
-                .distinct("fieldset_path_str", "attribute__pk", "project__pk")
+        attribute_files = ProjectAttributeFile.objects \
+            .filter(project=project) \
+            .active(snapshot) \
+            .select_related("attribute") \
+            .prefetch_related("fieldset_path_locations__parent_fieldset") \
+            .latest_per_attribute()
 
         # Add file attributes to the attribute data
         # File values are represented as absolute URLs
@@ -1076,23 +1084,11 @@ class ProjectSerializer(serializers.ModelSerializer):
 
         for id in set(ids):
             url = f"{settings.GRAPH_API_BASE_URL}/v1.0/users/{id}"
-            personnel_data = cache.get(url)
+            personnel_data = fetch(
+                "graph_users", url, graph_api_loader(url), ttl=28800, error_ttl=300,
+            )
             if not personnel_data:
-                token = get_graph_api_access_token()
-                if not token:
-                    return Response(
-                        "Cannot get access token",
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    )
-                response = requests.get(
-                    url, headers={"Authorization": f"Bearer {token}"}
-                )
-
-                if not response:
-                    continue
-
-                personnel_data = response.json()
-                cache.set(url, personnel_data, 28800)
+                continue
 
             data = PersonnelSerializer(personnel_data).data
             return_values.append({"id": id, "name": data["name"]})
@@ -1368,6 +1364,7 @@ class ProjectSerializer(serializers.ModelSerializer):
             sections.append(section_data)
         return sections
 
+    @span("validation")
     def validate(self, attrs):
         # DEADLINE_INTEGRITY_RULES: Do NOT clear date fields when vis_bool=False.
         # Visibility controls UI display only, not data existence.
@@ -1567,6 +1564,33 @@ class ProjectSerializer(serializers.ModelSerializer):
             for attribute in Attribute.objects.filter(identifier__in=attribute_data.keys())
         }
         attribute_cache.update(attribute_objects)
+
+        # Deadlines of cleared values and image fields of fieldsets with
+        # deleted rows, loaded with one query each instead of per value
+        deadlines_by_attribute = {}
+        if self.instance:
+            cleared_attributes = [
+                attribute for identifier, attribute in attribute_objects.items()
+                if attribute_data.get(identifier) is None
+            ]
+            if cleared_attributes:
+                for deadline in Deadline.objects.filter(
+                    attribute__in=cleared_attributes, subtype=self.instance.subtype,
+                ):
+                    deadlines_by_attribute.setdefault(deadline.attribute_id, []).append(deadline)
+
+        image_fieldset_attributes = {}
+        fieldset_sources = [
+            attribute for identifier, attribute in attribute_objects.items()
+            if attribute.value_type == Attribute.TYPE_FIELDSET and attribute_data.get(identifier)
+        ]
+        if fieldset_sources:
+            for f_attr in FieldSetAttribute.objects.filter(
+                attribute_source__in=fieldset_sources,
+                attribute_target__value_type=Attribute.TYPE_IMAGE,
+            ).select_related("attribute_target"):
+                image_fieldset_attributes.setdefault(f_attr.attribute_source_id, []).append(f_attr)
+
         for attribute_identifier, value in attribute_data.items():
             try:
                 attribute = attribute_objects.get(attribute_identifier)
@@ -1582,11 +1606,7 @@ class ProjectSerializer(serializers.ModelSerializer):
                         old_value = self.instance.attribute_data.get(attribute_identifier, None)
                         if not old_value or not old_value[index] or old_value[index]["_deleted"]:
                             continue
-                        fieldset_attributes = FieldSetAttribute.objects.filter(
-                            attribute_source=attribute,
-                            attribute_target__value_type=Attribute.TYPE_IMAGE
-                        )
-                        for f_attr in fieldset_attributes:
+                        for f_attr in image_fieldset_attributes.get(attribute.id, []):
                             fieldset_path_str = f'{attribute_identifier}[{index}].{f_attr.attribute_target.identifier}'
                             # Defer DB write until save()
                             fieldset_files_to_archive = self.context.setdefault('pending_fieldset_files_to_archive', [])
@@ -1598,13 +1618,12 @@ class ProjectSerializer(serializers.ModelSerializer):
 
                 if value is None:
                     # Defer deadline deletion until save()
-                    try:
-                        deadline = Deadline.objects.get(attribute=attribute, subtype=self.instance.subtype)
+                    deadlines = deadlines_by_attribute.get(attribute.id, [])
+                    # Only an unambiguous deadline is deleted
+                    if len(deadlines) == 1:
                         # Store for deletion during update(), not during validation
                         pending_deadline_deletions = self.context.setdefault('pending_deadline_deletions', [])
-                        pending_deadline_deletions.append({'deadline': deadline, 'project': self.instance})
-                    except Exception:
-                        pass
+                        pending_deadline_deletions.append({'deadline': deadlines[0], 'project': self.instance})
 
 
 
@@ -1934,11 +1953,14 @@ class ProjectSerializer(serializers.ModelSerializer):
 
         return user
 
+    @span("save")
     def create(self, validated_data: dict) -> Project:
         validated_data["phase"] = ProjectPhase.objects.filter(
             project_subtype=validated_data["subtype"]
         ).first()
 
+        validated_data.pop("version", None)
+
         with transaction.atomic():
             self.context['should_update_deadlines'] = True
             attribute_data = validated_data.pop("attribute_data", {})
@@ -1992,7 +2014,19 @@ class ProjectSerializer(serializers.ModelSerializer):
         except:
             pass
 
+    @span("save")
     def update(self, instance: Project, validated_data: dict) -> Project:
+        version = validated_data.pop("version", None)
+        if version is not None and version != instance.version:
+            raise ProjectVersionConflict()
+
+        try:
+            return self._update(instance, validated_data)
+        except AttributeDataConflictException as exc:
+            log.info(f"Rejected project update: {exc}")
+            raise ProjectVersionConflict()
+
+    def _update(self, instance: Project, validated_data: dict) -> Project:
         attribute_data = validated_data.pop("attribute_data", {})
         
         # DEBUG: Log what attribute_data is being sent during save
@@ -2024,11 +2058,9 @@ class ProjectSerializer(serializers.ModelSerializer):
 
         if subtype_changed or draft_principles_changed:
             #  Clear project from cache
-            for owner in ['True', 'False']:
-                for privilege, role in PRIVILEGE_LEVELS:
-                    cache.delete(f'phase_schema:{privilege}:{owner}:{instance.pk if instance else None}')
-                    if draft_principles_changed:
-                        cache.delete(f'deadline_sections:{privilege}:{owner}:{instance.pk if instance else None}')
+            clear_namespace(PHASE_SCHEMA, scope=instance.pk)
+            if draft_principles_changed:
+                clear_namespace(DEADLINE_SECTIONS, scope=instance.pk)
 
         should_update_deadlines = self._get_should_update_deadlines(
             subtype_changed or draft_principles_changed, instance, attribute_data,
@@ -10,6 +10,13 @@ from rest_framework import serializers
 from datetime import datetime
 import jinja2
 
+from projects.cache_namespaces import (
+    DEADLINE_SECTIONS,
+    NAMESPACE_TIMEOUT,
+    PHASE_SCHEMA,
+    SECTION_FILTERS,
+    get_cache_key,
+)
 from projects.models import (
     Attribute,
     AttributeValueChoice,
@@ -20,7 +27,7 @@ from projects.models import (
     DeadlineDistance,
     Deadline,
 )
-from projects.models.attribute import AttributeLock, AttributeCategorization
+from projects.models.attribute import AttributeCategorization
 from projects.models.project import (
     PhaseAttributeMatrixCell,
     ProjectFloorAreaSectionAttributeMatrixCell,
@@ -137,59 +144,17 @@ class SimpleAttributeSerializer(serializers.Serializer):
     field_subroles = serializers.CharField()
 
 
-class AttributeLockSerializer(serializers.Serializer):
-
-    project_name = serializers.SerializerMethodField()
-    attribute_identifier = serializers.SerializerMethodField()
-    fieldset_attribute_identifier = serializers.SerializerMethodField()
-    fieldset_attribute_index = serializers.IntegerField()
-    field_identifier = serializers.SerializerMethodField()
-    field_data = serializers.SerializerMethodField()
-    user_name = serializers.SerializerMethodField()
-    user_email = serializers.SerializerMethodField()
-    owner = serializers.SerializerMethodField()
-
-    def get_project_name(self, attribute_lock):
-        return attribute_lock.project.name
-
-    def get_attribute_identifier(self, attribute_lock):
-        return attribute_lock.attribute.identifier \
-            if attribute_lock.attribute else None
-
-    def get_fieldset_attribute_identifier(self, attribute_lock):
-        return attribute_lock.fieldset_attribute.identifier \
-            if attribute_lock.fieldset_attribute else None
-
-    def get_field_identifier(self, attribute_lock):
-        if attribute_lock.fieldset_attribute is not None and attribute_lock.fieldset_attribute_index is not None:
-            return f'{attribute_lock.fieldset_attribute.identifier}' \
-                   f'[{attribute_lock.fieldset_attribute_index}]'
-        return attribute_lock.attribute.identifier
-
-    def get_field_data(self, attribute_lock):
-        try:
-            attribute_lock_data = self.context["attribute_lock_data"]
-            if attribute_lock_data.get("fieldset_attribute_identifier") is not None:
-                f_data = attribute_lock.project.attribute_data[attribute_lock_data.get("fieldset_attribute_identifier")]
-                if f_data and isinstance(f_data, list) and len(f_data) > 0:
-                    return f_data[int(attribute_lock_data.get("fieldset_attribute_index"))]
-            else:
-                return attribute_lock.project.attribute_data[attribute_lock_data.get("attribute_identifier")]
-        except KeyError:  # Attribute doesn't exist in projects attribute_data
-            pass
-        return None
-
-    def get_user_name(self, attribute_lock):
-        return f'{attribute_lock.user.first_name} {attribute_lock.user.last_name}'
-
-    def get_user_email(self, attribute_lock):
-        return attribute_lock.user.email
-
-    def get_owner(self, attribute_lock):
-        return self.context["request"].user == attribute_lock.user
-
-    class Meta:
-        model = AttributeLock
+class AttributeLeaseSerializer(serializers.Serializer):
+    project_name = serializers.CharField()
+    attribute_identifier = serializers.CharField(allow_null=True)
+    fieldset_attribute_identifier = serializers.CharField(allow_null=True)
+    fieldset_attribute_index = serializers.IntegerField(allow_null=True)
+    field_identifier = serializers.CharField()
+    field_data = serializers.JSONField(allow_null=True)
+    user_name = serializers.CharField()
+    user_email = serializers.CharField()
+    timestamp = serializers.DateTimeField()
+    owner = serializers.BooleanField()
 
 
 class AttributeSchemaSerializer(serializers.Serializer):
@@ -912,7 +877,7 @@ class ProjectSubTypeSchemaSerializer(serializers.Serializer):
 
         privilege = self.context['privilege']
         owner = self.context['owner']
-        cache_key = f'phase_schema:{privilege}:{owner}:{project.pk if project else None}'
+        cache_key = get_cache_key(PHASE_SCHEMA, privilege, owner, scope=project.pk)
         phase_schema_serializer = cache.get(cache_key)
 
         if not phase_schema_serializer:
@@ -921,7 +886,7 @@ class ProjectSubTypeSchemaSerializer(serializers.Serializer):
                 many=True,
                 context=self.context,
             ).data
-            cache.set(cache_key, phase_schema_serializer, None)
+            cache.set(cache_key, phase_schema_serializer, NAMESPACE_TIMEOUT)
 
         return phase_schema_serializer
 
@@ -938,7 +903,7 @@ class ProjectSubTypeSchemaSerializer(serializers.Serializer):
 
         privilege = self.context['privilege']
         owner = self.context['owner']
-        cache_key = f'deadline_sections:{privilege}:{owner}:{project.pk if project else None}'
+        cache_key = get_cache_key(DEADLINE_SECTIONS, privilege, owner, scope=project.pk)
         phase_deadline_sections_serializer = cache.get(cache_key)
 
         if not phase_deadline_sections_serializer:
@@ -947,7 +912,7 @@ class ProjectSubTypeSchemaSerializer(serializers.Serializer):
                 many=True,
                 context=self.context,
             ).data
-            cache.set(cache_key, phase_deadline_sections_serializer, None)
+            cache.set(cache_key, phase_deadline_sections_serializer, NAMESPACE_TIMEOUT)
 
         return phase_deadline_sections_serializer
 
@@ -967,9 +932,12 @@ class ProjectSubTypeSchemaSerializer(serializers.Serializer):
         except (ValueError, TypeError, Project.DoesNotExist):
             project = None
 
-        filters_cache = cache.get("project_phase_section_filters", {})
+        cache_key = get_cache_key(SECTION_FILTERS, "project_phase_section_filters")
+        filters_cache = cache.get(cache_key, {})
+        # The generic schema has no project, its filters cover every phase of the subtype
+        filters_key = (instance.pk, project.pk if project else None)
 
-        if not filters_cache.get(project.name):
+        if not filters_cache.get(filters_key):
             attributes = set()
 
             for phase in instance.get_phases(project):
@@ -988,10 +956,10 @@ class ProjectSubTypeSchemaSerializer(serializers.Serializer):
                 roles.update(set(attr.field_roles.split(";")) if attr.field_roles and "{%" not in attr.field_roles else ())
                 subroles.update(set(attr.field_subroles.split(";")) if attr.field_subroles and "{%" not in attr.field_subroles else ())
 
-            filters_cache[project.name] = {"roles": roles, "subroles": subroles}
-            cache.set("project_phase_section_filters", filters_cache, 60 * 60 * 6)  # 6 hours
+            filters_cache[filters_key] = {"roles": roles, "subroles": subroles}
+            cache.set(cache_key, filters_cache, 60 * 60 * 6)  # 6 hours
 
-        return filters_cache[project.name]
+        return filters_cache[filters_key]
 
     class Meta:
         list_serializer_class = ProjectSubtypeListFilterSerializer
@@ -1046,6 +1014,16 @@ AdminOwnerProjectTypeSchemaSerializer = create_project_type_schema_serializer("a
 CreateOwnerProjectTypeSchemaSerializer = create_project_type_schema_serializer("create", True)
 EditOwnerProjectTypeSchemaSerializer = create_project_type_schema_serializer("edit", True)
 
+PROJECT_TYPE_SCHEMA_SERIALIZERS = {
+    ("admin", False): AdminProjectTypeSchemaSerializer,
+    ("create", False): CreateProjectTypeSchemaSerializer,
+    ("edit", False): EditProjectTypeSchemaSerializer,
+    ("browse", False): BrowseProjectTypeSchemaSerializer,
+    ("admin", True): AdminOwnerProjectTypeSchemaSerializer,
+    ("create", True): CreateOwnerProjectTypeSchemaSerializer,
+    ("edit", True): EditOwnerProjectTypeSchemaSerializer,
+}
+
 class OwnerProjectTypeSchemaSerializer(serializers.Serializer):
     subtypes = serializers.SerializerMethodField()
     type_name = serializers.CharField(source="name")
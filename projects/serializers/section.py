@@ -1,7 +1,7 @@
-import copy
 import datetime
 import logging
 import re
+import threading
 
 from django.utils import formats, translation
 from django.utils.translation import gettext_lazy as _
@@ -9,6 +9,7 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework_gis.fields import GeometryField
 
+from projects.helpers import get_schema_version
 from projects.models import (
     Attribute,
     Project,
@@ -48,6 +49,15 @@ FIELD_TYPES = {
 
 format_code = formats.get_format("SHORT_DATE_FORMAT", lang=translation.get_language())
 FieldData = namedtuple("FieldData", ["field_class", "field_arguments"])
+CompiledField = namedtuple(
+    "CompiledField",
+    ["attribute", "field_class", "field_arguments", "child_class", "has_deadline", "children"],
+)
+CompiledSectionAttribute = namedtuple("CompiledSectionAttribute", ["identifier", "relies_on", "field"])
+
+# Compiled fields by section, for the schema version they were compiled for
+_compiled_sections = {"version": None, "sections": {}}
+_compiled_sections_lock = threading.Lock()
 
 
 def get_rich_text_validator(attribute):
@@ -190,30 +200,20 @@ def get_deadline_validator(attribute, subtype, preview, is_fake_request=False):
 
     return validate
 
-def create_attribute_field_data(attribute, validation, project, preview, is_fake_request=False):
-    """Create data for initializing attribute field serializer."""
+def compile_attribute_field(attribute):
+    """Field class and the request independent arguments of an attribute's field"""
     field_arguments = {}
     field_class = FIELD_TYPES.get(attribute.value_type, None)
+    child_class = None
 
     field_arguments["validators"] = []
 
     if attribute.value_type in [Attribute.TYPE_RICH_TEXT, Attribute.TYPE_RICH_TEXT_SHORT]:
         field_arguments["validators"] += [get_rich_text_validator(attribute)]
 
-    if attribute.unique:
-        field_arguments["validators"] += [get_unique_validator(attribute, project.pk)]
-
     if attribute.validation_regex:
         field_arguments["validators"] += [get_regex_validator(attribute)]
 
-    if attribute.deadline.exists():
-        field_arguments["validators"] += [get_deadline_validator(
-            attribute,
-            project.phase.project_subtype,
-            preview,
-            is_fake_request=is_fake_request,
-        )]
-
     if attribute.value_type == Attribute.TYPE_CHOICE:
         choices = attribute.value_choices.all()
         field_class = serializers.SlugRelatedField
@@ -243,44 +243,158 @@ def create_attribute_field_data(attribute, validation, project, preview, is_fake
         field_arguments.pop("allow_null")
 
     if attribute.multiple_choice and attribute.value_type != Attribute.TYPE_CHOICE:
-        if field_class:
-            field_arguments["child"] = field_class()
+        child_class = field_class
         field_class = serializers.ListField
 
-    return FieldData(field_class, field_arguments)
+    return CompiledField(
+        attribute,
+        field_class,
+        field_arguments,
+        child_class,
+        attribute.deadline.exists(),
+        None,
+    )
 
 
-def create_fieldset_field_data(attribute, validation, project, preview, is_fake_request=False):
-    """Dynamically create a serializer for a fieldset type Attribute instance."""
-    serializer_fields = {}
-    field_arguments = {}
-
-    if attribute.multiple_choice:
-        field_arguments["many"] = True
-    
+def compile_fieldset_field(attribute):
+    """Compiled fields of a fieldset type Attribute instance's children"""
+    children = []
     for attr in (
         attribute.fieldset_attributes
         .order_by("fieldset_attribute_source")
         .prefetch_related("deadline")
     ):
-        field_data = create_attribute_field_data(attr, validation, project, preview, is_fake_request=is_fake_request)
-        if not field_data.field_class:
+        compiled = compile_attribute_field(attr)
+        if not compiled.field_class:
             # TODO: Handle this by failing instead of continuing
             continue
+        children.append(compiled)
 
-        serializer_field = field_data.field_class(**field_data.field_arguments)
-        serializer_fields[attr.identifier] = serializer_field
+    field_arguments = {"required": False}
+    if attribute.multiple_choice:
+        field_arguments["many"] = True
+
+    return CompiledField(attribute, None, field_arguments, None, False, children)
+
+
+def bind_field_data(compiled, project, preview, is_fake_request=False):
+    """Add the validators depending on the request to a compiled field"""
+    if compiled.children is not None:
+        serializer_fields = {}
+        for child in compiled.children:
+            field_data = bind_field_data(child, project, preview, is_fake_request)
+            serializer_fields[child.attribute.identifier] = \
+                field_data.field_class(**field_data.field_arguments)
+
+        serializer_fields["_deleted"] = serializers.BooleanField(
+            required=False,
+            default=False,
+        )
+
+        serializer = type("FieldSetSerializer", (serializers.Serializer,), {})
+        serializer._declared_fields = serializer_fields
+
+        return FieldData(serializer, dict(compiled.field_arguments))
+
+    attribute = compiled.attribute
+    field_arguments = dict(compiled.field_arguments)
+    field_arguments["validators"] = list(field_arguments["validators"])
+
+    if attribute.unique:
+        field_arguments["validators"] += [get_unique_validator(attribute, project.pk)]
+
+    if compiled.has_deadline:
+        field_arguments["validators"] += [get_deadline_validator(
+            attribute,
+            project.phase.project_subtype,
+            preview,
+            is_fake_request=is_fake_request,
+        )]
+
+    if compiled.child_class:
+        field_arguments["child"] = compiled.child_class()
 
-    serializer_fields["_deleted"] = serializers.BooleanField(
-        required=False,
-        default=False,
+    return FieldData(compiled.field_class, field_arguments)
+
+
+def create_attribute_field_data(attribute, validation, project, preview, is_fake_request=False):
+    """Create data for initializing attribute field serializer."""
+    return bind_field_data(
+        compile_attribute_field(attribute), project, preview, is_fake_request,
+    )
+
+
+def create_fieldset_field_data(attribute, validation, project, preview, is_fake_request=False):
+    """Dynamically create a serializer for a fieldset type Attribute instance."""
+    return bind_field_data(
+        compile_fieldset_field(attribute), project, preview, is_fake_request,
     )
-    field_arguments["required"] = False
 
-    serializer = type("FieldSetSerializer", (serializers.Serializer,), {})
-    serializer._declared_fields = serializer_fields
 
-    return FieldData(serializer, field_arguments)
+def compile_section(section):
+    """Compiled fields of a section's attributes in order, None for unknown sections"""
+    if isinstance(section, ProjectPhaseSection):
+        section_attributes = (
+            section.projectphasesectionattribute_set
+            .order_by("index")
+            .select_related("attribute", "relies_on__attribute")
+            .prefetch_related("attribute__deadline")
+        )
+    elif isinstance(section, ProjectFloorAreaSection):
+        section_attributes = (
+            section.projectfloorareasectionattribute_set
+            .order_by("index")
+            .select_related("attribute", "relies_on__attribute")
+            .prefetch_related("attribute__deadline")
+        )
+    elif isinstance(section, ProjectPhaseDeadlineSection):
+        section_attributes = (
+            section.projectphasedeadlinesectionattribute_set.all()
+            .select_related("attribute")
+            .prefetch_related("attribute__deadline")
+        )
+    else:
+        return None
+
+    compiled_attributes = []
+    for section_attribute in section_attributes:
+        attribute = section_attribute.attribute
+        if attribute.value_type in [Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET]:
+            compiled = compile_fieldset_field(attribute)
+        else:
+            compiled = compile_attribute_field(attribute)
+
+            if not compiled.field_class:
+                # TODO: Handle this by failing instead of continuing
+                continue
+
+        relies_on = getattr(section_attribute, "relies_on", None)
+        compiled_attributes.append(CompiledSectionAttribute(
+            attribute.identifier,
+            relies_on.attribute.identifier if relies_on else None,
+            compiled,
+        ))
+
+    return compiled_attributes
+
+
+def get_compiled_section(section):
+    """Compiled fields of the section, reused until the schema version changes"""
+    version = get_schema_version()
+    key = (type(section).__name__, section.pk)
+    with _compiled_sections_lock:
+        if _compiled_sections["version"] != version:
+            _compiled_sections["version"] = version
+            _compiled_sections["sections"] = {}
+        compiled = _compiled_sections["sections"].get(key)
+
+    if compiled is None:
+        compiled = compile_section(section)
+        with _compiled_sections_lock:
+            if _compiled_sections["version"] == version:
+                _compiled_sections["sections"][key] = compiled
+
+    return compiled
 
 
 def create_section_serializer(
@@ -299,6 +413,10 @@ def create_section_serializer(
     as the serialization not only relies on the section instance but
     also on the input data field values and their relationship with
     other fields values.
+
+    The fields of the section are compiled once per schema version,
+    only the relies_on filtering and request dependent validators are
+    applied per request.
     """
     request = context.get("request", None)
     is_fake_request = getattr(request, "_fake", False) if request else False
@@ -315,55 +433,22 @@ def create_section_serializer(
         if isinstance(request_attribute_data, Mapping) and request_attribute_data:
             payload_keys = set(request_attribute_data.keys())
 
-    if isinstance(section, ProjectPhaseSection):
-        section_attributes = [
-            section_attribute.attribute
-            for section_attribute
-            in (
-                section.projectphasesectionattribute_set
-                .order_by("index")
-                .select_related("attribute")
-                .prefetch_related("attribute__deadline")
-            )
-            if is_relevant_attribute(section_attribute, attribute_data)
-            and (payload_keys is None or section_attribute.attribute.identifier in payload_keys)
-        ]
-    elif isinstance(section, ProjectFloorAreaSection):
-        section_attributes = [
-            section_attribute.attribute
-            for section_attribute
-            in section.projectfloorareasectionattribute_set.order_by("index")
-            if is_relevant_attribute(section_attribute, attribute_data)
-            and (payload_keys is None or section_attribute.attribute.identifier in payload_keys)
-        ]
-    elif isinstance(section, ProjectPhaseDeadlineSection):
-        section_attributes = [
-            section_attribute.attribute
-            for section_attribute
-            in section.projectphasedeadlinesectionattribute_set.all()
-            .select_related("attribute").prefetch_related("attribute__deadline")
-            if (payload_keys is None or section_attribute.attribute.identifier in payload_keys)
-        ]
-    else:
+    compiled_section = get_compiled_section(section)
+    if compiled_section is None:
         return None
 
     serializer_fields = {}
-    for attribute in section_attributes:
-        if attribute.value_type in [Attribute.TYPE_FIELDSET, Attribute.TYPE_INFO_FIELDSET]:
-            field_data = create_fieldset_field_data(
-                attribute, validation, project, preview, is_fake_request=is_fake_request,
-            )
-        else:
-            field_data = create_attribute_field_data(
-                attribute, validation, project, preview, is_fake_request=is_fake_request,
-            )
-
-            if not field_data.field_class:
-                # TODO: Handle this by failing instead of continuing
-                continue
+    for compiled in compiled_section:
+        if compiled.relies_on and not attribute_data.get(compiled.relies_on):
+            continue
+        if payload_keys is not None and compiled.identifier not in payload_keys:
+            continue
 
+        field_data = bind_field_data(
+            compiled.field, project, preview, is_fake_request=is_fake_request,
+        )
         serializer_field = field_data.field_class(**field_data.field_arguments)
-        serializer_fields[attribute.identifier] = serializer_field
+        serializer_fields[compiled.identifier] = serializer_field
 
     serializer = type("SectionSerializer", (serializers.Serializer,), {})
     serializer._declared_fields = serializer_fields
@@ -385,8 +470,9 @@ def get_attribute_data(request, project=None) -> dict:
 
     # Include any existing project attribute data
     # If we do not copy here then we will override the instance data
-    # when doing updates.
-    attribute_data = copy.deepcopy(getattr(project, "attribute_data", {}))
+    # when doing updates. Only top level keys are replaced, a shallow
+    # copy is enough.
+    attribute_data = dict(getattr(project, "attribute_data", None) or {})
 
     # Extract all attribute data that exists in the request
     request_attribute_data = request.data.get("attribute_data", {})
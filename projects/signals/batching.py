@@ -0,0 +1,210 @@
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django_redis import get_redis_connection
+
+log = logging.getLogger(__name__)
+
+# Redis hash of suppressed invalidation counts by key, shared by all processes
+SUPPRESSED_METRICS_KEY = cache.make_key("projects.invalidation_metrics.suppressed")
+
+_state = threading.local()
+
+# Per process counts of invalidation requests and actual flushes by key
+_metrics = defaultdict(lambda: {"requested": 0, "flushed": 0})
+_metrics_lock = threading.Lock()
+
+
+class PendingInvalidations:
+    """Invalidations collected during a transaction or a batch, flushed once per key"""
+
+    def __init__(self):
+        self.actions = {}
+        self.requests = defaultdict(int)
+
+    def add(self, key, func, items=()):
+        if key not in self.actions:
+            self.actions[key] = (func, set())
+        self.actions[key][1].update(items)
+        self.requests[key] += 1
+
+    def flush(self):
+        actions, self.actions = self.actions, {}
+        requests, self.requests = self.requests, defaultdict(int)
+        for key, (func, items) in actions.items():
+            _run(key, func, items)
+
+        suppressed = {
+            key: count - 1 for key, count in requests.items() if count > 1
+        }
+        if suppressed:
+            _record_suppressed(suppressed)
+
+
+def _record_suppressed(suppressed):
+    log.debug(f"Coalesced invalidations, suppressed {suppressed}")
+    try:
+        redis = get_redis_connection("default")
+        pipeline = redis.pipeline()
+        for key, count in suppressed.items():
+            pipeline.hincrby(SUPPRESSED_METRICS_KEY, key, count)
+        pipeline.execute()
+    except Exception as exc:
+        log.warning(f"Failed to record suppressed invalidations: {exc}")
+
+
+def _count(key, metric):
+    with _metrics_lock:
+        _metrics[key][metric] += 1
+
+
+def _run(key, func, items):
+    _count(key, "flushed")
+    try:
+        if items:
+            func(sorted(items, key=str))
+        else:
+            func()
+    except Exception as exc:
+        log.error(f"Flushing invalidation {key} failed: {exc}")
+
+
+def _get_transaction_pending():
+    """Pending invalidations of the current transaction, registered with on_commit"""
+    pending = getattr(_state, "transaction_pending", None)
+
+    # A rolled back transaction drops the callback and its pending invalidations
+    if pending is None or not any(
+        callback[1] == pending.flush for callback in connection.run_on_commit
+    ):
+        pending = PendingInvalidations()
+        _state.transaction_pending = pending
+        transaction.on_commit(pending.flush)
+
+    return pending
+
+
+def invalidate(key, func, items=()):
+    """Request an invalidation identified by key
+
+    Outside transactions and batches func runs right away. Otherwise
+    requests are coalesced by key and func runs once after commit, called
+    with the union of the requested items if any were given.
+    """
+    _count(key, "requested")
+
+    pending = getattr(_state, "batch", None)
+    if pending is None and connection.in_atomic_block:
+        pending = _get_transaction_pending()
+
+    if pending is None:
+        _run(key, func, set(items))
+    else:
+        pending.add(key, func, items)
+
+
+@contextmanager
+def invalidation_batch():
+    """Collect invalidations in the block and flush them once
+
+    Flushing happens when the block exits, or when the surrounding
+    transaction commits. Nested batches join the outermost one.
+    """
+    if getattr(_state, "batch", None) is not None:
+        yield _state.batch
+        return
+
+    _state.batch = PendingInvalidations()
+    try:
+        yield _state.batch
+    finally:
+        pending, _state.batch = _state.batch, None
+
+    if pending.actions:
+        transaction.on_commit(pending.flush)
+
+
+def get_invalidation_metrics():
+    """Requested, flushed and suppressed invalidation counts of this process"""
+    with _metrics_lock:
+        return {
+            key: {
+                **counts,
+                "suppressed": counts["requested"] - counts["flushed"],
+            }
+            for key, counts in _metrics.items()
+        }
+
+
+def get_suppressed_invalidation_totals():
+    """Suppressed invalidation counts by key summed over all processes"""
+    return {
+        key.decode("utf-8"): int(count)
+        for key, count in get_redis_connection("default").hgetall(
+            SUPPRESSED_METRICS_KEY
+        ).items()
+    }
+
+
+class SchemaChangeReport:
+    """Row counts per model and change type collected during a schema change batch"""
+
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+
+    def __init__(self):
+        self.changes = defaultdict(lambda: defaultdict(int))
+
+    def record(self, model, change, count=1):
+        if count:
+            self.changes[model._meta.label][change] += count
+
+    def has_changes(self, *models):
+        if not models:
+            return bool(self.changes)
+        return any(model._meta.label in self.changes for model in models)
+
+    def as_dict(self):
+        return {
+            label: dict(changes)
+            for label, changes in sorted(self.changes.items())
+        }
+
+    def __str__(self):
+        if not self.changes:
+            return "No changes"
+
+        return "\n".join(
+            f"{label}: " + ", ".join(
+                f"{change} {count}" for change, count in sorted(changes.items())
+            )
+            for label, changes in self.as_dict().items()
+        )
+
+
+def get_schema_change_batch():
+    """The report of the active schema change batch, None outside one"""
+    return getattr(_state, "report", None)
+
+
+@contextmanager
+def schema_change_batch(report=None):
+    """Invalidation batch that also reports the schema rows changed in it"""
+    outer = get_schema_change_batch()
+    if outer is not None:
+        yield outer
+        return
+
+    _state.report = report if report is not None else SchemaChangeReport()
+    try:
+        with invalidation_batch():
+            yield _state.report
+    finally:
+        report, _state.report = _state.report, None
+
+    log.info(f"Schema change batch done:\n{report}")
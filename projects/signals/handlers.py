@@ -9,12 +9,37 @@ from django.db.models.signals import (
     m2m_changed,
 )
 from django.dispatch import receiver
-from django_q.tasks import async_task
 from django_q.models import OrmQ
-from datetime import datetime
 
-from projects.helpers import get_fieldset_path
+from kaavapino.task_queues import enqueue
+
+from projects.cache_namespaces import (
+    DATETYPES,
+    FIELDSET_PATHS,
+    PROJECT_DETAIL,
+    clear_namespace,
+    get_cache_key,
+)
+from projects.helpers import bump_schema_version
+from projects.map_tiles import bump_tile_generation
+from projects.preview_cache import bump_deadline_state_versions
+from projects.signals.batching import (
+    SchemaChangeReport,
+    get_schema_change_batch,
+    invalidate,
+)
 from projects.models import (
+    AttributeAutoValue,
+    AttributeAutoValueMapping,
+    CommonProjectPhase,
+    DocumentTemplate,
+    DateCalculation,
+    OverviewFilter,
+    OverviewFilterAttribute,
+    DeadlineDateCalculation,
+    DeadlineDistance,
+    ProjectCardSection,
+    ProjectCardSectionAttribute,
     ProjectAttributeFile,
     Attribute,
     DataRetentionPlan,
@@ -36,8 +61,10 @@ from projects.models import (
     ProjectPhaseDeadlineSectionAttribute,
     Deadline,
     Project,
+    ProjectDeadline,
     DateType,
 )
+from projects.models.project import ProjectAttributeMultipolygonGeometry
 from projects.tasks import refresh_project_schedule_cache \
     as refresh_project_schedule_cache_task
 
@@ -62,12 +89,47 @@ from projects.tasks import refresh_project_schedule_cache \
 @receiver([post_save, post_delete, m2m_changed], sender=ProjectPhaseDeadlineSectionAttribute)
 @receiver([post_save, post_delete, m2m_changed], sender=Deadline)
 def delete_cached_sections(*args, **kwargs):
-    cache.delete("serialized_phase_sections")
-    cache.delete("serialized_deadline_sections")
+    invalidate_cached_sections()
+    invalidate_schema_version()
+
+def invalidate_cached_sections():
+    invalidate("cached_sections", lambda: cache.delete_many([
+        "serialized_phase_sections",
+        "serialized_deadline_sections",
+    ]))
+
+def invalidate_schema_version():
+    invalidate("schema_version", bump_schema_version)
+
+@receiver([post_save, post_delete, m2m_changed], sender=CommonProjectPhase)
+@receiver([post_save, post_delete, m2m_changed], sender=ProjectCardSection)
+@receiver([post_save, post_delete, m2m_changed], sender=ProjectCardSectionAttribute)
+@receiver([post_save, post_delete, m2m_changed], sender=DeadlineDistance)
+@receiver([post_save, post_delete, m2m_changed], sender=DeadlineDateCalculation)
+@receiver([post_save, post_delete, m2m_changed], sender=DateCalculation)
+@receiver([post_save, post_delete], sender=OverviewFilter)
+@receiver([post_save, post_delete], sender=OverviewFilterAttribute)
+def update_schema_version(*args, **kwargs):
+    invalidate_schema_version()
+
+@receiver([post_save, post_delete], sender=DocumentTemplate)
+@receiver([post_save, post_delete], sender=AttributeAutoValue)
+@receiver([post_save, post_delete], sender=AttributeAutoValueMapping)
+def invalidate_project_detail(*args, **kwargs):
+    invalidate("project_detail", lambda: clear_namespace(PROJECT_DETAIL))
 
 @receiver([post_save, m2m_changed], sender=Attribute)
 def cache_fieldset_path_for_attribute(sender, instance, *args, **kwargs):
-    get_fieldset_path(instance, cached=False)
+    invalidate_fieldset_paths([instance.identifier])
+
+def invalidate_fieldset_paths(identifiers):
+    if not identifiers:
+        return
+    # Paths are recalculated and cached again by the next get_fieldset_path call
+    invalidate("fieldset_paths", lambda identifiers: cache.delete_many([
+        get_cache_key(FIELDSET_PATHS, identifier)
+        for identifier in identifiers
+    ]), identifiers)
 
 @receiver([pre_save], sender=Project)
 def save_attribute_data_subtype(sender, instance, *args, **kwargs):
@@ -91,26 +153,78 @@ def save_attribute_data_subtype(sender, instance, *args, **kwargs):
 
 @receiver([post_save], sender=Project)
 def add_to_report_cache_queue(sender, instance, *args, **kwargs):
+    invalidate("report_cache_queue", _add_to_report_cache_queue, [instance.id])
+
+def _add_to_report_cache_queue(project_ids):
     cache_key = 'projects.tasks.cache_selected_report_data.queue'
     queue = cache.get(cache_key, [])
-    cache.set(cache_key, list(set(queue + [instance.id])), None)
+    cache.set(cache_key, list(set(queue + project_ids)), None)
+
+@receiver([post_save], sender=Project)
+def invalidate_project_previews(sender, instance, *args, **kwargs):
+    invalidate("deadline_previews", bump_deadline_state_versions, [instance.id])
+
+@receiver([post_save, post_delete], sender=ProjectDeadline)
+def invalidate_project_deadline_previews(sender, instance, *args, **kwargs):
+    invalidate("deadline_previews", bump_deadline_state_versions, [instance.project_id])
+
+@receiver([post_save, post_delete], sender=ProjectAttributeMultipolygonGeometry)
+def invalidate_map_tiles(sender, instance, *args, **kwargs):
+    invalidate("map_tiles", bump_tile_generation)
+
+@receiver([post_save], sender=Project)
+def invalidate_project_map_tiles(sender, instance, created, *args, **kwargs):
+    # Name, phase and visibility of the project are carried in the map tiles,
+    # new projects have no geometries yet
+    if instance.pop_map_tile_changes() and not created \
+            and instance.geometries.exists():
+        invalidate("map_tiles", bump_tile_generation)
 
 @receiver([post_save, post_delete, m2m_changed], sender=Deadline)
 def refresh_project_schedule_cache(sender, instance, *args, **kwargs):
+    invalidate("project_schedule_cache", enqueue_project_schedule_cache_refresh)
+
+def enqueue_project_schedule_cache_refresh():
     for task in OrmQ.objects.all():
         if task.name() == "refresh_project_schedule_cache":
             task.delete()
 
-    async_task(
+    enqueue(
         refresh_project_schedule_cache_task,
         task_name="refresh_project_schedule_cache",
     )
 
 @receiver([post_save], sender=DateType)
 def delete_cached_date_types(sender, instance, *args, **kwargs):
-    identifier = instance.identifier
-    current_year = datetime.now().year
-    for year in range(current_year - 1, current_year + 20):
-        cache_key = f"datetype_{identifier}_dates_{year}"
-        cache.delete(cache_key)
-    cache.delete("serialized_date_types")
\ No newline at end of file
+    # Dates of date types based on the saved one change too, clear them all
+    invalidate("date_types", lambda: clear_namespace(DATETYPES))
+    invalidate_schema_version()
+
+def record_schema_change(sender, *args, **kwargs):
+    report = get_schema_change_batch()
+    if report is None:
+        return
+
+    if "created" not in kwargs:
+        change = SchemaChangeReport.DELETED
+    elif kwargs["created"]:
+        change = SchemaChangeReport.CREATED
+    else:
+        change = SchemaChangeReport.UPDATED
+    report.record(sender, change)
+
+# Only connected to models that already have receivers so that deletes of
+# other models can still skip the signals
+for schema_model in (
+    Attribute, DataRetentionPlan, AttributeValueChoice, FieldSetAttribute,
+    ProjectType, ProjectSubtype, ProjectFloorAreaSection,
+    ProjectFloorAreaSectionAttribute, ProjectFloorAreaSectionAttributeMatrixStructure,
+    ProjectFloorAreaSectionAttributeMatrixCell, ProjectPhase, ProjectPhaseSection,
+    ProjectPhaseSectionAttribute, ProjectPhaseFieldSetAttributeIndex,
+    PhaseAttributeMatrixStructure, PhaseAttributeMatrixCell,
+    ProjectPhaseDeadlineSection, ProjectPhaseDeadlineSectionAttribute, Deadline,
+    CommonProjectPhase, ProjectCardSection, ProjectCardSectionAttribute,
+    DeadlineDistance, DeadlineDateCalculation, DateCalculation, DateType,
+):
+    post_save.connect(record_schema_change, sender=schema_model)
+    post_delete.connect(record_schema_change, sender=schema_model)
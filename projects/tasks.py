@@ -1,9 +1,6 @@
 import copy
 import logging
 import re
-
-import requests
-from requests.exceptions import Timeout
 import datetime
 
 from django.conf import settings
@@ -11,10 +8,19 @@ from django.core.cache import cache
 from django.http import HttpResponse
 from django.utils import timezone
 
+from kaavapino.db_router import use_replica
+from projects.cache_namespaces import NAMESPACE_TIMEOUT, SCHEDULES, get_cache_key
+from projects.data_retention import clear_attribute_data_by_retention_plans, clear_audit_log_data
 from projects.exporting.report import render_report_to_response
-from projects.models import Project, Report, DataRetentionPlan, Attribute, FieldSetAttribute
+from projects.models import Project, Report, Attribute, FieldSetAttribute
 from projects.serializers.project import ProjectDeadlineSerializer
-from projects.helpers import set_kaavoitus_api_data_in_attribute_data, get_attribute_data_filtered_response
+from projects.fetch_cache import fetch, json_loader, peek
+from projects.helpers import (
+    GEOSERVER_DATA_TTL,
+    get_attribute_data_filtered_response,
+    set_kaavoitus_api_data_in_attribute_data,
+)
+from projects.schema_blobs import rebuild_project_type_schema_blobs
 
 logger = logging.getLogger(__name__)
 
@@ -40,28 +46,29 @@ def refresh_on_map_overview_cache():
             continue
 
         url = f"{settings.KAAVOITUS_API_BASE_URL}/geoserver/v1/suunnittelualue/{identifier}"
-        if project not in active_projects and cache.get(url, False):
+        if project not in active_projects and peek("geoserver", url):
             # Skip inactive projects that are already cached
             continue
 
         try:
-            response = requests.get(
+            fetch(
+                "geoserver",
                 url,
-                headers={"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"},
-                timeout=10,
+                json_loader(
+                    url,
+                    headers={"Authorization": f"Token {settings.KAAVOITUS_API_AUTH_TOKEN}"},
+                    timeout=10,
+                ),
+                ttl=GEOSERVER_DATA_TTL,
+                error_ttl=3600,
+                use_cached=False,
             )
-            if response.status_code == 200:
-                cache.set(url, response.json(), None)
-            else:
-                logger.info(f"Invalid request response {response.status_code} for {identifier}")
-        except Timeout:
-            logger.warning(f"Timeout while caching Geoserver data for hankenumero {identifier}")
-            pass
         except Exception as exc:
             logger.warning(f"Exception while caching Geoserver data for hankenumero {identifier}", exc)
 
+@use_replica()
 def refresh_project_schedule_cache():
-    project_schedule_cache = cache.get("serialized_project_schedules", {})
+    project_schedule_cache = cache.get(get_cache_key(SCHEDULES, "serialized_project_schedules"), {})
     logger.info(f"Recalculating and caching project schedule for all active projects")
 
     for project in get_active_projects_queryset():
@@ -74,10 +81,11 @@ def refresh_project_schedule_cache():
         ).data
         project_schedule_cache[project.pk] = schedule
 
-    cache.set("serialized_project_schedules", project_schedule_cache, None)
+    cache.set(get_cache_key(SCHEDULES, "serialized_project_schedules"), project_schedule_cache, NAMESPACE_TIMEOUT)
 
 # generate all reports to make sure as much freshly cached data as possible
 # is available when users request reports
+@use_replica()
 def cache_report_data(project_ids=None):
     if not project_ids:
         project_ids = [
@@ -120,29 +128,25 @@ def cache_kaavoitus_api_data():
 
 
 def check_archived_projects():
-    archived_projects = Project.objects.filter(archived=True, archived_at__isnull=False)
-    logger.info(f"Checking {len(archived_projects)} archived projects")
-
-    custom_data_retention_plans = DataRetentionPlan.objects.filter(plan_type=DataRetentionPlan.TYPE_CUSTOM)
-    for project in archived_projects:
-        diff_days = (timezone.now() - project.archived_at).days
-        for data_retention_plan in custom_data_retention_plans:
-            diff = diff_days if data_retention_plan.custom_time_unit == DataRetentionPlan.UNIT_DAYS \
-                else diff_days / 30 if data_retention_plan.custom_time_unit == DataRetentionPlan.UNIT_MONTHS \
-                else diff_days / 365 if data_retention_plan.custom_time_unit == DataRetentionPlan.UNIT_YEARS \
-                else None
-
-            if diff is None:
-                logger.warning(f"Diff should not be none, data_retention_plan.custom_time_unit '{data_retention_plan.custom_time_unit}' might be invalid")
-                continue
+    updated_project_ids = clear_attribute_data_by_retention_plans()
 
-            if diff > data_retention_plan.custom_time:
-                project.clear_data_by_data_retention_plan(data_retention_plan)
+    # Rebuild the search vectors so cleared values are not searchable anymore
+    for project in Project.objects.filter(pk__in=updated_project_ids):
+        project.save()
 
-        if (diff_days / 365) > 5:  # Clear audit log data after 5 years has passed from archived_at
-            project.clear_audit_log_data()
+    admin_log_count, action_count = clear_audit_log_data()
+    logger.info(
+        f"Data retention: cleared attribute data from {len(updated_project_ids)} projects, "
+        f"deleted {admin_log_count} admin log and {action_count} activity stream rows"
+    )
+    return {
+        "projects": len(updated_project_ids),
+        "admin_log_entries": admin_log_count,
+        "actions": action_count,
+    }
 
 
+@use_replica()
 def cache_attribute_data_filtered():
     projects = Project.objects.all()
     logger.info(f"Caching {len(projects)} projects for attribute_data_filtered request")
@@ -153,3 +157,8 @@ def cache_attribute_data_filtered():
 
     for project in projects:
         get_attribute_data_filtered_response(attributes, generated_attributes, ignored, project, use_cached=False)
+
+
+def refresh_project_type_schema_blobs():
+    logger.info("Rebuilding pre-rendered project type schemas")
+    rebuild_project_type_schema_blobs()
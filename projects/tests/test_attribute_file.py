@@ -1,10 +1,20 @@
 import os
+from datetime import timedelta
 from io import StringIO
 
 import pytest
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
+from projects.models import Attribute
+from projects.models.project import (
+    ProjectAttributeFile,
+    ProjectAttributeMultipolygonGeometry,
+    load_geometry_and_file_values,
+)
 from projects.serializers.project import ProjectFileSerializer
 
 
@@ -81,3 +91,95 @@ class TestProjectFileSerializer:
 
         serializer = ProjectFileSerializer(data=data)
         assert serializer.is_valid() is is_valid
+
+
+@pytest.fixture
+def create_attribute_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        ProjectAttributeFile._meta.get_field("file").storage,
+        "location",
+        str(tmp_path),
+    )
+
+    def create(project, attribute, created_at, archived_at=None, fieldset_path_str=None):
+        attribute_file = ProjectAttributeFile(
+            project=project,
+            attribute=attribute,
+            fieldset_path_str=fieldset_path_str,
+        )
+        attribute_file.file.save("foo.txt", ContentFile(b"test"), save=False)
+        attribute_file.save()
+        # created_at is auto_now_add
+        ProjectAttributeFile.objects.filter(pk=attribute_file.pk).update(
+            created_at=created_at, archived_at=archived_at,
+        )
+        return attribute_file
+
+    return create
+
+
+@pytest.mark.django_db()
+def test_active_files_exclude_archived_ones_and_follow_the_snapshot(
+    create_attribute_file, f_project, f_file_attribute,
+):
+    now = timezone.now()
+    replaced = create_attribute_file(
+        f_project, f_file_attribute, now - timedelta(days=10), now - timedelta(days=5),
+    )
+    current = create_attribute_file(f_project, f_file_attribute, now - timedelta(days=5))
+    queryset = ProjectAttributeFile.objects.all()
+
+    assert list(queryset.active()) == [current]
+    assert list(queryset.active(now - timedelta(days=7))) == [replaced]
+    # Archiving at the snapshot time means the file was replaced by then
+    assert list(queryset.active(now - timedelta(days=5))) == [current]
+    assert not queryset.active(now - timedelta(days=11)).exists()
+
+
+@pytest.mark.django_db()
+def test_latest_file_is_kept_per_attribute_and_optionally_per_fieldset_row(
+    create_attribute_file, f_project, f_file_attribute, attribute_factory,
+):
+    now = timezone.now()
+    create_attribute_file(f_project, f_file_attribute, now - timedelta(days=3), fieldset_path_str="a[0]")
+    row_0 = create_attribute_file(f_project, f_file_attribute, now - timedelta(days=2), fieldset_path_str="a[0]")
+    row_1 = create_attribute_file(f_project, f_file_attribute, now - timedelta(days=4), fieldset_path_str="a[1]")
+    other = create_attribute_file(
+        f_project, attribute_factory(value_type=Attribute.TYPE_FILE), now - timedelta(days=9),
+    )
+    queryset = ProjectAttributeFile.objects.all()
+
+    assert set(queryset.latest_per_attribute()) == {row_0, row_1, other}
+    assert set(queryset.latest_per_attribute(per_fieldset_path=False)) == {row_0, other}
+
+
+@pytest.mark.django_db()
+def test_geometry_and_file_values_are_loaded_for_each_project_separately(
+    django_assert_num_queries, create_attribute_file, f_project, f_file_attribute,
+    project_factory,
+):
+    now = timezone.now()
+    geometry_attribute = Attribute.objects.create(
+        name="Geometry",
+        identifier="suunnittelualueen_rajaus",
+        value_type=Attribute.TYPE_GEOMETRY,
+    )
+    geometry = MultiPolygon(Polygon.from_bbox((24.9, 60.1, 25.0, 60.2)))
+    ProjectAttributeMultipolygonGeometry.objects.create(
+        project=f_project, attribute=geometry_attribute, geometry=geometry,
+    )
+    create_attribute_file(f_project, f_file_attribute, now - timedelta(days=2))
+    latest = create_attribute_file(f_project, f_file_attribute, now - timedelta(days=1))
+    other_project = project_factory()
+    other_file = create_attribute_file(other_project, f_file_attribute, now - timedelta(days=3))
+    empty_project = project_factory()
+
+    with django_assert_num_queries(2):
+        values = load_geometry_and_file_values(
+            [f_project, other_project.pk, empty_project]
+        )
+
+    assert values[f_project.pk][geometry_attribute.pk].equals(geometry)
+    assert values[f_project.pk][f_file_attribute.pk] == latest.file
+    assert values[other_project.pk] == {f_file_attribute.pk: other_file.file}
+    assert values[empty_project.pk] == {}
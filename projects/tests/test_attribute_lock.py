@@ -0,0 +1,52 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+
+@pytest.mark.django_db()
+def test_attribute_lease_lifecycle(f_user, f_user2, f_project, f_short_string_attribute):
+    client = APIClient()
+    payload = {
+        "project_name": f_project.name,
+        "attribute_identifier": f_short_string_attribute.identifier,
+    }
+    locks_url = reverse("attribute-locks") + f"?project_name={f_project.name}"
+
+    client.force_authenticate(user=f_user)
+    response = client.post(reverse("attribute-lock"), data=payload)
+    assert response.status_code == 200
+    assert response.data["attribute_lock"]["owner"] is True
+
+    # Another user gets the existing lease back
+    client.force_authenticate(user=f_user2)
+    response = client.post(reverse("attribute-lock"), data=payload)
+    assert response.status_code == 200
+    assert response.data["attribute_lock"]["owner"] is False
+    assert response.data["attribute_lock"]["user_email"] == f_user.email
+
+    response = client.get(locks_url)
+    assert [lock["field_identifier"] for lock in response.data["attribute_locks"]] == [
+        f_short_string_attribute.identifier
+    ]
+
+    # Only the holder can release the lease
+    response = client.post(reverse("attribute-unlock"), data=payload)
+    assert response.status_code == 403
+
+    client.force_authenticate(user=f_user)
+    response = client.post(reverse("attribute-unlock_all"), data={"project_name": f_project.name})
+    assert response.status_code == 200
+
+    response = client.get(locks_url)
+    assert response.data["attribute_locks"] == []
+
+
+@pytest.mark.django_db()
+def test_attribute_lock_unknown_attribute(f_user, f_project):
+    client = APIClient()
+    client.force_authenticate(user=f_user)
+    response = client.post(reverse("attribute-lock"), data={
+        "project_name": f_project.name,
+        "attribute_identifier": "does_not_exist",
+    })
+    assert response.status_code == 400
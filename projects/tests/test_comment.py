@@ -1,10 +1,12 @@
 import copy
+from datetime import timedelta
 
 import pytest
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 
-from projects.models import ProjectComment
+from projects.models import LastReadTimestamp, ProjectComment
 
 
 @pytest.mark.django_db(transaction=True)
@@ -181,3 +183,36 @@ class TestComment:
         response = self.client.delete(url)
 
         assert response.status_code == status_code
+
+    #################
+    # UNREAD COUNTS #
+    #################
+    def test_unread_counts(self, f_user, f_user2, f_project, comment_factory):
+        self.client.force_authenticate(user=f_user)
+
+        now = timezone.now()
+        LastReadTimestamp.objects.create(
+            project=f_project, user=f_user, timestamp=now - timedelta(hours=1)
+        )
+        read = comment_factory(user=f_user2, project=f_project)
+        ProjectComment.objects.filter(pk=read.pk).update(
+            created_at=now - timedelta(hours=2)
+        )
+        for i in range(2):
+            comment_factory(user=f_user2, project=f_project)
+
+        url = reverse("comment-unread-counts-list")
+
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.data == [{"project": f_project.pk, "unread_count": 2}]
+
+        response = self.client.get(url, {"projects": f"{f_project.pk},999999999"})
+        assert response.status_code == 200
+        assert response.data == [
+            {"project": f_project.pk, "unread_count": 2},
+            {"project": 999999999, "unread_count": 0},
+        ]
+
+        response = self.client.get(url, {"projects": "abc"})
+        assert response.status_code == 400
@@ -0,0 +1,90 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from projects.models import CommonProjectPhase, DocumentTemplate, ProjectDocumentDownloadLog
+
+
+# Schema changes invalidate cached responses on commit
+@pytest.mark.django_db(transaction=True)
+def test_legend_is_not_resent_until_schema_changes(f_user):
+    client = APIClient()
+    client.force_authenticate(user=f_user)
+    phase = CommonProjectPhase.objects.create(name="Käynnistys", index=1)
+    url = reverse("legend")
+
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+
+    phase.color = "#ffffff"
+    phase.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db()
+def test_project_detail_not_modified(f_admin, f_project):
+    client = APIClient()
+    client.force_authenticate(user=f_admin)
+    url = reverse("projects-detail", kwargs={"pk": f_project.pk})
+
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    f_project.name = "Renamed project"
+    f_project.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db()
+def test_project_detail_is_resent_after_a_document_download(f_admin, f_project):
+    client = APIClient()
+    client.force_authenticate(user=f_admin)
+    url = reverse("projects-detail", kwargs={"pk": f_project.pk})
+    etag = client.get(url)["ETag"]
+
+    # Downloads do not touch the project but change phase_documents_created
+    download = ProjectDocumentDownloadLog.objects.create(
+        project=f_project,
+        document_template=DocumentTemplate.objects.create(name="Template", slug="template"),
+        phase=f_project.phase.common_project_phase,
+    )
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    ProjectDocumentDownloadLog.objects.filter(pk=download.pk).update(invalidated=True)
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db()
+def test_schema_etags_are_weak_across_content_encodings(
+    f_admin, f_project_type, f_project_section_attribute_1,
+):
+    client = APIClient()
+    client.force_authenticate(user=f_admin)
+    url = reverse("schemas-list")
+
+    gzipped = client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+    identity = client.get(url)
+    assert gzipped["Content-Encoding"] == "gzip"
+    assert not identity.has_header("Content-Encoding")
+    # The bodies differ byte for byte, so a strong ETag must not be shared
+    assert gzipped["ETag"].startswith('W/"')
+    assert identity["ETag"] == gzipped["ETag"]
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=gzipped["ETag"])
+    assert response.status_code == 304
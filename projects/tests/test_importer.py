@@ -1,7 +1,23 @@
+from io import BytesIO
+
 import pytest
 
-from projects.importing import AttributeImporter
-from projects.models import CommonProjectPhase
+from projects.helpers import get_schema_version
+from projects.importing import AttributeImporter, AttributeUpdater
+from projects.importing.attribute import (
+    ATTRIBUTE_IDENTIFIER,
+    ATTRIBUTE_PHASE_COLUMNS,
+    PROJECT_SIZE,
+    Phases,
+)
+from projects.models import (
+    CommonProjectPhase,
+    FieldSetAttribute,
+    ProjectPhaseFieldSetAttributeIndex,
+    ProjectPhaseSection,
+    ProjectPhaseSectionAttribute,
+)
+from projects.signals.batching import schema_change_batch
 
 
 @pytest.mark.django_db()
@@ -14,3 +30,136 @@ def test_project_phases_are_created(f_project_type, f_project_subtype):
 
     for i in range(1, 7):
         assert CommonProjectPhase.objects.filter(index=i).exists()
+
+
+@pytest.mark.django_db()
+def test_attribute_updater_renames_attribute_data_keys(f_fieldset_attribute, project_factory):
+    child = f_fieldset_attribute.fieldset_attributes.all()[0]
+    old_identifier = child.identifier
+    other_project = project_factory(attribute_data={"unrelated": old_identifier})
+    project = project_factory(
+        attribute_data={
+            old_identifier: "top level",
+            f_fieldset_attribute.identifier: [
+                {old_identifier: "row 1", "_deleted": False},
+                {old_identifier: old_identifier},
+            ],
+        }
+    )
+
+    csv_data = f"old,new\n{old_identifier},renamed_identifier\n".encode("utf-8")
+    AttributeUpdater({"filename": BytesIO(csv_data)}).run()
+
+    project.refresh_from_db()
+    assert old_identifier not in project.attribute_data
+    assert project.attribute_data["renamed_identifier"] == "top level"
+    assert project.attribute_data[f_fieldset_attribute.identifier] == [
+        {"renamed_identifier": "row 1", "_deleted": False},
+        {"renamed_identifier": old_identifier},
+    ]
+
+    # Values are never rewritten
+    other_project.refresh_from_db()
+    assert other_project.attribute_data["unrelated"] == old_identifier
+
+
+@pytest.mark.django_db()
+def test_attribute_updater_saves_only_changed_projects_of_indexed_attributes(
+    f_fieldset_attribute, project_factory,
+):
+    child = f_fieldset_attribute.fieldset_attributes.all()[0]
+    project = project_factory(attribute_data={
+        f_fieldset_attribute.identifier: [{child.identifier: "row"}],
+    })
+    # Has the fieldset but not the renamed key in its rows
+    unchanged = project_factory(attribute_data={
+        f_fieldset_attribute.identifier: [{"other": "row"}],
+    })
+    versions = {p.pk: p.version for p in (project, unchanged)}
+
+    def rename(old_identifier, new_identifier):
+        csv_data = f"old,new\n{old_identifier},{new_identifier}\n".encode("utf-8")
+        AttributeUpdater({"filename": BytesIO(csv_data)}).run()
+        for p in (project, unchanged):
+            p.refresh_from_db()
+
+    # Neither the child nor its fieldset is in the search vector
+    rename(child.identifier, "renamed")
+    assert project.attribute_data[f_fieldset_attribute.identifier] == [{"renamed": "row"}]
+    assert project.version == versions[project.pk]
+    assert unchanged.version == versions[unchanged.pk]
+
+    f_fieldset_attribute.searchable = True
+    f_fieldset_attribute.save()
+    rename("renamed", "renamed_again")
+    assert project.version > versions[project.pk]
+    assert unchanged.version == versions[unchanged.pk]
+
+
+@pytest.mark.django_db()
+def test_fieldset_links_are_synced_in_bulk(
+    f_fieldset_attribute, attribute_factory, f_project_phase_1,
+    django_capture_on_commit_callbacks,
+):
+    kept, removed = f_fieldset_attribute.fieldset_attributes.order_by("pk")
+    kept_link = FieldSetAttribute.objects.get(attribute_target=kept)
+    added = attribute_factory()
+    schema_version = get_schema_version()
+
+    ai = AttributeImporter({})
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with schema_change_batch() as ai.report:
+            ai._sync_fieldset_links({
+                (f_fieldset_attribute.identifier, kept.identifier): {(f_project_phase_1.pk, 0)},
+                (f_fieldset_attribute.identifier, added.identifier): set(),
+            })
+            # Receivers are suppressed until the batch is committed
+            assert get_schema_version() == schema_version
+
+    assert len(callbacks) == 1
+    assert get_schema_version() != schema_version
+    assert set(
+        FieldSetAttribute.objects.values_list("attribute_target", flat=True)
+    ) == {kept.pk, added.pk}
+    assert FieldSetAttribute.objects.get(attribute_target=kept).pk == kept_link.pk
+    assert list(
+        ProjectPhaseFieldSetAttributeIndex.objects.values_list("attribute", "phase", "index")
+    ) == [(kept_link.pk, f_project_phase_1.pk, 0)]
+    assert ai.report.as_dict()["projects.FieldSetAttribute"] == {"created": 1, "deleted": 1}
+
+
+@pytest.mark.django_db()
+def test_section_sync_keeps_unchanged_sections_and_links(
+    f_project_subtype, f_project_phase_1, attribute_factory,
+):
+    first, second = attribute_factory(), attribute_factory()
+    ai = AttributeImporter({})
+    columns = (ATTRIBUTE_IDENTIFIER, PROJECT_SIZE, *ATTRIBUTE_PHASE_COLUMNS[Phases.START])
+    ai.column_index = {column: index for index, column in enumerate(columns)}
+
+    def sync(rows):
+        with schema_change_batch() as ai.report:
+            ai._create_sections(rows, f_project_subtype)
+            ai._create_attribute_section_links(rows, f_project_subtype)
+        return ai.report.as_dict()
+
+    sync([
+        [first.identifier, None, "Perustiedot", "", "1.1"],
+        [second.identifier, None, "Perustiedot", "", "1.2"],
+    ])
+    section = ProjectPhaseSection.objects.get(phase=f_project_phase_1)
+    first_link = ProjectPhaseSectionAttribute.objects.get(attribute=first)
+    assert first_link.section == section
+    assert ProjectPhaseSectionAttribute.objects.filter(attribute=second).exists()
+
+    report = sync([
+        [first.identifier, None, "Perustiedot", "", "1.1"],
+        [second.identifier, "xl", "Perustiedot", "", "1.2"],
+        [second.identifier, None, "Lisätiedot", "", "2.1"],
+    ])
+    assert ProjectPhaseSectionAttribute.objects.get(attribute=first).pk == first_link.pk
+    assert ProjectPhaseSection.objects.filter(phase=f_project_phase_1).count() == 2
+    # The second attribute left the subtype's first section and moved to a new one
+    assert ProjectPhaseSectionAttribute.objects.get(attribute=second).section.name == "Lisätiedot"
+    assert report["projects.ProjectPhaseSection"] == {"created": 1}
+    assert report["projects.ProjectPhaseSectionAttribute"] == {"created": 1, "deleted": 1}
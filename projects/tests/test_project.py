@@ -1,6 +1,31 @@
+import json
+from datetime import timedelta
+
 import pytest
+from actstream.models import Action as ActStreamAction
+from actstream.signals import action
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 
-from projects.models import Attribute
+from projects import helpers, map_tiles, profiling
+from projects.models import (
+    Attribute,
+    AttributeDataConflictException,
+    CapturedProfile,
+    DataRetentionPlan,
+    Deadline,
+    OverviewFilter,
+    OverviewFilterAttribute,
+    Project,
+    ProjectDeadline,
+)
+from projects.models.codec import AttributeCodecSet
+from projects.models.project import ProjectAttributeMultipolygonGeometry
+from projects.preview_cache import get_or_set_preview
+from projects.tasks import check_archived_projects
 
 
 @pytest.mark.django_db()
@@ -113,3 +138,463 @@ def test_get_attribute_data_for_fieldset(
 
     assert fs_data[0][field1.identifier] == "AAA"
     assert fs_data[0][field2.identifier] == 123
+
+
+@pytest.mark.django_db()
+def test_attribute_codecs_encode_and_decode_many(
+    f_fieldset_attribute, f_choice_attribute, f_user_attribute, f_user,
+    django_assert_max_num_queries,
+):
+    field1 = f_fieldset_attribute.fieldset_attributes.all()[0]
+    field2 = f_fieldset_attribute.fieldset_attributes.all()[1]
+    field2.value_type = Attribute.TYPE_USER
+    field2.save()
+
+    codecs = AttributeCodecSet.compile(
+        [f_fieldset_attribute, f_choice_attribute, f_user_attribute]
+    )
+    choice = f_choice_attribute.value_choices.get(identifier="value2_id")
+
+    with django_assert_max_num_queries(0):
+        serialized = codecs.encode_many({
+            f_fieldset_attribute.identifier: [
+                {field1.identifier: "AAA", field2.identifier: str(f_user.uuid)}
+            ],
+            f_choice_attribute.identifier: choice,
+            f_user_attribute.identifier: f_user,
+            "unknown_attribute": "ignored",
+        })
+
+    assert serialized == {
+        f_fieldset_attribute.identifier: [
+            {field1.identifier: "AAA", field2.identifier: str(f_user.uuid)}
+        ],
+        f_choice_attribute.identifier: "value2_id",
+        f_user_attribute.identifier: f_user.uuid,
+    }
+
+    # All referenced users are fetched with a single query
+    with django_assert_max_num_queries(1):
+        deserialized = codecs.decode_many(serialized)
+
+    assert deserialized[f_choice_attribute.identifier] == choice
+    assert deserialized[f_user_attribute.identifier] == f_user
+    assert deserialized[f_fieldset_attribute.identifier] == [
+        {field1.identifier: "AAA", field2.identifier: f_user}
+    ]
+
+
+@pytest.mark.django_db()
+def test_check_archived_projects_clears_data_and_audit_log(
+    f_project, attribute_factory, f_user,
+):
+    plan = DataRetentionPlan.objects.create(
+        label="1 year",
+        plan_type=DataRetentionPlan.TYPE_CUSTOM,
+        custom_time=1,
+        custom_time_unit=DataRetentionPlan.UNIT_YEARS,
+    )
+    cleared = attribute_factory(data_retention_plan=plan)
+    kept = attribute_factory()
+
+    f_project.attribute_data[cleared.identifier] = "secret"
+    f_project.attribute_data[kept.identifier] = "public"
+    f_project.archived = True
+    f_project.archived_at = timezone.now() - timedelta(days=6 * 365)
+    f_project.save()
+    action.send(f_user, verb="updated", target=f_project)
+    action.send(f_user, verb="updated", target=f_user)
+
+    assert check_archived_projects() == {
+        "projects": 1,
+        "admin_log_entries": 0,
+        "actions": 1,
+    }
+
+    f_project.refresh_from_db()
+    assert f_project.attribute_data[cleared.identifier] is None
+    assert f_project.attribute_data[kept.identifier] == "public"
+    assert ActStreamAction.objects.count() == 1
+
+    # Nothing is left to clear on the next run
+    assert check_archived_projects()["projects"] == 0
+
+
+# Geometry writes invalidate the cached tiles on commit
+@pytest.mark.django_db(transaction=True)
+def test_project_tiles_are_cached_until_geometry_changes(
+    settings, tmp_path, f_admin, f_project,
+):
+    settings.MAP_TILE_CACHE_ROOT = str(tmp_path)
+    attribute = Attribute.objects.create(
+        name="Geometry",
+        identifier="suunnittelualueen_rajaus",
+        value_type=Attribute.TYPE_GEOMETRY,
+    )
+    geometry = ProjectAttributeMultipolygonGeometry.objects.create(
+        project=f_project,
+        attribute=attribute,
+        geometry=MultiPolygon(Polygon.from_bbox((24.9, 60.1, 25.0, 60.2))),
+    )
+    client = APIClient()
+    client.force_authenticate(user=f_admin)
+    url = reverse("projects-projects-tiles", kwargs={"z": 0, "x": 0, "y": 0})
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/vnd.mapbox-vector-tile"
+    assert b"Test project" in response.content
+    assert len(list(tmp_path.glob("*/*/0/0/0.mvt"))) == 1
+
+    geometry.geometry = MultiPolygon(Polygon.from_bbox((-10, -10, -9, -9)))
+    geometry.save()
+
+    response = client.get(url)
+    assert response.status_code == 200
+    # The stale generation is purged when the new one is written
+    assert len(list(tmp_path.glob("*/*/0/0/0.mvt"))) == 1
+
+    response = client.get(
+        reverse("projects-projects-tiles", kwargs={"z": 1, "x": 2, "y": 0})
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_project_tiles_are_invalidated_only_by_fields_carried_in_them(
+    settings, tmp_path, f_project,
+):
+    settings.MAP_TILE_CACHE_ROOT = str(tmp_path)
+    attribute = Attribute.objects.create(
+        name="Geometry",
+        identifier="suunnittelualueen_rajaus",
+        value_type=Attribute.TYPE_GEOMETRY,
+    )
+    ProjectAttributeMultipolygonGeometry.objects.create(
+        project=f_project,
+        attribute=attribute,
+        geometry=MultiPolygon(Polygon.from_bbox((24.9, 60.1, 25.0, 60.2))),
+    )
+    OverviewFilterAttribute.objects.create(
+        attribute=Attribute.objects.create(name="Vastuuyksikkö", identifier="vastuuyksikko"),
+        overview_filter=OverviewFilter.objects.create(name="Vastuuyksikkö", identifier="vastuuyksikko"),
+        filters_on_map=True,
+    )
+    generation = map_tiles.get_tile_generation()
+
+    project = Project.objects.get(pk=f_project.pk)
+    project.attribute_data = {"projektin_nimi": "Changed"}
+    project.save()
+    assert map_tiles.get_tile_generation() == generation
+
+    project.name = "Renamed"
+    project.save()
+    assert map_tiles.get_tile_generation() == generation + 1
+    project.save()
+    assert map_tiles.get_tile_generation() == generation + 1
+
+    # Archived projects and filtered values select which projects are drawn
+    project.archived = True
+    project.save()
+    assert map_tiles.get_tile_generation() == generation + 2
+    project.attribute_data["vastuuyksikko"] = "Asemakaavoitus"
+    project.save()
+    assert map_tiles.get_tile_generation() == generation + 3
+
+    # Purging keeps generations written meanwhile by newer processes
+    for name in (f"{generation}-1", f"{generation + 1}-1", f"{generation + 2}-1", "tmp"):
+        (tmp_path / name).mkdir()
+    map_tiles._purge_stale_generations(str(tmp_path), f"{generation + 1}-1")
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        sorted([f"{generation + 1}-1", f"{generation + 2}-1", "tmp"])
+
+
+# Project writes invalidate cached previews on commit
+@pytest.mark.django_db(transaction=True)
+def test_deadline_previews_are_cached_until_project_changes(f_project):
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return {"projektin_kaynnistys_pvm": "2027-01-01"}
+
+    def get_preview(attribute_data, metrics):
+        return get_or_set_preview(
+            f_project, f_project.subtype, attribute_data, ["b", "a"], compute,
+            timing_metrics=metrics,
+        )
+
+    metrics = {}
+    payload = {"projektin_kaynnistys_pvm": "2027-01-01", "kaavan_vaihe": "x"}
+    assert get_preview(payload, metrics) == {"projektin_kaynnistys_pvm": "2027-01-01"}
+    assert get_preview(dict(reversed(payload.items())), metrics) == \
+        {"projektin_kaynnistys_pvm": "2027-01-01"}
+    assert len(computed) == 1
+    assert metrics == {"preview_cache_misses": 1, "preview_cache_hits": 1}
+
+    f_project.name = "Renamed project"
+    f_project.save()
+
+    get_preview(payload, metrics)
+    assert len(computed) == 2
+    assert metrics["preview_cache_misses"] == 2
+
+
+@pytest.mark.django_db()
+def test_attribute_data_filtered_export_streams_changed_projects(
+    monkeypatch, settings, f_admin, project_factory,
+):
+    rendered = []
+
+    def render(attributes, generated_attributes, ignored, project):
+        rendered.append(project.pk)
+        return {"projektin_nimi": project.name}
+
+    monkeypatch.setattr(helpers, "_render_attribute_data_filtered", render)
+    first = project_factory(attribute_data={"projektin_nimi": "First"})
+    second = project_factory(attribute_data={"projektin_nimi": "Second"})
+    project_factory(attribute_data={})
+    client = APIClient()
+    client.force_authenticate(user=f_admin)
+    url = reverse("projects-attribute-data-filtered-export")
+
+    response = client.get(url)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+    assert [line["id"] for line in lines] == [first.pk, second.pk]
+    assert sorted(rendered) == sorted([first.pk, second.pk])
+
+    # Fresh cache entries are not regenerated, changed projects are. Projects
+    # modified within the safety window before the cursor are sent again
+    first.save()
+    response = client.get(url, {"since": lines[-1]["modified_at"]})
+    lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+    assert [line["id"] for line in lines] == [second.pk, first.pk]
+    assert lines[-1]["attribute_data"] == {"projektin_nimi": first.name}
+    assert rendered.count(first.pk) == 2
+    assert rendered.count(second.pk) == 1
+
+    settings.ATTRIBUTE_DATA_EXPORT_CURSOR_WINDOW = 0
+    response = client.get(url, {"since": lines[-1]["modified_at"]})
+    assert b"".join(response.streaming_content) == b""
+
+    # Schema changes don't touch modified_at, a cursor from an older schema
+    # gets a full resync and cached payloads are regenerated
+    schema_version = response["X-Schema-Version"]
+    response = client.get(url, {"since": lines[-1]["modified_at"], "schema_version": schema_version})
+    assert b"".join(response.streaming_content) == b""
+    helpers.bump_schema_version()
+    response = client.get(url, {"since": lines[-1]["modified_at"], "schema_version": schema_version})
+    assert response["X-Schema-Version"] != schema_version
+    lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+    assert [line["id"] for line in lines] == [second.pk, first.pk]
+    assert rendered.count(first.pk) == 3
+    assert rendered.count(second.pk) == 2
+
+    assert client.get(url, {"since": "yesterday"}).status_code == 400
+
+
+@pytest.mark.django_db()
+def test_project_detail_reports_server_timing(settings, caplog, f_admin, f_project):
+    settings.REQUEST_SLOW_THRESHOLD = 0
+    client = APIClient()
+    client.force_authenticate(user=f_admin)
+
+    with caplog.at_level("INFO", logger="kaavapino.instrumentation"):
+        response = client.get(reverse("projects-detail", kwargs={"pk": f_project.pk}))
+
+    assert response.status_code == 200
+    metrics = {
+        metric.split(";")[0]: metric for metric in response["Server-Timing"].split(", ")
+    }
+    assert {"total", "db", "serialization", "render"} <= set(metrics)
+    assert 'desc="0 queries"' not in metrics["db"]
+    # Slow requests dump the span tree
+    assert any("  serialization:" in record.message for record in caplog.records)
+
+
+@pytest.mark.django_db()
+def test_profiling_is_captured_only_for_admins(
+    monkeypatch, settings, tmp_path, f_user, f_admin_group, f_project,
+):
+    monkeypatch.setattr(
+        CapturedProfile._meta.get_field("file").storage, "location", str(tmp_path),
+    )
+    settings.PROFILE_RETENTION_COUNT = 1
+    profiled = []
+    enable = profiling.cProfile.Profile.enable
+
+    def record_enable(self, *args, **kwargs):
+        profiled.append(1)
+        return enable(self, *args, **kwargs)
+
+    monkeypatch.setattr(profiling.cProfile.Profile, "enable", record_enable)
+    url = reverse("projects-detail", kwargs={"pk": f_project.pk})
+    client = APIClient()
+    # Token users are authenticated by DRF in the view, after the middleware
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=f_user).key}")
+
+    response = client.get(url, {"profile": "1"})
+    assert response.status_code == 200
+    assert "X-Kaavapino-Profile-Id" not in response
+    assert not CapturedProfile.objects.exists()
+    # Non-admins asking for a profile are not profiled at all
+    assert not profiled
+
+    f_user.additional_groups.set([f_admin_group])
+    client.get(url, HTTP_X_KAAVAPINO_PROFILE="1")
+    response = client.get(url, {"profile": "1"})
+    profile = CapturedProfile.objects.get()
+    assert response["X-Kaavapino-Profile-Id"] == str(profile.pk)
+    assert profile.user == f_user
+    assert profile.query_count > 0
+    # Older profiles past the retention count are deleted with their files
+    assert len(list(tmp_path.rglob("*.zip"))) == 1
+
+
+@pytest.mark.django_db()
+def test_project_list_reads_only_the_selected_attribute_data_keys(project_factory):
+    # More keys than fit in one jsonb_build_object() call
+    identifiers = [f"key_{i}" for i in range(120)]
+    project = project_factory(attribute_data={
+        **{identifier: i for i, identifier in enumerate(identifiers)},
+        "fieldset": [{"nested": None, "value": 1}],
+        "not_listed": "x" * 1000,
+    })
+
+    projects = Project.objects.filter(pk=project.pk).with_attribute_data_keys(
+        identifiers + ["fieldset", "missing"], name="listed",
+    )
+    listed = projects.get()
+    assert {"attribute_data", "vector_column"} <= listed.get_deferred_fields()
+    assert listed.listed == {
+        **{identifier: i for i, identifier in enumerate(identifiers)},
+        # Nested nulls are kept, keys missing from the project are None
+        "fieldset": [{"nested": None, "value": 1}],
+        "missing": None,
+    }
+
+
+@pytest.mark.django_db()
+def test_project_deadlines_are_the_rows_pointing_to_the_project(f_project, project_factory):
+    deadline = Deadline.objects.create(
+        abbreviation="T1", phase=f_project.phase, subtype=f_project.subtype,
+    )
+    project_deadline = ProjectDeadline.objects.create(project=f_project, deadline=deadline)
+    # A deadline of another project is never listed
+    ProjectDeadline.objects.create(project=project_factory(), deadline=deadline)
+
+    assert list(f_project.deadlines.all()) == [project_deadline]
+    prefetched = Project.objects.prefetch_related("deadlines__deadline").get(pk=f_project.pk)
+    assert [dl.deadline.abbreviation for dl in prefetched.deadlines.all()] == ["T1"]
+
+    project_deadline.delete()
+    assert not f_project.deadlines.exists()
+
+
+@pytest.mark.django_db()
+def test_concurrent_attribute_data_writes_merge_or_conflict(project_factory):
+    project = project_factory(attribute_data={"a": 1, "b": 1, "removed": 1})
+
+    def load():
+        loaded = Project.objects.get(pk=project.pk)
+        loaded.track_attribute_data()
+        return loaded
+
+    first, second = load(), load()
+    first.attribute_data["a"] = 2
+    first.attribute_data.pop("removed")
+    first.save()
+    second.attribute_data["b"] = [{"nested": 2}]
+    second.attribute_data["added"] = None
+    second.save()
+
+    project.refresh_from_db()
+    # Writes of different keys are merged, neither overwrites the other
+    assert {
+        key: project.attribute_data.get(key, "missing")
+        for key in ("a", "b", "added", "removed")
+    } == {"a": 2, "b": [{"nested": 2}], "added": None, "removed": "missing"}
+    # Keys set by the pre_save receivers are written too
+    assert project.attribute_data["kaavan_vaihe"] == project.phase.prefixed_name
+    assert project.version == second.version
+
+    # Both writers change the same key, the later one is rejected
+    first, second = load(), load()
+    first.attribute_data["a"] = 3
+    first.save()
+    second.attribute_data["a"] = 4
+    with pytest.raises(AttributeDataConflictException):
+        second.save()
+    project.refresh_from_db()
+    assert project.attribute_data["a"] == 3
+
+    # Untracked saves still rewrite the document and bump the version
+    version = project.version
+    project.attribute_data = {"a": 5}
+    project.save()
+    assert project.version == version + 1
+    attribute_data = Project.objects.get(pk=project.pk).attribute_data
+    assert attribute_data["a"] == 5
+    assert "b" not in attribute_data
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("key", ["kaava__contains", "nimi__0", "0", "has_key"])
+def test_concurrent_writes_take_attribute_data_keys_literally(project_factory, key):
+    project = project_factory(attribute_data={key: {"value": 1}, "other": None})
+
+    def load():
+        loaded = Project.objects.get(pk=project.pk)
+        loaded.track_attribute_data()
+        return loaded
+
+    # The key still has its tracked value, the write of a stale version goes through
+    first, second = load(), load()
+    first.attribute_data["other"] = 1
+    first.save()
+    second.attribute_data[key] = {"value": 2}
+    second.save()
+    project.refresh_from_db()
+    assert project.attribute_data[key] == {"value": 2}
+    assert project.attribute_data["other"] == 1
+
+    # The key was changed concurrently
+    first, second = load(), load()
+    first.attribute_data[key] = {"value": 3}
+    first.save()
+    second.attribute_data[key] = {"value": 4}
+    with pytest.raises(AttributeDataConflictException):
+        second.save()
+
+
+@pytest.mark.django_db()
+def test_project_update_writes_changed_keys_and_rejects_stale_versions(
+    f_admin, f_project, f_project_phase_2, f_project_section_attribute_1,
+):
+    identifier = f_project_section_attribute_1.attribute.identifier
+    client = APIClient()
+    client.force_authenticate(user=f_admin)
+    url = reverse("projects-detail", kwargs={"pk": f_project.pk})
+    version = client.get(url).data["version"]
+
+    response = client.patch(url, {
+        "attribute_data": {identifier: "updated"},
+        "phase": f_project_phase_2.pk,
+        "version": version,
+    }, format="json")
+    assert response.status_code == 200
+    assert response.data["version"] > version
+
+    f_project.refresh_from_db()
+    assert f_project.attribute_data[identifier] == "updated"
+    # The phase receiver runs after the changes are collected and is saved too
+    assert f_project.attribute_data["kaavan_vaihe"] == f_project_phase_2.prefixed_name
+
+    response = client.patch(url, {
+        "attribute_data": {identifier: "stale"},
+        "version": version,
+    }, format="json")
+    assert response.status_code == 409
+    f_project.refresh_from_db()
+    assert f_project.attribute_data[identifier] == "updated"
@@ -0,0 +1,42 @@
+import gzip
+import json
+
+import pytest
+
+from projects.schema_blobs import build_project_type_schema_blob, get_schema_blob_response
+
+
+def test_schema_blob_response_encoding_negotiation():
+    body = b'{"results": []}'
+    blob = {"identity": body, "gzip": gzip.compress(body)}
+
+    response = get_schema_blob_response(blob, "gzip, deflate")
+    assert response["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.content) == body
+    assert "Accept-Encoding" in response["Vary"]
+
+    # Brotli is not available in the blob, gzip is explicitly refused
+    response = get_schema_blob_response(blob, "br, gzip;q=0")
+    assert not response.has_header("Content-Encoding")
+    assert response.content == body
+
+    response = get_schema_blob_response(blob, None)
+    assert response.content == body
+
+
+@pytest.mark.django_db()
+def test_build_project_type_schema_blob(f_project_type, f_project_subtype, f_project_section_attribute_1):
+    attribute = f_project_section_attribute_1.attribute
+    attribute.field_roles = "Projektivastaava"
+    attribute.save()
+
+    blob = build_project_type_schema_blob("browse", False)
+
+    data = json.loads(blob["identity"])
+    assert data["count"] == 1
+    assert data["results"][0]["type"] == f_project_type.pk
+    # The generic schema has no project to filter the subtype's phases by
+    subtype, = data["results"][0]["subtypes"]
+    assert subtype["subtype"] == f_project_subtype.pk
+    assert subtype["filters"]["roles"] == ["Projektivastaava"]
+    assert gzip.decompress(blob["gzip"]) == blob["identity"]
@@ -4,7 +4,8 @@ from django.http import HttpRequest
 from rest_framework import serializers
 from rest_framework.request import Request
 
-from projects.models import AttributeValueChoice
+from projects.helpers import bump_schema_version
+from projects.models import AttributeValueChoice, ProjectPhaseSectionAttribute
 from projects.serializers.section import create_attribute_field_data
 from projects.serializers.section import (
     create_section_serializer,
@@ -165,3 +166,33 @@ def test_create_attribute_field_data(
         get_user_model().objects.all()
     )
     assert type(user_field.field_arguments["queryset"].first()) == get_user_model()
+
+
+@pytest.mark.django_db()
+def test_compiled_section_reapplies_relies_on_per_request(
+    django_assert_num_queries,
+    f_project_section_2,
+    f_project_section_attribute_5,
+    f_project_section_attribute_6,
+    f_user_attribute,
+):
+    def get_fields(attribute_data):
+        request = Request(HttpRequest())
+        request._full_data = {"attribute_data": attribute_data}
+        serializer = create_section_serializer(f_project_section_2, {"request": request})
+        return list(serializer._declared_fields)
+
+    boolean = f_project_section_attribute_5.attribute.identifier
+    string = f_project_section_attribute_6.attribute.identifier
+    assert get_fields({}) == [boolean]
+
+    # The compiled fields are reused, only relies_on is checked again
+    with django_assert_num_queries(0):
+        assert get_fields({boolean: True}) == [boolean, string]
+        assert get_fields({boolean: False}) == [boolean]
+
+    ProjectPhaseSectionAttribute.objects.create(
+        attribute=f_user_attribute, section=f_project_section_2, index=6,
+    )
+    bump_schema_version()
+    assert get_fields({}) == [boolean, f_user_attribute.identifier]
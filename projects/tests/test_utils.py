@@ -1,7 +1,29 @@
+import random
+import threading
+import time
+import uuid
+
 import pytest
+import requests
+from django.core.cache import cache
+from django.db import transaction
+from django_q.models import OrmQ
 
+from kaavapino import db_router, task_queues
+from projects import cache_namespaces, fetch_cache, map_tiles
+from projects.benchmarks import (
+    DEFAULT_QUERY_BUDGETS,
+    SyntheticAttributeData,
+    delete_projects,
+    generate_projects,
+    run_benchmarks,
+)
+from projects.helpers import bump_schema_version, get_schema_version
+from projects.models import Project
 from projects.models.utils import truncate_identifier
+from projects.preview_cache import bump_deadline_state_versions, get_deadline_state_version
 from projects.serializers.utils import _is_attribute_required
+from projects.signals.batching import get_invalidation_metrics
 
 
 @pytest.mark.django_db()
@@ -45,3 +67,281 @@ def test_identifier_truncation():
     t2 = truncate_identifier(identifier, length=len(identifier) - 1)
 
     assert t1 == t2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_invalidations_are_coalesced_per_transaction(f_short_string_attribute):
+    schema_version = get_schema_version()
+    before = get_invalidation_metrics().get("schema_version", {}).get("suppressed", 0)
+
+    with transaction.atomic():
+        for i in range(3):
+            f_short_string_attribute.name = f"Renamed {i}"
+            f_short_string_attribute.save()
+        assert get_schema_version() == schema_version
+
+    assert get_schema_version() == schema_version + 1
+    assert get_invalidation_metrics()["schema_version"]["suppressed"] == before + 2
+
+
+def test_replica_router_sticks_to_primary_after_write(monkeypatch):
+    monkeypatch.setattr(db_router, "is_replica_available", lambda: True)
+    replica_router = db_router.ReplicaRouter()
+    db_router.reset_pinning()
+
+    assert replica_router.db_for_read(Project) == "default"
+    with db_router.use_replica():
+        assert replica_router.db_for_read(Project) == "replica"
+        assert replica_router.db_for_write(Project) == "default"
+        assert replica_router.db_for_read(Project) == "default"
+
+    db_router.reset_pinning()
+    monkeypatch.setattr(db_router, "is_replica_available", lambda: False)
+    with db_router.use_replica():
+        assert replica_router.db_for_read(Project) == "default"
+
+
+@pytest.mark.django_db()
+def test_benchmark_fails_paths_over_their_query_budget(f_admin, f_project):
+    budgets = {name: 0 for name in DEFAULT_QUERY_BUDGETS}
+    budgets["project_list"] = 1000
+
+    results = run_benchmarks([f_project], f_admin, iterations=2, budgets=budgets)
+
+    # Reports and document templates are skipped without data to render
+    assert "render_report_to_response" not in results
+    assert results["project_save"]["queries"]["min"] > 0
+    assert results["project_save"]["passed"] is False
+    assert results["project_list"]["passed"] is True
+    assert results["project_list"]["iterations"] == 2
+
+
+@pytest.mark.django_db()
+def test_synthetic_projects_are_reproducible_and_skip_backend_filled_attributes(
+    f_admin, f_project_subtype, f_project_phase_1, f_project_section_attribute_1,
+    f_project_section_attribute_4, f_project_section_attribute_6_file,
+):
+    generator = SyntheticAttributeData(f_project_subtype, f_admin, random.Random(1))
+    data = [generator.generate(index) for index in range(20)]
+
+    assert {attribute.identifier for attribute in generator.attributes} == \
+        {"short_string_attr", "choice_attr"}
+    assert all(
+        row.get("choice_attr", "value1_id") in ("value1_id", "value2_id") for row in data
+    )
+    regenerated = SyntheticAttributeData(f_project_subtype, f_admin, random.Random(1))
+    assert [regenerated.generate(index) for index in range(20)] == data
+
+    projects = generate_projects(3, f_admin, seed=1)
+    assert [project.identifier for project in projects] == \
+        ["benchmark_0", "benchmark_1", "benchmark_2"]
+    assert all(project.phase == f_project_phase_1 for project in projects)
+
+    delete_projects(projects)
+    assert not Project.objects.filter(identifier__startswith="benchmark_").exists()
+
+
+def test_fetch_cache_loads_a_missing_key_once_for_concurrent_requests():
+    key = uuid.uuid4().hex
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.3)
+        return {"value": key}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(fetch_cache.fetch("test", key, loader, ttl=60))
+        )
+        for __ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"value": key}] * 5
+    assert fetch_cache.get_fetch_cache_metrics()["test"]["loads"] >= 1
+
+
+def test_fetch_cache_waiters_give_up_without_calling_a_slow_upstream(monkeypatch):
+    monkeypatch.setattr(fetch_cache, "LOCK_MARGIN", 1)
+    key = uuid.uuid4().hex
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        time.sleep(2)
+        return "loaded"
+
+    loading = threading.Thread(
+        target=fetch_cache.fetch, args=("test", key, slow_loader, 60), kwargs={"timeout": 0},
+    )
+    loading.start()
+    time.sleep(0.2)
+
+    # The lock lasts the loader timeout, the waiter returns default when it ends
+    assert fetch_cache.fetch(
+        "test", key, slow_loader, ttl=60, timeout=0, default="default",
+    ) == "default"
+    loading.join()
+    assert len(calls) == 1
+    assert fetch_cache.peek("test", key) == "loaded"
+
+
+def test_fetch_cache_waiters_stop_when_the_loading_worker_crashes():
+    key = uuid.uuid4().hex
+
+    def crashing_loader():
+        time.sleep(0.5)
+        raise RuntimeError("Connection reset")
+
+    def load():
+        with pytest.raises(RuntimeError):
+            fetch_cache.fetch("test", key, crashing_loader, 60, timeout=60)
+
+    loading = threading.Thread(target=load)
+    loading.start()
+    time.sleep(0.2)
+
+    # The waiter returns default as soon as the lock is released without a value
+    start = time.monotonic()
+    assert fetch_cache.fetch(
+        "test", key, crashing_loader, ttl=60, timeout=60, default="default",
+    ) == "default"
+    assert time.monotonic() - start < 5
+    loading.join()
+
+
+def test_json_loader_turns_connection_errors_into_cached_failures(monkeypatch):
+    key = uuid.uuid4().hex
+    calls = []
+
+    def get(*args, **kwargs):
+        calls.append(1)
+        raise requests.ConnectionError("Connection refused")
+
+    monkeypatch.setattr(fetch_cache.requests, "get", get)
+    loader = fetch_cache.json_loader("https://example.com/api", timeout=5)
+
+    assert fetch_cache.fetch("test", key, loader, ttl=60, default=[]) == []
+    assert fetch_cache.fetch("test", key, loader, ttl=60, default=[]) == []
+    assert len(calls) == 1
+
+
+def test_fetch_cache_serves_stale_value_while_refreshing():
+    key = uuid.uuid4().hex
+    values = iter(["first", "second"])
+
+    assert fetch_cache.fetch("test", key, lambda: next(values), ttl=1) == "first"
+    time.sleep(1.2)
+
+    # The stale value is returned immediately, the refresh runs in the background
+    assert fetch_cache.fetch("test", key, lambda: next(values), ttl=1) == "first"
+    fetch_cache.wait_for_refreshes(timeout=5)
+    assert fetch_cache.fetch("test", key, lambda: "unused", ttl=1) == "second"
+
+
+def test_fetch_cache_caches_failures_without_losing_a_good_value():
+    key = uuid.uuid4().hex
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise fetch_cache.FetchError("Response status 500")
+
+    assert fetch_cache.fetch("test", key, failing, ttl=60, default=[]) == []
+    assert fetch_cache.fetch("test", key, failing, ttl=60, default=[]) == []
+    assert len(calls) == 1
+
+    fetch_cache.fetch("test", key, lambda: {"a": 1}, ttl=60, use_cached=False)
+    # A failed forced refresh keeps the previous value
+    assert fetch_cache.fetch("test", key, failing, ttl=60, use_cached=False) == {"a": 1}
+    assert fetch_cache.peek("test", key) == {"a": 1}
+
+
+def test_clearing_a_cache_namespace_hides_only_its_entries():
+    def key(namespace, scope):
+        return cache_namespaces.get_cache_key(namespace, "admin", "True", scope=scope)
+
+    phase_schema = cache_namespaces.PHASE_SCHEMA
+    deadline_sections = cache_namespaces.DEADLINE_SECTIONS
+    for namespace in (phase_schema, deadline_sections):
+        for scope in (1, 2, 12):
+            cache.set(key(namespace, scope), f"{namespace} {scope}")
+
+    cache_namespaces.clear_namespace(phase_schema, scope=1)
+    assert cache.get(key(phase_schema, 1)) is None
+    # Scope 12 must not share a version with scope 1
+    assert cache.get(key(phase_schema, 12)) == "phase_schema 12"
+    assert cache.get(key(deadline_sections, 1)) == "deadline_sections 1"
+
+    cache_namespaces.clear_namespaces([phase_schema])
+    assert cache.get(key(phase_schema, 2)) is None
+    assert cache.get(key(phase_schema, 12)) is None
+    assert cache.get(key(deadline_sections, 2)) == "deadline_sections 2"
+
+
+def test_namespace_versions_are_read_once_per_request():
+    def key():
+        return cache_namespaces.get_cache_key(
+            cache_namespaces.PHASE_SCHEMA, "admin", scope=1,
+        )
+
+    cache_namespaces.start_version_memo()
+    try:
+        before = key()
+        # Clears made elsewhere are picked up by the next request
+        cache.incr(cache_namespaces._get_version_key(cache_namespaces.PHASE_SCHEMA))
+        assert key() == before
+        # Clears made by the request itself are seen immediately
+        cache_namespaces.clear_namespace(cache_namespaces.PHASE_SCHEMA, scope=1)
+        cleared = key()
+        assert cleared != before
+    finally:
+        cache_namespaces.stop_version_memo()
+
+    assert key() not in (before, cleared)
+
+
+def test_version_counters_are_scoped_cache_namespaces():
+    deadline_state = {project_id: get_deadline_state_version(project_id) for project_id in (1, 12)}
+    schema_version = get_schema_version()
+    tile_generation = map_tiles.get_tile_generation()
+
+    bump_deadline_state_versions([1])
+    assert get_deadline_state_version(1) == deadline_state[1] + 1
+    assert get_deadline_state_version(12) == deadline_state[12]
+    assert get_schema_version() == schema_version
+    assert map_tiles.get_tile_generation() == tile_generation
+
+    # Bumps within a request are seen by the request itself
+    cache_namespaces.start_version_memo()
+    try:
+        get_schema_version()
+        bump_schema_version()
+        assert get_schema_version() == schema_version + 1
+    finally:
+        cache_namespaces.stop_version_memo()
+
+
+@pytest.mark.django_db
+def test_tasks_are_enqueued_on_the_cluster_of_their_queue(settings):
+    settings.Q_QUEUE_CLUSTERS = {
+        "interactive": "kaavapino-interactive",
+        "batch": "kaavapino-qcluster",
+    }
+
+    task_queues.enqueue("projects.exporting.document.render_template", 1)
+    # Functions without a route must not end up on the interactive cluster
+    task_queues.enqueue("projects.tasks.not_routed")
+    task_queues.enqueue("projects.tasks.cache_report_data")
+
+    assert OrmQ.objects.filter(key="kaavapino-interactive").count() == 1
+    assert OrmQ.objects.filter(key="kaavapino-qcluster").count() == 2
+    metrics = task_queues.get_queue_metrics()
+    assert metrics["interactive"]["depth"] == 1
+    assert metrics["batch"]["depth"] == 2
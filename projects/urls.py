@@ -11,6 +11,7 @@ from projects.views import (
     ProjectSubtypeViewSet,
     FieldCommentViewSet,
     CommentViewSet,
+    CommentUnreadCountViewSet,
     DocumentViewSet,
     ReportViewSet,
     DeadlineSchemaViewSet,
@@ -35,6 +36,11 @@ projects.register(
 )
 
 router.registry.extend(projects_router.registry)
+router.register(
+    r"comments/unread_counts",
+    CommentUnreadCountViewSet,
+    basename="comment-unread-counts",
+)
 router.register(r"projecttypes", ProjectTypeViewSet)
 router.register(r"projectsubtypes", ProjectSubtypeViewSet)
 router.register(r"phases", ProjectPhaseViewSet)
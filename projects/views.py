@@ -1,6 +1,8 @@
 import pytz
 import csv
+import json
 import re
+import time
 from datetime import datetime, timedelta, date
 import logging
 
@@ -8,12 +10,15 @@ from django.contrib.postgres.search import SearchVector
 from django.conf import settings
 from django.core.exceptions import FieldError
 from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
-from django.db.models import Q
-from django.http import Http404, HttpResponse
+from django.db.models import Count, Exists, F, Max, Q
+from django.db.models.fields.json import KeyTransform
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.utils import timezone
-from django_q.tasks import async_task, result as async_result
+from django.utils.dateparse import parse_datetime
+from django_q.tasks import result as async_result
 from django_q.models import OrmQ
 from drf_spectacular.utils import (
     extend_schema_view,
@@ -32,7 +37,22 @@ from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
+from kaavapino.db_router import use_replica
+from projects.attribute_locks import (
+    acquire_lock,
+    get_project_locks,
+    release_lock,
+    release_user_locks,
+)
+from projects.cache_namespaces import (
+    DATETYPES,
+    PROJECT_DETAIL,
+    SCHEDULES,
+    get_cache_key,
+    get_namespace_version,
+)
 from projects.exporting.document import render_template
+from projects.fetch_cache import get_data_versions
 from projects.exporting.report import render_report_to_response
 from projects.helpers import (
     DOCUMENT_CONTENT_TYPES,
@@ -40,9 +60,18 @@ from projects.helpers import (
     TRUE,
     get_attribute_lock_data,
     get_attribute_data_filtered_response,
+    get_etag,
+    get_not_modified_response,
+    get_schema_version,
+    iter_attribute_data_filtered_responses,
+    set_conditional_headers,
 )
 from projects.importing import AttributeImporter, AttributeUpdater
+from projects.map_tiles import get_project_tile, is_valid_tile
+from projects.preview_cache import get_or_set_preview
+from projects.profiling import async_task_for_request
 from projects.models import (
+    CapturedProfile,
     FieldComment,
     ProjectComment,
     ProjectDeadline,
@@ -64,7 +93,7 @@ from projects.models import (
     ProjectPriority,
     DateType,
 )
-from projects.models.attribute import AttributeLock, FieldSetAttribute
+from projects.models.attribute import FieldSetAttribute
 from projects.models.utils import create_identifier
 from projects.permissions.attributes import AttributeLockPermissions
 from projects.permissions.comments import CommentPermissions
@@ -77,9 +106,11 @@ from projects.serializers.comment import (
     CommentSerializer,
     FieldCommentSerializer,
     LastReadTimestampSerializer,
+    UnreadCommentCountSerializer,
 )
 from projects.serializers.document import DocumentTemplateSerializer
 from projects.serializers.project import (
+    LIST_ATTRIBUTE_DATA,
     ProjectSerializer,
     ProjectSnapshotSerializer,
     ProjectListSerializer,
@@ -94,16 +125,11 @@ from projects.serializers.project import (
     SimpleProjectSerializer,
     ProjectPrioritySerializer,
 )
+from projects.schema_blobs import get_project_type_schema_blob, get_schema_blob_response
 from projects.serializers.projectschema import (
+    PROJECT_TYPE_SCHEMA_SERIALIZERS,
     SimpleAttributeSerializer,
-    AttributeLockSerializer,
-    AdminProjectTypeSchemaSerializer,
-    CreateProjectTypeSchemaSerializer,
-    EditProjectTypeSchemaSerializer,
-    BrowseProjectTypeSchemaSerializer,
-    AdminOwnerProjectTypeSchemaSerializer,
-    CreateOwnerProjectTypeSchemaSerializer,
-    EditOwnerProjectTypeSchemaSerializer,
+    AttributeLeaseSerializer,
     ProjectCardSchemaSerializer,
 )
 from projects.serializers.projecttype import (
@@ -112,7 +138,7 @@ from projects.serializers.projecttype import (
 )
 from projects.serializers.report import ReportSerializer
 from projects.serializers.deadline import DeadlineSerializer, DeadlineValidDateSerializer, DeadlineValidationSerializer
-from projects.serializers.utils import should_display_deadline
+from projects.serializers.utils import VIS_BOOL_MAP, should_display_deadline
 from sitecontent.models import ListViewAttributeColumn
 from projects.clamav import clamav_client, FileScanException, FileInfectedException
 
@@ -120,6 +146,35 @@ from projects.clamav import clamav_client, FileScanException, FileInfectedExcept
 log = logging.getLogger(__name__)
 
 
+class ConditionalGetMixin:
+    """Answer list and retrieve with 304 Not Modified when the client's ETag matches"""
+
+    # Byte-for-byte different encodings of one representation must not
+    # share a strong ETag
+    weak_etag = False
+
+    def get_etag_parts(self, request):
+        return [
+            get_schema_version(),
+            getattr(request.user, "privilege", None),
+            request.get_full_path(),
+        ]
+
+    def _conditional_get(self, handler, request, *args, **kwargs):
+        etag = get_etag(self.__class__.__name__, *self.get_etag_parts(request))
+        response = get_not_modified_response(request, etag, weak=self.weak_etag) \
+            or handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            set_conditional_headers(response, etag, weak=self.weak_etag)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_get(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_get(super().retrieve, request, *args, **kwargs)
+
+
 class PrivateDownloadViewSetMixin:
     def get(self, request, *args, **kwargs):
         if self.slug_url_kwarg and self.url_path_postfix:
@@ -214,6 +269,60 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
 
         return ProjectSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        project = self.get_object()
+        files = project.files.aggregate(
+            count=Count("id"),
+            created_at=Max("created_at"),
+            archived_at=Max("archived_at"),
+        )
+        # Document downloads set phase_documents_created(_creation_started)
+        downloads = project.document_download_log.aggregate(
+            count=Count("id"),
+            invalidated=Count("id", filter=Q(invalidated=True)),
+            created_at=Max("created_at"),
+        )
+        last_modified = max(
+            timestamp for timestamp in [
+                project.modified_at, files["created_at"], files["archived_at"],
+                downloads["created_at"],
+            ] if timestamp
+        )
+        etag = get_etag(
+            "project",
+            project.pk,
+            project.modified_at.isoformat(),
+            files["count"],
+            downloads["count"],
+            downloads["invalidated"],
+            last_modified.isoformat(),
+            get_schema_version(),
+            get_namespace_version(PROJECT_DETAIL),
+            # Geoserver, Kaavoitus API and AD data loaded from upstream
+            *get_data_versions("geoserver", "kaavoitus_api", "graph_users"),
+            request.user.pk,
+            request.user.privilege,
+            request.get_full_path(),
+        )
+
+        # Validated by the ETag only, Last-Modified does not cover the
+        # external data
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified:
+            return set_conditional_headers(not_modified, etag, last_modified)
+
+        serializer = self.get_serializer(project)
+        return set_conditional_headers(
+            Response(serializer.data), etag, last_modified
+        )
+
+    def get_object(self):
+        project = super().get_object()
+        if self.request.method in ['PUT', 'PATCH']:
+            # Save only the keys changed by this request, see Project.save()
+            project.track_attribute_data()
+        return project
+
     def get_queryset(self):
         user = self.request.user
         queryset = self.queryset
@@ -252,8 +361,25 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
                 queryset = queryset.filter(onhold=True)
             elif status == "archived":
                 queryset = queryset.filter(archived=True)
+
+        if self.action == "list":
+            # The list shows only the list view columns and deadline visibility
+            queryset = queryset.with_attribute_data_keys(
+                [
+                    column.attribute.identifier
+                    for column in self._get_listview_attribute_columns()
+                ] + [vis_bool for vis_bool in VIS_BOOL_MAP.values() if vis_bool],
+                name=LIST_ATTRIBUTE_DATA,
+            )
         return queryset.distinct()
 
+    def _get_listview_attribute_columns(self):
+        if not hasattr(self, "_listview_attribute_columns"):
+            self._listview_attribute_columns = list(
+                ListViewAttributeColumn.objects.all().select_related("attribute")
+            )
+        return self._listview_attribute_columns
+
     def _string_filter_to_list(self, filter_string):
         return [_filter.strip().lower() for _filter in filter_string.split(",")]
 
@@ -328,8 +454,8 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
 
         if self.action == "list":
             context["project_schedule_cache"] = \
-                cache.get("serialized_project_schedules", {})
-            context["listview_attribute_columns"] = ListViewAttributeColumn.objects.all().select_related("attribute")
+                cache.get(get_cache_key(SCHEDULES, "serialized_project_schedules"), {})
+            context["listview_attribute_columns"] = self._get_listview_attribute_columns()
 
         return context
 
@@ -369,6 +495,91 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
             return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(get_attribute_data_filtered_response(attributes, generated_attributes, ignored, project))
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "since",
+                OpenApiTypes.DATETIME,
+                description="Only include projects modified after this modified_at cursor. "
+                            "Projects modified shortly before it are sent again, "
+                            "keep the latest line of each id.",
+            ),
+            OpenApiParameter(
+                "schema_version",
+                OpenApiTypes.STR,
+                description="X-Schema-Version of the response the since cursor is from. "
+                            "If the schema has changed since, all projects are sent.",
+            ),
+        ],
+        responses={
+            200: OpenApiTypes.STR,
+            400: OpenApiTypes.STR,
+            401: OpenApiTypes.STR,
+            403: OpenApiTypes.STR,
+        }
+    )
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path="attribute_data_filtered/export",
+        url_name="attribute-data-filtered-export",
+    )
+    def attribute_data_filtered_export(self, request):
+        """Stream the filtered attribute data of all permitted projects as NDJSON
+
+        Projects are ordered by modified_at, so the modified_at of the last
+        line is the since cursor of the next incremental sync. modified_at is
+        set before the transaction commits, so a project committed after a
+        later one was read could be missed. Projects modified within
+        ATTRIBUTE_DATA_EXPORT_CURSOR_WINDOW seconds before the cursor are
+        sent again and consumers must dedupe them by id.
+
+        Schema changes, such as attribute renames, change the payload without
+        touching modified_at. The response carries the schema version in
+        X-Schema-Version and a since cursor from an older schema version is
+        ignored, so the consumer gets a full resync.
+        """
+        if not request.user.has_privilege("browse"):
+            return Response("Forbidden", status=status.HTTP_403_FORBIDDEN)
+
+        queryset = self._filter_private(Project.objects.all(), request.user) \
+            .exclude(attribute_data={}) \
+            .order_by("modified_at", "pk")
+
+        schema_version = str(get_schema_version())
+        since = request.query_params.get("since")
+        if request.query_params.get("schema_version", schema_version) != schema_version:
+            since = None
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response("Invalid since cursor", status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            queryset = queryset.filter(modified_at__gt=since - timedelta(
+                seconds=settings.ATTRIBUTE_DATA_EXPORT_CURSOR_WINDOW,
+            ))
+
+        attributes = {attr.identifier: attr for attr in Attribute.objects.order_by('pk').all()}
+        generated_attributes = Attribute.objects.filter(calculations__isnull=False)
+        ignored = set(FieldSetAttribute.objects.all().values_list('attribute_target', flat=True))
+
+        def lines():
+            for project, data in iter_attribute_data_filtered_responses(
+                attributes, generated_attributes, ignored,
+                queryset.iterator(chunk_size=100),
+            ):
+                yield json.dumps({
+                    "id": project.pk,
+                    "modified_at": project.modified_at.isoformat(),
+                    "attribute_data": data,
+                }, cls=DjangoJSONEncoder) + "\n"
+
+        response = StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+        response["X-Schema-Version"] = schema_version
+        return response
+
     @action(
         methods=['get'],
         detail=False,
@@ -594,6 +805,7 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         url_path="overview/floor_area",
         url_name="projects-overview-floor-area"
     )
+    @use_replica()
     def overview_floor_area(self, request):
         today = datetime.now().date()
         start_date = self.request.query_params.get("start_date")
@@ -820,6 +1032,7 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         url_path="overview/by_subtype",
         url_name="projects-overview-by-subtype"
     )
+    @use_replica()
     def overview_by_subtype(self, request):
         valid_filters = self._get_valid_filters("filters_by_subtype")
         start_date = self.request.query_params.get("start_date")
@@ -866,6 +1079,7 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         url_path="overview/on_map",
         url_name="projects-overview-on-map"
     )
+    @use_replica()
     def overview_on_map(self, request):
         valid_filters = self._get_valid_filters("filters_on_map")
         query = self._get_query(valid_filters)
@@ -880,6 +1094,43 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
             ).data
         })
 
+    @extend_schema(
+        responses={
+            200: OpenApiTypes.BINARY,
+            400: OpenApiTypes.STR,
+            401: OpenApiTypes.STR,
+        },
+    )
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[IsAuthenticated, ProjectPermissions],
+        url_path=r"tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.mvt",
+        url_name="projects-tiles",
+    )
+    # Tiles are rendered from the primary, they are cached under the tile
+    # generation which is bumped before a lagging replica has the change
+    def tiles(self, request, z, x, y):
+        z, x, y = int(z), int(x), int(y)
+        if not is_valid_tile(z, x, y):
+            return Response("Invalid tile coordinates", status=400)
+
+        valid_filters = self._get_valid_filters("filters_on_map")
+        query = self._get_query(valid_filters)
+        queryset = Project.objects.filter(query, public=True, onhold=False, archived=False)
+        filter_params = {
+            filter_obj.identifier: request.query_params[filter_obj.identifier]
+            for filter_obj in valid_filters
+            if filter_obj.identifier in request.query_params
+        }
+
+        response = HttpResponse(
+            get_project_tile(z, x, y, queryset, filter_params),
+            content_type="application/vnd.mapbox-vector-tile",
+        )
+        response["Cache-Control"] = "private, max-age=60"
+        return response
+
     @extend_schema(
         responses={
             200: ProjectPrioritySerializer(many=True),
@@ -956,11 +1207,36 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         project = self.get_object()
         log.warning("[DEBUG VIEWS] fake=true path: calling get_preview_deadlines for project %s", project.pk)
         
+        timing_metrics = {"start": time.monotonic(), "deadline_calc": 0.0}
+        result_attribute_data = get_or_set_preview(
+            project,
+            project.subtype,
+            original_attribute_data,
+            confirmed_fields,
+            lambda: self._get_preview_attribute_data(
+                project, original_attribute_data, confirmed_fields, timing_metrics,
+            ),
+            timing_metrics=timing_metrics,
+        )
+        log.info(
+            "Deadline preview finished project=%s total=%.3fs deadline_calc=%.3fs "
+            "preview_cache_hits=%s preview_cache_misses=%s",
+            project.pk,
+            time.monotonic() - timing_metrics["start"],
+            timing_metrics["deadline_calc"],
+            timing_metrics.get("preview_cache_hits", 0),
+            timing_metrics.get("preview_cache_misses", 0),
+        )
+        return Response({"attribute_data": result_attribute_data})
+
+    @staticmethod
+    def _get_preview_attribute_data(project, original_attribute_data, confirmed_fields, timing_metrics):
         # Get preview deadlines (corrected dates)
         preview = project.get_preview_deadlines(
             original_attribute_data,
             project.subtype,
             confirmed_fields,
+            timing_metrics=timing_metrics,
         )
         
         # Build result from preview values
@@ -985,7 +1261,7 @@ class ProjectViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
             if key not in result_attribute_data:
                 result_attribute_data[key] = original_attribute_data[key]
         
-        return Response({"attribute_data": result_attribute_data})
+        return result_attribute_data
 
 
 class ProjectPhaseViewSet(viewsets.ReadOnlyModelViewSet):
@@ -995,12 +1271,22 @@ class ProjectPhaseViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ProjectPhaseSerializer
 
 
-class ProjectCardSchemaViewSet(viewsets.ReadOnlyModelViewSet):
+class ProjectCardSchemaViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = ProjectCardSectionAttribute.objects.all()\
         .select_related("attribute", "section").prefetch_related("attribute__value_choices")\
         .order_by("section__index", "index")
     serializer_class = ProjectCardSchemaSerializer
 
+    def get_etag_parts(self, request):
+        try:
+            project_modified_at = Project.objects \
+                .filter(pk=int(request.query_params.get("project"))) \
+                .values_list("modified_at", flat=True) \
+                .first()
+        except (ValueError, TypeError):
+            project_modified_at = None
+        return super().get_etag_parts(request) + [project_modified_at]
+
     def get_queryset(self):
         project_id = self.request.query_params.get('project', None)
         if not project_id:
@@ -1029,11 +1315,31 @@ class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = SimpleAttributeSerializer
     pagination_class = AttributePagination
 
+    @staticmethod
+    def _get_lease_data(lease, user, field_data):
+        return {
+            **lease,
+            "field_data": field_data,
+            "owner": lease["user_id"] == str(user.uuid),
+        }
+
+    @staticmethod
+    def _get_field_data(attribute_data, lease):
+        try:
+            if lease.get("fieldset_attribute_identifier") is not None:
+                f_data = attribute_data[lease["fieldset_attribute_identifier"]]
+                if f_data and isinstance(f_data, list) and len(f_data) > 0:
+                    return f_data[int(lease["fieldset_attribute_index"])]
+            else:
+                return attribute_data[lease["attribute_identifier"]]
+        except (KeyError, IndexError, TypeError):  # Attribute doesn't exist in projects attribute_data
+            pass
+        return None
+
     @extend_schema(
         responses={
-            200: AttributeLockSerializer,
+            200: AttributeLeaseSerializer,
             400: OpenApiTypes.STR,
-            500: OpenApiTypes.STR
         },
     )
     @action(
@@ -1046,69 +1352,74 @@ class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
     def lock(self, request):
         project_name = request.data["project_name"]
         attribute_lock_data = get_attribute_lock_data(request.data["attribute_identifier"])
-
-        project = Project.objects.filter(name=project_name).first()
-        attribute = Attribute.objects.filter(
-            identifier=attribute_lock_data.get("attribute_identifier")
-        ).first() if attribute_lock_data.get("attribute_identifier") else None
-        fieldset_attribute = Attribute.objects.filter(
-            identifier=attribute_lock_data.get("fieldset_attribute_identifier")
-        ).first() if attribute_lock_data.get("fieldset_attribute_identifier") else None
-
-        if not project or (not attribute and not fieldset_attribute):
+        identifier = \
+            attribute_lock_data.get("attribute_identifier") or \
+            attribute_lock_data.get("fieldset_attribute_identifier")
+
+        # Validate the project and attribute and fetch the field's data in one query
+        project_data = Project.objects \
+            .filter(name=project_name) \
+            .annotate(
+                attribute_exists=Exists(Attribute.objects.filter(identifier=identifier)),
+                field_value=KeyTransform(identifier, "attribute_data"),
+            ) \
+            .values("attribute_exists", "field_value") \
+            .first()
+
+        if not project_data or not project_data["attribute_exists"]:
             return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
 
-        # Delete other existing AttributeLocks for request user
-        queryset = AttributeLock.objects.filter(
-            project=project,
-            user=request.user
-        )
-        if attribute:
-            queryset.exclude(attribute=attribute)
-        elif fieldset_attribute:
-            queryset.exclude(
-                fieldset_attribute=fieldset_attribute,
-                fieldset_attribute_index=attribute_lock_data.get("fieldset_attribute_index")
-            )
-        queryset.delete()
-
-        if attribute:
-            attribute_lock = AttributeLock.objects.filter(
-                project=project,
-                attribute=attribute
-            ).first()
-        elif fieldset_attribute:
-            attribute_lock = AttributeLock.objects.filter(
-                project=project,
-                fieldset_attribute=fieldset_attribute,
-                fieldset_attribute_index=attribute_lock_data.get("fieldset_attribute_index")
-            ).first()
-        else:  # Should not happen
-            log.error("Unknown error, no attribute or fieldset_attribute exists")
-            return HttpResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        lease, __ = acquire_lock(project_name, attribute_lock_data, request.user)
 
-        if attribute_lock and (datetime.now(timezone.utc) - attribute_lock.timestamp).total_seconds() >= 900:  # 15 min
-            attribute_lock.delete()
-            attribute_lock = None
-
-        if not attribute_lock:
-            attribute_lock, created = AttributeLock.objects.get_or_create(
-                project=project,
-                attribute=attribute,
-                fieldset_attribute=fieldset_attribute,
-                fieldset_attribute_index=attribute_lock_data.get("fieldset_attribute_index"),
-                user=request.user
-            )
+        return Response({
+            "attribute_lock": AttributeLeaseSerializer(
+                self._get_lease_data(
+                    lease,
+                    request.user,
+                    self._get_field_data({identifier: project_data["field_value"]}, lease),
+                )
+            ).data
+        }, status=status.HTTP_200_OK)
 
-        if attribute_lock:
-            return Response({
-                "attribute_lock": AttributeLockSerializer(
-                    attribute_lock,
-                    context={'request': request, 'attribute_lock_data': attribute_lock_data}
-                ).data
-            }, status=status.HTTP_200_OK)
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("project_name", OpenApiTypes.STR, OpenApiParameter.QUERY),
+        ],
+        responses={
+            200: AttributeLeaseSerializer(many=True),
+            400: OpenApiTypes.STR,
+        },
+    )
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path="locks",
+        url_name="locks"
+    )
+    def locks(self, request):
+        project_name = request.query_params.get("project_name")
+        if not project_name:
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
 
-        return HttpResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        leases = get_project_locks(project_name)
+        attribute_data = {}
+        if leases:
+            attribute_data = Project.objects \
+                .filter(name=project_name) \
+                .values_list("attribute_data", flat=True) \
+                .first() or {}
+
+        return Response({
+            "attribute_locks": AttributeLeaseSerializer([
+                self._get_lease_data(
+                    lease,
+                    request.user,
+                    self._get_field_data(attribute_data, lease),
+                )
+                for lease in leases
+            ], many=True).data
+        }, status=status.HTTP_200_OK)
 
     @extend_schema(
         responses={
@@ -1132,20 +1443,12 @@ class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
                 return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
 
             attribute_lock_data = get_attribute_lock_data(request.data["attribute_identifier"])
-
-            if attribute_lock_data.get("attribute_identifier"):
-                AttributeLock.objects.filter(
-                    project__name=project_name,
-                    attribute__identifier=attribute_lock_data.get("attribute_identifier"),
-                    user=request.user,
-                ).delete()
-            else:
-                AttributeLock.objects.filter(
-                    project__name=project_name,
-                    fieldset_attribute__identifier=attribute_lock_data.get("fieldset_attribute_identifier"),
-                    fieldset_attribute_index=attribute_lock_data.get("fieldset_attribute_index"),
-                    user=request.user,
-                ).delete()
+            release_lock(
+                project_name,
+                attribute_lock_data,
+                request.user,
+                force=request.user.has_privilege('admin'),
+            )
         except Exception as exc:
             log.error(exc)
             return HttpResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1173,10 +1476,7 @@ class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
             return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            AttributeLock.objects.filter(
-                project__name=project_name,
-                user=request.user,
-            ).delete()
+            release_user_locks(project_name, request.user)
         except Exception as exc:
             log.error(exc)
             return HttpResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1190,10 +1490,12 @@ class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
       OpenApiParameter("project", OpenApiTypes.INT, OpenApiParameter.QUERY),
     ],
 )
-class ProjectTypeSchemaViewSet(viewsets.ReadOnlyModelViewSet):
+class ProjectTypeSchemaViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = ProjectType.objects.all()
+    # Pre-rendered schemas are served gzip, brotli or identity encoded
+    weak_etag = True
 
-    def get_serializer_class(self):
+    def _get_project_and_owner(self):
         user = self.request.user
 
         owner = self.request.query_params.get("owner")
@@ -1208,19 +1510,42 @@ class ProjectTypeSchemaViewSet(viewsets.ReadOnlyModelViewSet):
             owner in ["1", "true", "True"] or \
             project and project.user == user
 
-        if is_owner:
-            return {
-                "admin": AdminOwnerProjectTypeSchemaSerializer,
-                "create": CreateOwnerProjectTypeSchemaSerializer,
-                "edit": EditOwnerProjectTypeSchemaSerializer,
-            }[user.privilege]
-        else:
-            return {
-                "admin": AdminProjectTypeSchemaSerializer,
-                "create": CreateProjectTypeSchemaSerializer,
-                "edit": EditProjectTypeSchemaSerializer,
-                "browse": BrowseProjectTypeSchemaSerializer,
-            }[user.privilege]
+        return project, bool(is_owner)
+
+    def get_etag_parts(self, request):
+        project, is_owner = self._get_project_and_owner()
+        return super().get_etag_parts(request) + [
+            is_owner,
+            project.modified_at.isoformat() if project else None,
+        ]
+
+    def get_serializer_class(self):
+        user = self.request.user
+        __, is_owner = self._get_project_and_owner()
+
+        return PROJECT_TYPE_SCHEMA_SERIALIZERS[(user.privilege, is_owner)]
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_get(self._list, request, *args, **kwargs)
+
+    def _list(self, request, *args, **kwargs):
+        # Project specific schemas are always serialized, the generic ones
+        # are served pre-rendered and pre-compressed. Both are read from the
+        # primary, the results are cached under the schema version which is
+        # bumped before a lagging replica has the change.
+        if set(request.query_params.keys()) <= {"owner", "subtypes"}:
+            __, is_owner = self._get_project_and_owner()
+            blob = get_project_type_schema_blob(
+                request.user.privilege,
+                is_owner,
+                request.query_params.get("subtypes", ""),
+            )
+            if blob:
+                return get_schema_blob_response(
+                    blob, request.META.get("HTTP_ACCEPT_ENCODING")
+                )
+
+        return super().list(request, *args, **kwargs)
 
 
 class ProjectSubtypeViewSet(viewsets.ReadOnlyModelViewSet):
@@ -1347,6 +1672,63 @@ class CommentViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CommentUnreadCountViewSet(viewsets.ViewSet):
+    """Unread comment counts of the requesting user for many projects at once"""
+    permission_classes = [IsAuthenticated]
+
+    def _get_project_ids(self, request):
+        projects = request.query_params.get("projects")
+        if not projects:
+            return None
+
+        return [int(project_id) for project_id in projects.split(",") if project_id]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "projects", OpenApiTypes.STR, OpenApiParameter.QUERY,
+                description="Comma separated project ids, defaults to all projects the user has read",
+            ),
+        ],
+        responses=UnreadCommentCountSerializer(many=True),
+    )
+    def list(self, request):
+        try:
+            project_ids = self._get_project_ids(request)
+        except ValueError:
+            return Response(
+                {"projects": "Expected a comma separated list of project ids"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Same semantics as CommentViewSet.unread: comments newer than the
+        # last read timestamp, projects never read have nothing unread
+        timestamps = LastReadTimestamp.objects.filter(user=request.user)
+        if project_ids is not None:
+            timestamps = timestamps.filter(project_id__in=project_ids)
+
+        counts = dict(
+            timestamps.annotate(
+                unread_count=Count(
+                    "project__comments",
+                    filter=Q(project__comments__created_at__gt=F("timestamp")),
+                )
+            ).values_list("project_id", "unread_count")
+        )
+
+        if project_ids is None:
+            project_ids = sorted(counts.keys())
+
+        serializer = UnreadCommentCountSerializer(
+            [
+                {"project": project_id, "unread_count": counts.get(project_id, 0)}
+                for project_id in project_ids
+            ],
+            many=True,
+        )
+        return Response(serializer.data)
+
+
 class DocumentViewSet(ReadOnlyModelViewSet):
     queryset = DocumentTemplate.objects.all()
     permission_classes = [IsAuthenticated, DocumentPermissions]
@@ -1457,8 +1839,8 @@ class DocumentViewSet(ReadOnlyModelViewSet):
                     status=status.HTTP_404_NOT_FOUND,
                 )
 
-        document_task = async_task(
-            render_template,
+        document_task = async_task_for_request(
+            request, render_template,
             self.project, document_template, preview,
         )
 
@@ -1497,6 +1879,22 @@ class DocumentTemplateDownloadView(
     def can_access_file(self, private_file):
         return self.request.user.has_privilege("admin")
 
+
+class ProfileDownloadView(
+    PrivateDownloadViewSetMixin, PrivateStorageDetailView
+):
+    model = CapturedProfile
+    slug_field = "file"
+    slug_url_kwarg = "path"
+    url_path_postfix = "profiles"
+
+    def get_queryset(self):
+        # Queryset that is allowed to be downloaded
+        return self.model.objects.all()
+
+    def can_access_file(self, private_file):
+        return self.request.user.has_privilege("admin")
+
 @action(
     methods=["post"],
     detail=True,
@@ -1647,8 +2045,8 @@ class ReportViewSet(ReadOnlyModelViewSet):
         # Since we are not using DRFs response here, we set a custom CORS control header
         response["Access-Control-Allow-Origin"] = "*"
 
-        report_task = async_task(
-            render_report_to_response,
+        report_task = async_task_for_request(
+            request, render_report_to_response,
             report, project_ids, response, preview, limit,
         )
 
@@ -1669,7 +2067,7 @@ class ReportViewSet(ReadOnlyModelViewSet):
         return super().list(request, *args, **kwargs)
 
 
-class DeadlineSchemaViewSet(viewsets.ReadOnlyModelViewSet):
+class DeadlineSchemaViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = DeadlineSerializer
     queryset = Deadline.objects.all()
 
@@ -1700,7 +2098,7 @@ class DeadlineSchemaViewSet(viewsets.ReadOnlyModelViewSet):
         url_name="date_types"
     )
     def date_types(self, request):
-        serialized_date_types = cache.get("serialized_date_types", {})
+        serialized_date_types = cache.get(get_cache_key(DATETYPES, "serialized_date_types"), {})
         if not serialized_date_types:
             current_year = datetime.now().year
             for date_type in DateType.objects.all():
@@ -1726,7 +2124,7 @@ class DeadlineSchemaViewSet(viewsets.ReadOnlyModelViewSet):
                 "dates": disabled_dates
             }
 
-            cache.set("serialized_date_types", serialized_date_types, 60 * 60 * 24)
+            cache.set(get_cache_key(DATETYPES, "serialized_date_types"), serialized_date_types, 60 * 60 * 24)
         return Response(
             DeadlineValidDateSerializer(
                 {"date_types": serialized_date_types}
@@ -13,9 +13,10 @@ from sitecontent.models import (
     TargetFloorArea,
 )
 
-from django_q.tasks import async_task
-from django.core.cache import cache
+from kaavapino.task_queues import enqueue
+from projects.cache_namespaces import SCHEMA_NAMESPACES, clear_namespaces
 from projects.importing import attribute, deadline
+from projects.tasks import refresh_project_type_schema_blobs
 from openpyxl import load_workbook
 from auditlog.context import disable_auditlog
 
@@ -90,20 +91,7 @@ def get_importer(obj):
         else None
 
 def clear_cache():
-    keys_to_clear = ["serialized_project_schedules",
-                     "project_phase_section_filters",
-                     "deadline_sections",
-                     "projects.helpers.get_fieldset_path",
-                     "projects.helpers.get_flat_attribute_data",
-                     "phase_schema",
-                     "deadline_update_dependencies",
-                     "deadline_initial_dependencies"
-                     ]
-    cache_keys = cache.keys("*")
-    keys_to_delete = []
-    for key in keys_to_clear:
-        keys_to_delete.extend(list(filter(lambda k: k.startswith(key), cache_keys)))
-    cache.delete_many(keys_to_delete)
+    clear_namespaces(SCHEMA_NAMESPACES)
 
 def activate_excel(obj):
     with disable_auditlog():
@@ -111,6 +99,10 @@ def activate_excel(obj):
             importer = get_importer(obj)
             importer.run()
             clear_cache()
+            enqueue(
+                refresh_project_type_schema_blobs,
+                task_name="refresh_project_type_schema_blobs",
+            )
             obj.update(status=ExcelFile.STATUS_ACTIVE, error=None, task_id=None)
             ExcelFile.objects.all().exclude(~Q(type=obj.type) | Q(file=obj.file)).update(status=ExcelFile.STATUS_INACTIVE, updated=None, task_id=None)
         except (AttributeImporterException,DeadlineImporterException, Exception) as exc:
@@ -128,7 +120,7 @@ def activate(modeladmin, request, queryset):
             messages.add_message(request, messages.WARNING, "Unable to activate file -- Other file already updating")
             return
 
-        task_id = async_task(
+        task_id = enqueue(
             activate_excel,
             object
         )
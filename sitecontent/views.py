@@ -7,6 +7,12 @@ from rest_framework.viewsets import GenericViewSet
 from drf_spectacular.utils import extend_schema, inline_serializer
 from sitecontent.models import FooterSection, TargetFloorArea
 from sitecontent.serializers import FooterSectionSerializer
+from projects.helpers import (
+    get_etag,
+    get_not_modified_response,
+    get_schema_version,
+    set_conditional_headers,
+)
 from projects.models import CommonProjectPhase
 from projects.serializers.project import CommonProjectPhaseSerializer
 
@@ -32,10 +38,19 @@ class Legend(APIView):
     @extend_schema(
         responses=inline_serializer('Legend', fields={'phases': CommonProjectPhaseSerializer(many=True)})
     )
-    def get(self, __):
-        return Response({
+    def get(self, request):
+        etag = get_etag(
+            "legend",
+            get_schema_version(),
+            getattr(request.user, "privilege", None),
+        )
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified:
+            return set_conditional_headers(not_modified, etag)
+
+        return set_conditional_headers(Response({
             "phases": CommonProjectPhaseSerializer(
                 CommonProjectPhase.objects.all(),
                 many=True,
             ).data
-        })
\ No newline at end of file
+        }), etag)
\ No newline at end of file
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 00:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0011_update_user_department_names"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name="Personnel",
+            fields=[
+                ("id", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("display_name", models.CharField(blank=True, default="", max_length=255)),
+                ("mail", models.CharField(blank=True, default="", max_length=255)),
+                ("company_name", models.CharField(blank=True, default="", max_length=64)),
+                ("data", models.JSONField(default=dict)),
+                ("synced_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "personnel",
+                "verbose_name_plural": "personnel",
+                "ordering": ("display_name", "id"),
+            },
+        ),
+        migrations.CreateModel(
+            name="PersonnelSyncState",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("delta_link", models.TextField(blank=True, null=True)),
+                ("synced_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="personnel",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["display_name"],
+                name="users_personnel_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="personnel",
+            index=models.Index(
+                fields=["company_name", "display_name", "id"],
+                name="users_personnel_company_name",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 00:00
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0012_personnel"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="personnel",
+            name="users_personnel_name_trgm",
+        ),
+        migrations.AddIndex(
+            model_name="personnel",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("display_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="users_personnel_upper_name_trgm",
+            ),
+        ),
+    ]
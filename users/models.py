@@ -1,7 +1,9 @@
 from django.contrib.auth.models import Group
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from helusers.models import AbstractUser
 from django.contrib.auth.models import UserManager
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils.translation import gettext_lazy as _
 from django.utils.functional import cached_property
 
@@ -122,6 +124,45 @@ class GroupPrivilege(models.Model):
         )
 
 
+class Personnel(models.Model):
+    """Local mirror of the Graph API user directory, kept up to date by users.tasks.sync_personnel"""
+
+    id = models.CharField(max_length=64, primary_key=True)
+    display_name = models.CharField(max_length=255, blank=True, default="")
+    mail = models.CharField(max_length=255, blank=True, default="")
+    company_name = models.CharField(max_length=64, blank=True, default="")
+    # Graph API user object as returned by the API, see PersonnelSerializer
+    data = models.JSONField(default=dict)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("personnel")
+        verbose_name_plural = _("personnel")
+        ordering = ("display_name", "id")
+        indexes = [
+            # Serves the display_name__icontains search, which PostgreSQL
+            # runs as UPPER("display_name") LIKE UPPER(%s)
+            GinIndex(
+                OpClass(Upper("display_name"), name="gin_trgm_ops"),
+                name="users_personnel_upper_name_trgm",
+            ),
+            models.Index(
+                name="users_personnel_company_name",
+                fields=["company_name", "display_name", "id"],
+            ),
+        ]
+
+    def __str__(self):
+        return self.display_name
+
+
+class PersonnelSyncState(models.Model):
+    """Delta link of the latest completed personnel sync"""
+
+    delta_link = models.TextField(null=True, blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+
 # Register auditlog for models
 from auditlog.registry import auditlog
 auditlog.register(User, mask_fields=["password"])
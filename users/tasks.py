@@ -0,0 +1,165 @@
+import logging
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from users.helpers import get_graph_api_access_token
+from users.models import Personnel, PersonnelSyncState
+
+logger = logging.getLogger(__name__)
+
+PERSONNEL_SELECT_FIELDS = [
+    "id",
+    "displayName",
+    "givenName",
+    "surname",
+    "mobilePhone",
+    "businessPhones",
+    "companyName",
+    "mail",
+    "jobTitle",
+    "officeLocation",
+]
+PERSONNEL_MAIL_DOMAIN = "@hel.fi"
+GRAPH_API_TIMEOUT = 30
+
+
+class PersonnelSyncError(Exception):
+    pass
+
+
+def _is_personnel(data):
+    return (data.get("mail") or "").lower().endswith(PERSONNEL_MAIL_DOMAIN)
+
+
+def _get_display_name(data):
+    return data.get("displayName") or " ".join([
+        name for name in [data.get("givenName"), data.get("surname")] if name
+    ])
+
+
+def _apply_page(users):
+    """Upsert and delete the users of a single delta page"""
+    ids = [user["id"] for user in users]
+    existing = {
+        personnel.id: personnel
+        for personnel in Personnel.objects.filter(id__in=ids)
+    }
+
+    upserts = {}
+    deletes = set()
+    for user in users:
+        if "@removed" in user:
+            deletes.add(user["id"])
+            continue
+
+        # Delta rounds after the first only include changed properties
+        data = {field: None for field in PERSONNEL_SELECT_FIELDS}
+        if user["id"] in existing:
+            data.update(existing[user["id"]].data)
+        data.update({
+            key: value for key, value in user.items()
+            if key in PERSONNEL_SELECT_FIELDS
+        })
+
+        if not _is_personnel(data):
+            deletes.add(user["id"])
+            continue
+
+        upserts[user["id"]] = Personnel(
+            id=user["id"],
+            display_name=_get_display_name(data)[:255],
+            mail=data.get("mail") or "",
+            company_name=data.get("companyName") or "",
+            data=data,
+            synced_at=timezone.now(),
+        )
+
+    if upserts:
+        Personnel.objects.bulk_create(
+            upserts.values(),
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=["display_name", "mail", "company_name", "data", "synced_at"],
+        )
+    if deletes:
+        Personnel.objects.filter(id__in=deletes).delete()
+
+    return len(upserts), len(deletes)
+
+
+def _fetch(session, url, token):
+    response = session.get(
+        url,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=GRAPH_API_TIMEOUT,
+    )
+    if response.status_code == 410:
+        return None
+    if response.status_code != 200:
+        raise PersonnelSyncError(
+            f"Graph API responded {response.status_code}: {response.text}"
+        )
+    return response.json()
+
+
+def sync_personnel(full=False, session=None):
+    """Synchronize the local personnel mirror with Graph API delta queries
+
+    The first run and runs with full=True page through the whole directory and
+    remove personnel not seen, later runs only apply changes since the delta
+    link stored by the previous run. Pass a requests compatible session to
+    run against a stubbed Graph API.
+    """
+    token = get_graph_api_access_token()
+    if not token:
+        raise PersonnelSyncError("Cannot get access token")
+
+    session = session or requests.Session()
+    state, __ = PersonnelSyncState.objects.get_or_create(pk=1)
+
+    initial_url = f"{settings.GRAPH_API_BASE_URL}/v1.0/users/delta" \
+        f"?$select={','.join(PERSONNEL_SELECT_FIELDS)}"
+
+    url = state.delta_link if state.delta_link and not full else None
+    data = _fetch(session, url, token) if url else None
+    if data is None:
+        # No sync state or it has expired on the Graph API side
+        if url:
+            logger.info("Personnel delta link expired, running full sync")
+        full = True
+        data = _fetch(session, initial_url, token)
+        if data is None:
+            raise PersonnelSyncError("Graph API refused the initial delta query")
+
+    started_at = timezone.now()
+    upserted = deleted = 0
+    with transaction.atomic():
+        while True:
+            page_upserted, page_deleted = _apply_page(data.get("value", []))
+            upserted += page_upserted
+            deleted += page_deleted
+
+            next_link = data.get("@odata.nextLink")
+            if not next_link:
+                break
+
+            data = _fetch(session, next_link, token)
+            if data is None:
+                raise PersonnelSyncError("Personnel delta link expired mid-sync")
+
+        if full:
+            # Every user still in the directory was touched above
+            deleted += Personnel.objects.filter(synced_at__lt=started_at).delete()[0]
+
+        state.delta_link = data.get("@odata.deltaLink")
+        state.synced_at = timezone.now()
+        state.save()
+
+    logger.info(
+        f"Personnel sync done ({'full' if full else 'delta'}), "
+        f"{upserted} updated, {deleted} removed"
+    )
+    return upserted, deleted
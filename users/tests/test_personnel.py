@@ -0,0 +1,122 @@
+import pytest
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from users import tasks
+from users.models import Personnel, PersonnelSyncState
+from users.tests.factories import UserFactory
+
+
+class StubResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+
+class StubGraphSession:
+    """Serves canned Graph API delta pages keyed by url"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requested.append(url)
+        return self.pages.get(url, StubResponse({}, status_code=404))
+
+
+def _graph_user(id, given_name, surname, company="KYMP", mail=None):
+    return {
+        "id": id,
+        "displayName": f"{given_name} {surname}",
+        "givenName": given_name,
+        "surname": surname,
+        "mobilePhone": None,
+        "businessPhones": ["+358 9 123"],
+        "companyName": company,
+        "mail": mail or f"{given_name.lower()}.{surname.lower()}@hel.fi",
+        "jobTitle": "Arkkitehti",
+        "officeLocation": None,
+    }
+
+
+@pytest.fixture
+def graph(settings, monkeypatch):
+    settings.GRAPH_API_BASE_URL = "https://graph.test"
+    monkeypatch.setattr(tasks, "get_graph_api_access_token", lambda: "token")
+    initial = f"https://graph.test/v1.0/users/delta?$select={','.join(tasks.PERSONNEL_SELECT_FIELDS)}"
+    return StubGraphSession({
+        initial: StubResponse({
+            "value": [
+                _graph_user("1", "Aino", "Aalto"),
+                _graph_user("2", "Bertta", "Berg", mail="bertta@example.com"),
+            ],
+            "@odata.nextLink": "https://graph.test/page2",
+        }),
+        "https://graph.test/page2": StubResponse({
+            "value": [_graph_user("3", "Cecilia", "Celsius", company="KUVA")],
+            "@odata.deltaLink": "https://graph.test/delta1",
+        }),
+        "https://graph.test/delta1": StubResponse({
+            "value": [
+                {"id": "1", "jobTitle": "Tiimipäällikkö"},
+                {"id": "3", "@removed": {"reason": "deleted"}},
+            ],
+            "@odata.deltaLink": "https://graph.test/delta2",
+        }),
+    })
+
+
+@pytest.mark.django_db()
+def test_sync_personnel_full_and_delta(graph):
+    assert tasks.sync_personnel(session=graph) == (2, 1)
+    assert set(Personnel.objects.values_list("id", flat=True)) == {"1", "3"}
+    assert PersonnelSyncState.objects.get().delta_link == "https://graph.test/delta1"
+
+    assert tasks.sync_personnel(session=graph) == (1, 1)
+    assert graph.requested[-1] == "https://graph.test/delta1"
+
+    personnel = Personnel.objects.get()
+    assert personnel.data["jobTitle"] == "Tiimipäällikkö"
+    assert personnel.data["surname"] == "Aalto"
+    assert PersonnelSyncState.objects.get().delta_link == "https://graph.test/delta2"
+
+
+@pytest.mark.django_db()
+def test_personnel_list_from_mirror(graph):
+    tasks.sync_personnel(session=graph)
+    client = APIClient()
+    client.force_authenticate(user=UserFactory())
+    url = reverse("personnellist")
+
+    response = client.get(url, {"search": "aal"})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.data] == ["Aino Aalto"]
+
+    response = client.get(url, {"cursor": "", "limit": 1})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.data["results"]] == ["Aino Aalto"]
+
+    response = client.get(url, {"cursor": response.data["next"], "limit": 1})
+    assert [p["name"] for p in response.data["results"]] == ["Cecilia Celsius"]
+    assert response.data["next"] is None
+
+    response = client.get(reverse("personneldetail", kwargs={"pk": "3"}))
+    assert response.status_code == 200
+    assert response.data["company"] == "Kulttuurin ja vapaa-ajan toimiala"
+
+
+@pytest.mark.django_db()
+def test_personnel_name_search_is_served_by_the_trigram_index():
+    Personnel.objects.create(id="1", display_name="Aino Aalto")
+
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = Personnel.objects.filter(display_name__icontains="aal").explain()
+
+    assert "users_personnel_upper_name_trgm" in plan
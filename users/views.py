@@ -1,7 +1,11 @@
+import base64
+import json
+
 import requests
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Q
 from django.http import Http404
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
@@ -15,6 +19,24 @@ from users.serializers import (
     UserSerializer,
 )
 from users.helpers import get_graph_api_access_token
+from users.models import Personnel, PersonnelSyncState
+from users.tasks import GRAPH_API_TIMEOUT
+
+PERSONNEL_COMPANIES = ['KYMP', 'KUVA', 'KASKO', 'KEHA', 'KANSLIA']
+
+
+def encode_personnel_cursor(personnel):
+    return base64.urlsafe_b64encode(
+        json.dumps([personnel.display_name, personnel.id]).encode("utf-8")
+    ).decode("ascii")
+
+
+def decode_personnel_cursor(cursor):
+    try:
+        display_name, personnel_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError, base64.binascii.Error):
+        raise ValueError("Invalid cursor")
+    return str(display_name), str(personnel_id)
 
 
 class UserViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, GenericViewSet):
@@ -29,9 +51,69 @@ class PersonnelList(APIView):
         parameters=[
             OpenApiParameter("search", OpenApiTypes.STR, OpenApiParameter.QUERY),
             OpenApiParameter("company_name", OpenApiTypes.STR, OpenApiParameter.QUERY),
+            OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter("offset", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter(
+                "cursor", OpenApiTypes.STR, OpenApiParameter.QUERY,
+                description="Keyset pagination cursor, an empty value starts from the beginning",
+            ),
         ],
     )
     def get(self, request):
+        # Handle pagination inputs
+        try:
+            limit = int(request.query_params.get("limit", "100"))
+            offset = int(request.query_params.get("offset", "0"))
+        except ValueError:
+            return Response("Invalid limit or offset", status=status.HTTP_400_BAD_REQUEST)
+
+        if not PersonnelSyncState.objects.filter(synced_at__isnull=False).exists():
+            return self.get_from_graph(request, limit, offset)
+
+        queryset = Personnel.objects.all()
+
+        search = request.query_params.get("search", "").strip()
+        if search and search != "*":
+            queryset = queryset.filter(display_name__icontains=search)
+
+        company_name = request.query_params.get("company_name", None)
+        if company_name:
+            queryset = queryset.filter(company_name=company_name)
+        else:
+            queryset = queryset.filter(company_name__in=PERSONNEL_COMPANIES)
+
+        if "cursor" not in request.query_params:
+            return Response(PersonnelSerializer(
+                [personnel.data for personnel in queryset[offset:offset + limit]],
+                many=True,
+            ).data)
+
+        # Keyset pagination on (display_name, id)
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            try:
+                display_name, personnel_id = decode_personnel_cursor(cursor)
+            except ValueError:
+                return Response("Invalid cursor", status=status.HTTP_400_BAD_REQUEST)
+
+            queryset = queryset.filter(
+                Q(display_name__gt=display_name) |
+                Q(display_name=display_name, id__gt=personnel_id)
+            )
+
+        page = list(queryset[:limit + 1])
+        has_next = len(page) > limit
+        page = page[:limit]
+
+        return Response({
+            "next": encode_personnel_cursor(page[-1]) if has_next else None,
+            "results": PersonnelSerializer(
+                [personnel.data for personnel in page],
+                many=True,
+            ).data,
+        })
+
+    def get_from_graph(self, request, limit, offset):
         token = get_graph_api_access_token()
         if not token:
             return Response(
@@ -56,7 +138,7 @@ class PersonnelList(APIView):
             filter_conditions.append(f"companyName eq '{company_name}'")
         else:
             company_filter = " or ".join(
-                [f"companyName eq '{c}'" for c in ['KYMP', 'KUVA', 'KASKO', 'KEHA', 'KANSLIA']]
+                [f"companyName eq '{c}'" for c in PERSONNEL_COMPANIES]
             )
             filter_conditions.append(f"({company_filter})")
 
@@ -76,13 +158,6 @@ class PersonnelList(APIView):
             "Authorization": f"Bearer {token}",
             "ConsistencyLevel": "eventual",
         }
-        
-        # Handle pagination inputs
-        try:
-            limit = int(request.query_params.get("limit", "100"))
-            offset = int(request.query_params.get("offset", "0"))
-        except ValueError:
-            return Response("Invalid limit or offset", status=status.HTTP_400_BAD_REQUEST)
 
         max_required = offset + limit
         results = []
@@ -90,7 +165,7 @@ class PersonnelList(APIView):
 
         # Fetch pages until we have enough or run out
         while next_url and len(results) < max_required:
-            response = requests.get(next_url, headers=headers)
+            response = requests.get(next_url, headers=headers, timeout=GRAPH_API_TIMEOUT)
 
             if response.status_code == 401:
                 return Response(
@@ -118,6 +193,10 @@ class PersonnelDetail(APIView):
         responses=PersonnelSerializer(many=False),
     )
     def get(self, __, pk):
+        personnel = Personnel.objects.filter(pk=pk).first()
+        if personnel:
+            return Response(PersonnelSerializer(personnel.data, many=False).data)
+
         token = get_graph_api_access_token()
         if not token:
             return Response(
@@ -131,6 +210,7 @@ class PersonnelDetail(APIView):
             headers={
                 "Authorization": f"Bearer {token}",
             },
+            timeout=GRAPH_API_TIMEOUT,
         )
 
         if response: